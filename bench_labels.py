@@ -0,0 +1,227 @@
+"""
+Микробенчмарки пути печати этикетки: кодирование Data Matrix, тихая зона, отрисовка,
+PNG, история, журнал отчёта, сборка .xlsx и весь конвейер с принтером-заглушкой
+(RawPrinter в os.devnull). Работает без Windows и без принтера.
+
+    python bench_labels.py                          # таблица медиан
+    python bench_labels.py --save                   # записать базу в bench_baseline.json
+    python bench_labels.py --compare                # сравнить с базой: код выхода 1, если медленнее порога
+    python bench_labels.py --compare --threshold 0.3 -k encode
+
+База зависит от машины: сохраняйте её на том же компьютере, где потом сравниваете.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import dm_encoder
+import label_render
+from label_history import HistoryStore
+from label_render import LABEL_MM, label_cache, matrix_from_pixels, mm_to_px, quiet_zone_modules, render_matrix
+from print_pipeline import PrintPipeline
+from printer_backend import RawPrinter
+from scan_journal import ScanJournal, export_xlsx
+
+BASELINE_FILE = "bench_baseline.json"
+# Во сколько раз (доля) медиана может превысить базу, прежде чем считать это регрессией
+THRESHOLD = 0.2
+# Длины кодов маркировки: короткий КИЗ, код «Честного знака» с криптохвостом, длинный (с доп. AI)
+CODE_LENGTHS = (31, 83, 150)
+# Строк в отчёте за смену: обычная и большая
+REPORT_ROWS = (1_000, 10_000)
+# Этикеток за один замер конвейера
+PIPELINE_LABELS = 20
+
+PAGE_W, PAGE_H = mm_to_px(LABEL_MM[0]), mm_to_px(LABEL_MM[1])
+_ALPHABET = string.ascii_letters + string.digits + "!\"%&'()*+,-./_:;=<>?"
+
+
+def marking_codes(length: int, count: int, seed: int = 1) -> list:
+    """Коды вида 01<GTIN>21<серийный>\\x1d91<ключ>\\x1d92<крипто...> длиной length"""
+    rnd = random.Random(seed * 1000 + length)
+    codes = []
+    for _ in range(count):
+        gtin = "".join(rnd.choice(string.digits) for _ in range(14))
+        code = f"01{gtin}21" + "".join(rnd.choice(_ALPHABET) for _ in range(13))
+        if length > len(code):
+            code += "\x1d91" + "".join(rnd.choice(_ALPHABET) for _ in range(4))
+        if length > len(code):
+            code += "\x1d92" + "".join(rnd.choice(_ALPHABET) for _ in range(length - len(code) - 3))
+        codes.append(code[:length])
+    return codes
+
+
+def measure(fn, number: int, repeat: int) -> float:
+    """Медиана времени одного вызова fn() (сек) по repeat замерам из number вызовов"""
+    fn()  # прогрев
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - started) / number)
+    return statistics.median(times)
+
+
+def _cycle(items):
+    state = {"i": 0}
+
+    def next_item():
+        state["i"] = (state["i"] + 1) % len(items)
+        return items[state["i"]]
+    return next_item
+
+
+def _pylibdmtx_encode():
+    try:
+        from pylibdmtx.pylibdmtx import encode
+        encode(b"probe")
+    except Exception:
+        return None
+
+    def encode_matrix(text):
+        encoded = encode(text.encode("utf-8"))
+        return matrix_from_pixels(encoded.width, encoded.height, encoded.pixels)
+    return encode_matrix
+
+
+def cases(tmp: str):
+    """(имя, функция одного вызова, number) — по одной на операцию и размер"""
+    pylibdmtx_encode = _pylibdmtx_encode()
+    if pylibdmtx_encode is None:
+        # Нет libdmtx (обычно на Linux) — конвейер кодирует встроенным кодировщиком
+        label_render.DM_ENCODER = "builtin"
+    for length in CODE_LENGTHS:
+        codes = marking_codes(length, 64)
+        matrices = [dm_encoder.encode_matrix(c) for c in codes]
+        labels = [render_matrix(m, PAGE_W, PAGE_H) for m in matrices]
+        code, matrix, label = _cycle(codes), _cycle(matrices), _cycle(labels)
+
+        yield f"encode/builtin/{length}", lambda: dm_encoder.encode_matrix(code()), 20
+        if pylibdmtx_encode is not None:
+            yield f"encode/pylibdmtx/{length}", lambda: pylibdmtx_encode(code()), 20
+
+        def pad():
+            m = matrix()
+            return np.pad(m, quiet_zone_modules(min(m.shape)), constant_values=False)
+        yield f"quiet_zone/{length}", pad, 200
+        yield f"render/{length}", lambda: render_matrix(matrix(), PAGE_W, PAGE_H), 200
+
+        def png():
+            buf = io.BytesIO()
+            # Так же, как картинка сохраняется в историю (label_history.py)
+            label().save(buf, format="PNG", optimize=True)
+            return buf
+        yield f"png/{length}", png, 50
+
+    codes = _cycle(marking_codes(83, 5000))
+    labels = _cycle([render_matrix(m, PAGE_W, PAGE_H) for m in map(dm_encoder.encode_matrix, marking_codes(83, 64))])
+    history = HistoryStore(os.path.join(tmp, "history"))
+    # Новые коды (с картинкой в пачке) и повторы (только счётчик в индексе)
+    yield "history/add_new", lambda: history.add(codes(), labels()), 50
+    repeated = marking_codes(83, 1)[0]
+    yield "history/add_repeat", lambda: history.add(repeated, labels()), 200
+
+    journal = ScanJournal(os.path.join(tmp, "journal.csv"))
+    # Это и есть save_to_report из main.py
+    yield "journal/append", lambda: journal.append(codes(), "0" * 20), 1000
+
+    for rows in REPORT_ROWS:
+        path = os.path.join(tmp, f"report_{rows}.csv")
+        report = ScanJournal(path)
+        for text in marking_codes(83, rows):
+            report.append(text, "0" * 20)
+        report.close()
+        xlsx = os.path.join(tmp, f"report_{rows}.xlsx")
+        yield f"export_xlsx/{rows}", lambda path=path, xlsx=xlsx: export_xlsx(path, xlsx), 1
+
+    # Весь конвейер: PIPELINE_LABELS новых кодов через submit -> отрисовка -> печать в os.devnull (растр PBM)
+    for length in CODE_LENGTHS:
+        unique = iter(marking_codes(length, 20_000, seed=2))
+
+        def pipeline_batch():
+            label_cache.clear()
+            # Сообщения конвейера о каждой этикетке в замер не выводим
+            with contextlib.redirect_stdout(io.StringIO()):
+                pipeline = PrintPipeline(RawPrinter(os.devnull))
+                futures = [pipeline.submit(next(unique)) for _ in range(PIPELINE_LABELS)]
+                pipeline.close()
+            if not all(fut.result() for fut in futures):
+                raise RuntimeError("конвейер не напечатал этикетку")
+        yield f"pipeline{PIPELINE_LABELS}/{length}", pipeline_batch, 1
+
+
+def run(selected: str = "", repeat: int = 7) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, fn, number in cases(tmp):
+            if selected and selected not in name:
+                continue
+            results[name] = measure(fn, number, repeat)
+            print(f"{name:28} {results[name] * 1e6:12.1f} мкс", flush=True)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Операции, у которых медиана выросла больше чем на threshold относительно базы"""
+    regressions = []
+    print(f"\n{'операция':28} {'база, мкс':>12} {'сейчас, мкс':>12} {'изм.':>8}")
+    for name, value in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:28} {'—':>12} {value * 1e6:12.1f}")
+            continue
+        change = value / base - 1
+        mark = "  РЕГРЕССИЯ" if change > threshold else ""
+        print(f"{name:28} {base * 1e6:12.1f} {value * 1e6:12.1f} {change:+8.0%}{mark}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Микробенчмарки печати этикеток")
+    parser.add_argument("-k", dest="selected", default="", help="только операции, в имени которых есть эта строка")
+    parser.add_argument("--repeat", type=int, default=7, help="замеров на операцию (берётся медиана)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help=f"файл базы (по умолчанию {BASELINE_FILE})")
+    parser.add_argument("--save", action="store_true", help="сохранить результаты как базу")
+    parser.add_argument("--compare", action="store_true", help="сравнить с базой")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help=f"допустимое замедление, доля (по умолчанию {THRESHOLD})")
+    args = parser.parse_args(argv)
+
+    results = run(args.selected, args.repeat)
+
+    if args.compare:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nМедленнее базы больше чем на {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+        print("\nРегрессий нет")
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"База сохранена: {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 @echo off
 REM Сборка main.py в exe
 echo Installing dependencies...
-pip install pyinstaller aiohttp pillow pylibdmtx pynput openpyxl python-dotenv pywin32
+pip install pyinstaller aiohttp numpy pillow pylibdmtx pynput openpyxl python-dotenv pywin32
 
 echo.
 echo Building main.exe...
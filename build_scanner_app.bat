@@ -1,7 +1,7 @@
 @echo off
 REM Сборка qr_scanner_app.py в exe
 echo Installing dependencies...
-pip install pyinstaller PyQt5 pillow pylibdmtx pywin32
+pip install pyinstaller PyQt5 numpy pillow pylibdmtx pywin32
 
 echo.
 echo Building qr_scanner_app.exe...
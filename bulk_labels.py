@@ -0,0 +1,356 @@
+"""
+Массовая генерация этикеток для предпечати: все коды поставки из файла
+(XLSX / CSV / TXT) кодируются и рисуются параллельно на всех ядрах.
+
+    python bulk_labels.py codes.xlsx -o labels.pdf
+    python bulk_labels.py codes.csv -o labels.tif --column 2 --skip-header
+    python bulk_labels.py codes.txt -o out_dir/            (PNG: 000001.png, 000002.png, ...)
+    python bulk_labels.py codes.txt --print tcp://192.168.1.50:9100   (сразу на принтер, см. printer_backend.py)
+    python bulk_labels.py codes.txt --print tcp://192.168.1.50:9100 --lang zpl   (код рисует принтер, без растра)
+
+Коды читаются потоком, в работе одновременно не больше нескольких пачек,
+страницы пишутся в файл сразу — память не растёт с размером поставки.
+"""
+import argparse
+import csv
+import io
+import os
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from itertools import islice
+
+from label_render import LABEL_MM, PRINTER_DPI, QR_FILL_RATIO, mm_to_px
+
+
+# --- Чтение кодов ---
+
+def read_codes(path: str, column: int = 1, skip_header: bool = False):
+    """Коды из файла по одному: XLSX/CSV — из столбца column (с 1), TXT — построчно"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        from openpyxl import load_workbook
+
+        wb = load_workbook(path, read_only=True)
+        try:
+            rows = wb.active.iter_rows(min_row=2 if skip_header else 1, values_only=True)
+            for row in rows:
+                if len(row) >= column and row[column - 1] not in (None, ""):
+                    yield str(row[column - 1]).strip("\r\n")
+        finally:
+            wb.close()
+    elif ext == ".csv":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            sample = f.read(4096)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=";,\t")
+            except csv.Error:
+                dialect = csv.excel
+            reader = csv.reader(f, dialect)
+            if skip_header:
+                next(reader, None)
+            for row in reader:
+                if len(row) >= column and row[column - 1]:
+                    yield row[column - 1]
+    else:
+        with open(path, encoding="utf-8-sig") as f:
+            if skip_header:
+                next(f, None)
+            for line in f:
+                line = line.rstrip("\r\n")
+                if line:
+                    yield line
+
+
+# --- Параллельная отрисовка ---
+
+def _render_chunk(texts, page_w, page_h, fill_ratio):
+    """В процессе-воркере: [(упакованные биты этикетки или None, ошибка или None), ...]"""
+    from label_render import render_label
+
+    out = []
+    for text in texts:
+        try:
+            out.append((render_label(text, page_w, page_h, fill_ratio).tobytes(), None))
+        except Exception as e:
+            out.append((None, str(e)))
+    return out
+
+
+def render_stream(codes, page_w, page_h, fill_ratio=QR_FILL_RATIO, workers=None, chunk_size=64):
+    """
+    Отдаёт (код, биты, ошибка) в порядке входного файла. В очереди к пулу держим
+    не больше 4 пачек на воркер, чтобы не вычитывать весь файл в память.
+    """
+    workers = workers or os.cpu_count() or 1
+    codes = iter(codes)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        window = deque()
+
+        def submit():
+            chunk = list(islice(codes, chunk_size))
+            if chunk:
+                window.append((chunk, pool.submit(_render_chunk, chunk, page_w, page_h, fill_ratio)))
+            return bool(chunk)
+
+        while len(window) < workers * 4 and submit():
+            pass
+        while window:
+            chunk, fut = window.popleft()
+            submit()
+            for text, (bits, error) in zip(chunk, fut.result()):
+                yield text, bits, error
+
+
+# --- Вывод ---
+
+class PdfLabelWriter:
+    """
+    Многостраничный PDF, по странице на этикетку: 1-битная картинка со сжатием Flate.
+    Пишется потоком (Pillow собирает все страницы в памяти), в памяти — только смещения объектов.
+    """
+
+    def __init__(self, path, page_w, page_h, label_mm):
+        self.f = open(path, "wb")
+        self.page_w, self.page_h = page_w, page_h
+        self.media = (label_mm[0] / 25.4 * 72, label_mm[1] / 25.4 * 72)
+        self.offsets = {}
+        self.pages = []
+        self.next_id = 3  # 1 — каталог, 2 — дерево страниц (пишутся в конце)
+        self.f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _obj(self, obj_id, body: bytes, stream: bytes = None):
+        self.offsets[obj_id] = self.f.tell()
+        self.f.write(b"%d 0 obj\n" % obj_id + body)
+        if stream is not None:
+            self.f.write(b"\nstream\n" + stream + b"\nendstream")
+        self.f.write(b"\nendobj\n")
+
+    def add(self, bits: bytes):
+        img_id, content_id, page_id = self.next_id, self.next_id + 1, self.next_id + 2
+        self.next_id += 3
+        data = zlib.compress(bits, 6)
+        self._obj(img_id, b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+                          b"/BitsPerComponent 1 /Filter /FlateDecode /Length %d >>"
+                  % (self.page_w, self.page_h, len(data)), data)
+        content = b"q %.2f 0 0 %.2f 0 0 cm /Im Do Q" % self.media
+        self._obj(content_id, b"<< /Length %d >>" % len(content), content)
+        self._obj(page_id, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] "
+                           b"/Resources << /XObject << /Im %d 0 R >> >> /Contents %d 0 R >>"
+                  % (self.media[0], self.media[1], img_id, content_id))
+        self.pages.append(page_id)
+
+    def close(self):
+        kids = b" ".join(b"%d 0 R" % p for p in self.pages)
+        self._obj(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.pages)))
+        self._obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref = self.f.tell()
+        self.f.write(b"xref\n0 %d\n0000000000 65535 f \n" % self.next_id)
+        for obj_id in range(1, self.next_id):
+            self.f.write(b"%010d 00000 n \n" % self.offsets[obj_id])
+        self.f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (self.next_id, xref))
+        self.f.close()
+
+
+class TiffLabelWriter:
+    """
+    Многостраничный TIFF (CCITT G4 — стандарт для 1-битных картинок), страница за страницей.
+    Страницу сжимает Pillow, а цепочку IFD ведём сами: AppendingTiffWriter из Pillow
+    перечитывает все предыдущие страницы при добавлении каждой (квадратичное время).
+    """
+
+    def __init__(self, path, page_w, page_h, dpi):
+        self.f = open(path, "wb")
+        self.size, self.dpi = (page_w, page_h), dpi
+        self.f.write(b"II*\x00")
+        # Куда записать смещение следующего IFD
+        self.next_ptr = self.f.tell()
+        self.f.write(b"\x00\x00\x00\x00")
+
+    def _align(self):
+        if self.f.tell() % 2:
+            self.f.write(b"\x00")
+
+    def add(self, bits: bytes):
+        from PIL import Image
+
+        buf = io.BytesIO()
+        Image.frombytes('1', self.size, bits).save(buf, format="TIFF", compression="group4", strip_size=1 << 30)
+        page = Image.open(buf)
+        tags = page.tag_v2
+        raw = buf.getbuffer()[tags[273][0]:tags[273][0] + tags[279][0]]
+
+        self._align()
+        data_at = self.f.tell()
+        self.f.write(raw)
+        self._align()
+        ifd_at = self.f.tell()
+        entries = [
+            (256, 4, 1, self.size[0]),            # ImageWidth
+            (257, 4, 1, self.size[1]),            # ImageLength
+            (258, 3, 1, 1),                       # BitsPerSample
+            (259, 3, 1, 4),                       # Compression = CCITT G4
+            (262, 3, 1, tags.get(262, 0)),        # Photometric — как у Pillow
+            (266, 3, 1, tags.get(266, 1)),        # FillOrder
+            (273, 4, 1, data_at),                 # StripOffsets
+            (277, 3, 1, 1),                       # SamplesPerPixel
+            (278, 4, 1, self.size[1]),            # RowsPerStrip
+            (279, 4, 1, len(raw)),                # StripByteCounts
+            (282, 5, 1, 0),                       # XResolution (ниже)
+            (283, 5, 1, 0),                       # YResolution
+            (296, 3, 1, 2),                       # ResolutionUnit = дюймы
+        ]
+        rational_at = ifd_at + 2 + 12 * len(entries) + 4
+        out = struct.pack("<H", len(entries))
+        for tag, typ, count, value in entries:
+            if typ == 5:
+                value = rational_at + (8 if tag == 283 else 0)
+            if typ == 3:
+                out += struct.pack("<HHIHH", tag, typ, count, value, 0)
+            else:
+                out += struct.pack("<HHII", tag, typ, count, value)
+        next_ptr = ifd_at + len(out)
+        out += b"\x00\x00\x00\x00"
+        out += struct.pack("<IIII", self.dpi, 1, self.dpi, 1)
+        self.f.write(out)
+
+        end = self.f.tell()
+        self.f.seek(self.next_ptr)
+        self.f.write(struct.pack("<I", ifd_at))
+        self.f.seek(end)
+        self.next_ptr = next_ptr
+
+    def close(self):
+        self.f.close()
+
+
+class PngDirWriter:
+    """Отдельные PNG в папке: 000001.png, 000002.png, ..."""
+
+    def __init__(self, path, page_w, page_h, dpi):
+        os.makedirs(path, exist_ok=True)
+        self.path, self.size, self.dpi = path, (page_w, page_h), dpi
+        self.count = 0
+
+    def add(self, bits: bytes):
+        from PIL import Image
+
+        self.count += 1
+        Image.frombytes('1', self.size, bits).save(os.path.join(self.path, f"{self.count:06d}.png"),
+                                                   dpi=(self.dpi, self.dpi))
+
+    def close(self):
+        pass
+
+
+class PrinterLabelWriter:
+    """Этикетки сразу на принтер (printer_backend): одно задание на весь прогон (printer.batch())"""
+
+    def __init__(self, printer, page_w, page_h):
+        self.printer, self.size = printer, (page_w, page_h)
+        self._batch = printer.batch()
+        self._batch.__enter__()
+
+    def add(self, bits: bytes):
+        from PIL import Image
+
+        with self.printer.job():
+            self.printer.print_label(Image.frombytes('1', self.size, bits))
+
+    def add_text(self, text: str):
+        """Принтер рисует код сам (ZPL/TSPL); ValueError — код не описать командами принтера"""
+        with self.printer.job():
+            self.printer.print_label(None, text)
+
+    def close(self):
+        try:
+            self._batch.__exit__(None, None, None)
+        finally:
+            self.printer.close()
+
+
+def open_writer(path, page_w, page_h, label_mm, dpi):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        return PdfLabelWriter(path, page_w, page_h, label_mm)
+    if ext in (".tif", ".tiff"):
+        return TiffLabelWriter(path, page_w, page_h, dpi)
+    return PngDirWriter(path, page_w, page_h, dpi)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Массовая генерация этикеток Data Matrix")
+    parser.add_argument("input", help="файл с кодами: .xlsx, .csv или .txt")
+    out = parser.add_mutually_exclusive_group(required=True)
+    out.add_argument("-o", "--output", help="labels.pdf, labels.tif или папка для PNG")
+    out.add_argument("--print", dest="printer", metavar="SPEC",
+                     help="печатать сразу: gdi, gdi:Имя, file:путь, tcp://host:port")
+    parser.add_argument("--lang", default=None, help="язык принтера для --print file/tcp: pbm, zpl, tspl")
+    parser.add_argument("--column", type=int, default=1, help="номер столбца с кодами (XLSX/CSV), с 1")
+    parser.add_argument("--skip-header", action="store_true", help="пропустить первую строку")
+    parser.add_argument("--width-mm", type=float, default=LABEL_MM[0])
+    parser.add_argument("--height-mm", type=float, default=LABEL_MM[1])
+    parser.add_argument("--dpi", type=int, default=PRINTER_DPI)
+    parser.add_argument("--fill", type=float, default=QR_FILL_RATIO, help="доля меньшей стороны под код")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию — все ядра)")
+    args = parser.parse_args(argv)
+
+    label_mm = (args.width_mm, args.height_mm)
+    if args.printer:
+        from printer_backend import create_printer
+
+        printer = create_printer(args.printer, args.lang)
+        # Размер страницы — у принтера (для GDI — реальный размер из драйвера)
+        page_w, page_h = printer.page_size()
+        writer = PrinterLabelWriter(printer, page_w, page_h)
+    else:
+        page_w, page_h = mm_to_px(label_mm[0], args.dpi), mm_to_px(label_mm[1], args.dpi)
+        writer = open_writer(args.output, page_w, page_h, label_mm, args.dpi)
+
+    started = last_report = time.perf_counter()
+    done = errors = 0
+    try:
+        codes = read_codes(args.input, args.column, args.skip_header)
+        if args.printer and printer.native:
+            # Принтер рисует код сам — растр не нужен, шлём команды прямо из файла
+            labels = ((text, None, None) for text in codes)
+        else:
+            labels = render_stream(codes, page_w, page_h, args.fill, args.workers)
+        for text, bits, error in labels:
+            if error is not None:
+                errors += 1
+                print(f"Ошибка: {text[:40]}: {error}", file=sys.stderr)
+                continue
+            if bits is None:
+                try:
+                    writer.add_text(text)
+                except ValueError as e:
+                    errors += 1
+                    print(f"Ошибка: {text[:40]}: {e}", file=sys.stderr)
+                    continue
+            else:
+                writer.add(bits)
+            done += 1
+            now = time.perf_counter()
+            if now - last_report >= 2:
+                last_report = now
+                print(f"Готово {done} этикеток, {done / (now - started):.0f}/с")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Итого: {done} этикеток, ошибок {errors}, {elapsed:.1f} с, "
+          f"{done / elapsed if elapsed else 0:.0f} этикеток/с -> {args.output or args.printer}")
+    return 0 if not errors else 1
+
+
+if __name__ == "__main__":
+    # Нужно для ProcessPoolExecutor в exe, собранном PyInstaller
+    import multiprocessing
+
+    multiprocessing.freeze_support()
+    sys.exit(main())
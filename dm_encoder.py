@@ -0,0 +1,473 @@
+"""
+Кодировщик Data Matrix ECC200 на чистом Python/NumPy — замена pylibdmtx без нативной DLL.
+
+Режимы: ASCII (с парами цифр), C40 (участки из A-Z, 0-9 и пробела), Base256
+(участки байтов > 127), FNC1 в начале для GS1 («Честный знак»). Только квадратные
+символы 10x10 … 144x144, как у pylibdmtx по умолчанию. Возвращает матрицу модулей
+(True — чёрный) без тихой зоны.
+
+Проверка против pylibdmtx (нужна libdmtx):  python dm_encoder.py --check [файл_с_кодами]
+Самопроверка — символ каждого размера и GS1 декодируются обратно в исходные данные
+(декодер — pylibdmtx или zxing-cpp; если нет ни одного, проверка пропускается):
+    python dm_encoder.py --selftest
+"""
+import functools
+
+import numpy as np
+
+# Кодовые слова ECC200
+PAD = 129
+LATCH_C40 = 230
+LATCH_B256 = 231
+FNC1 = 232
+UPPER_SHIFT = 235
+UNLATCH = 254
+
+# Квадратные символы: (размер, строк/столбцов в регионе данных, регионов по стороне,
+#                      кодовых слов данных, кодовых слов коррекции, блоков Рида-Соломона)
+SYMBOLS = (
+    (10, 8, 1, 3, 5, 1),
+    (12, 10, 1, 5, 7, 1),
+    (14, 12, 1, 8, 10, 1),
+    (16, 14, 1, 12, 12, 1),
+    (18, 16, 1, 18, 14, 1),
+    (20, 18, 1, 22, 18, 1),
+    (22, 20, 1, 30, 20, 1),
+    (24, 22, 1, 36, 24, 1),
+    (26, 24, 1, 44, 28, 1),
+    (32, 14, 2, 62, 36, 1),
+    (36, 16, 2, 86, 42, 1),
+    (40, 18, 2, 114, 48, 1),
+    (44, 20, 2, 144, 56, 1),
+    (48, 22, 2, 174, 68, 1),
+    (52, 24, 2, 204, 84, 2),
+    (64, 14, 4, 280, 112, 2),
+    (72, 16, 4, 368, 144, 4),
+    (80, 18, 4, 456, 192, 4),
+    (88, 20, 4, 576, 224, 4),
+    (96, 22, 4, 696, 272, 4),
+    (104, 24, 4, 816, 336, 6),
+    (120, 18, 6, 1050, 408, 6),
+    (132, 20, 6, 1304, 496, 8),
+    (144, 22, 6, 1558, 620, 10),
+)
+
+
+# --- Поле Галуа GF(256), полином x^8 + x^5 + x^3 + x^2 + 1 (0x12D) ---
+
+def _gf_tables():
+    exp = [0] * 512
+    log = [0] * 256
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= 0x12D
+    for i in range(255, 512):
+        exp[i] = exp[i - 255]
+    return exp, log
+
+
+GF_EXP, GF_LOG = _gf_tables()
+
+
+@functools.lru_cache(maxsize=None)
+def _rs_generator(n_ecc: int) -> tuple:
+    """Коэффициенты порождающего многочлена (x - a^1)...(x - a^n), старший первым"""
+    g = [1]
+    for i in range(1, n_ecc + 1):
+        nxt = [0] * (len(g) + 1)
+        for j, coef in enumerate(g):
+            nxt[j] ^= coef
+            if coef:
+                nxt[j + 1] ^= GF_EXP[GF_LOG[coef] + i]
+        g = nxt
+    return tuple(g[1:])
+
+
+def rs_encode(data, n_ecc: int) -> list:
+    """Кодовые слова коррекции ошибок Рида-Соломона для блока data"""
+    gen = [GF_LOG[c] if c else None for c in _rs_generator(n_ecc)]
+    ecc = [0] * n_ecc
+    for d in data:
+        factor = d ^ ecc[0]
+        ecc = ecc[1:] + [0]
+        if factor:
+            lf = GF_LOG[factor]
+            for j, lg in enumerate(gen):
+                if lg is not None:
+                    ecc[j] ^= GF_EXP[lf + lg]
+    return ecc
+
+
+# --- Кодирование данных в кодовые слова ---
+
+def _is_c40_basic(b: int) -> bool:
+    return b == 32 or 48 <= b <= 57 or 65 <= b <= 90
+
+
+def _c40_value(b: int) -> int:
+    if b == 32:
+        return 3
+    if b <= 57:
+        return b - 44
+    return b - 51
+
+
+def _ascii_cost(data: bytes, start: int, end: int) -> int:
+    cost = 0
+    i = start
+    while i < end:
+        if i + 1 < end and 48 <= data[i] <= 57 and 48 <= data[i + 1] <= 57:
+            cost += 1
+            i += 2
+        else:
+            cost += 1 if data[i] < 128 else 2
+            i += 1
+    return cost
+
+
+def _encode_ascii(data: bytes, i: int, out: list) -> int:
+    b = data[i]
+    if 48 <= b <= 57 and i + 1 < len(data) and 48 <= data[i + 1] <= 57:
+        out.append(130 + (b - 48) * 10 + (data[i + 1] - 48))
+        return i + 2
+    if b < 128:
+        out.append(b + 1)
+    else:
+        out.extend((UPPER_SHIFT, b - 127))
+    return i + 1
+
+
+def _b256_randomize(value: int, position: int) -> int:
+    return (value + (149 * position) % 255 + 1) % 256
+
+
+def encode_codewords(data: bytes, gs1: bool = False) -> list:
+    """
+    Кодовые слова данных (без заполнения). Жадный выбор режима: участок, где C40
+    или Base256 короче ASCII, кодируется этим режимом, остальное — ASCII.
+    """
+    out = [FNC1] if gs1 else []
+    n = len(data)
+    i = 0
+    while i < n:
+        # Base256 выгоднее ASCII (2 слова на байт > 127) начиная с 3 таких байтов подряд
+        j = i
+        while j < n and data[j] >= 128:
+            j += 1
+        if j - i >= 3:
+            chunk = data[i:j]
+            length = [len(chunk)] if len(chunk) < 250 else [len(chunk) // 250 + 249, len(chunk) % 250]
+            out.append(LATCH_B256)
+            for value in length + list(chunk):
+                out.append(_b256_randomize(value, len(out) + 1))
+            i = j
+            continue
+
+        # C40: 3 символа в 2 словах + переключение туда и обратно; берём кратное 3
+        j = i
+        while j < n and _is_c40_basic(data[j]):
+            j += 1
+        k = (j - i) // 3 * 3
+        if k and 2 + k // 3 * 2 < _ascii_cost(data, i, i + k):
+            out.append(LATCH_C40)
+            for t in range(i, i + k, 3):
+                v = 1600 * _c40_value(data[t]) + 40 * _c40_value(data[t + 1]) + _c40_value(data[t + 2]) + 1
+                out.extend((v >> 8, v & 0xFF))
+            out.append(UNLATCH)
+            i += k
+            continue
+
+        i = _encode_ascii(data, i, out)
+    return out
+
+
+def pick_symbol(n_codewords: int):
+    for symbol in SYMBOLS:
+        if symbol[3] >= n_codewords:
+            return symbol
+    raise ValueError(f"Слишком длинные данные для Data Matrix: {n_codewords} кодовых слов")
+
+
+def pad_codewords(codewords: list, capacity: int) -> list:
+    out = list(codewords)
+    if len(out) < capacity:
+        out.append(PAD)
+    while len(out) < capacity:
+        pad = PAD + (149 * (len(out) + 1)) % 253 + 1
+        out.append(pad - 254 if pad > 254 else pad)
+    return out
+
+
+def add_ecc(data_cw: list, n_ecc: int, blocks: int) -> list:
+    """Данные + коррекция с чередованием блоков (слово i идёт в блок i % blocks)"""
+    per_block = n_ecc // blocks
+    result = list(data_cw) + [0] * n_ecc
+    for b in range(blocks):
+        ecc = rs_encode(data_cw[b::blocks], per_block)
+        for j, value in enumerate(ecc):
+            result[len(data_cw) + j * blocks + b] = value
+    return result
+
+
+# --- Размещение модулей (ISO/IEC 16022, приложение F) ---
+
+def _placement(nrow: int, ncol: int) -> np.ndarray:
+    """
+    Для каждого модуля области данных — номер бита в потоке кодовых слов
+    (codeword * 8 + bit, bit 0 — старший) или -1/-2 для фиксированных светлого/тёмного.
+    """
+    grid = np.full((nrow, ncol), -1, dtype=np.int32)
+    filled = np.zeros((nrow, ncol), dtype=bool)
+
+    def module(r, c, cw, bit):
+        if r < 0:
+            r += nrow
+            c += 4 - ((nrow + 4) % 8)
+        if c < 0:
+            c += ncol
+            r += 4 - ((ncol + 4) % 8)
+        grid[r, c] = cw * 8 + bit
+        filled[r, c] = True
+
+    def utah(r, c, cw):
+        for bit, (dr, dc) in enumerate(((-2, -2), (-2, -1), (-1, -2), (-1, -1), (-1, 0), (0, -2), (0, -1), (0, 0))):
+            module(r + dr, c + dc, cw, bit)
+
+    def corner(cw, cells):
+        for bit, (r, c) in enumerate(cells):
+            module(r, c, cw, bit)
+
+    corner1 = ((nrow - 1, 0), (nrow - 1, 1), (nrow - 1, 2), (0, ncol - 2),
+               (0, ncol - 1), (1, ncol - 1), (2, ncol - 1), (3, ncol - 1))
+    corner2 = ((nrow - 3, 0), (nrow - 2, 0), (nrow - 1, 0), (0, ncol - 4),
+               (0, ncol - 3), (0, ncol - 2), (0, ncol - 1), (1, ncol - 1))
+    corner3 = ((nrow - 3, 0), (nrow - 2, 0), (nrow - 1, 0), (0, ncol - 2),
+               (0, ncol - 1), (1, ncol - 1), (2, ncol - 1), (3, ncol - 1))
+    corner4 = ((nrow - 1, 0), (nrow - 1, ncol - 1), (0, ncol - 3), (0, ncol - 2),
+               (0, ncol - 1), (1, ncol - 3), (1, ncol - 2), (1, ncol - 1))
+
+    cw = 0
+    row, col = 4, 0
+    while True:
+        if row == nrow and col == 0:
+            corner(cw, corner1)
+            cw += 1
+        if row == nrow - 2 and col == 0 and ncol % 4:
+            corner(cw, corner2)
+            cw += 1
+        if row == nrow - 2 and col == 0 and ncol % 8 == 4:
+            corner(cw, corner3)
+            cw += 1
+        if row == nrow + 4 and col == 2 and not ncol % 8:
+            corner(cw, corner4)
+            cw += 1
+        # Диагональ вверх-вправо
+        while True:
+            if row < nrow and col >= 0 and not filled[row, col]:
+                utah(row, col, cw)
+                cw += 1
+            row -= 2
+            col += 2
+            if not (row >= 0 and col < ncol):
+                break
+        row += 1
+        col += 3
+        # Диагональ вниз-влево
+        while True:
+            if row >= 0 and col < ncol and not filled[row, col]:
+                utah(row, col, cw)
+                cw += 1
+            row += 2
+            col -= 2
+            if not (row < nrow and col >= 0):
+                break
+        row += 3
+        col += 1
+        if not (row < nrow or col < ncol):
+            break
+
+    # Незаполненный правый нижний угол — фиксированный узор
+    if not filled[nrow - 1, ncol - 1]:
+        grid[nrow - 1, ncol - 1] = grid[nrow - 2, ncol - 2] = -2
+    return grid
+
+
+@functools.lru_cache(maxsize=None)
+def _layout(size: int):
+    """
+    Раскладка символа size x size: индексы битов для модулей данных и маска
+    поисковых шаблонов (L-граница и «часы» каждого региона). Кэшируется по размеру.
+    """
+    symbol = next(s for s in SYMBOLS if s[0] == size)
+    _, region, regions = symbol[:3]
+    mapping = _placement(region * regions, region * regions)
+
+    bit_index = np.full((size, size), -1, dtype=np.int32)
+    finder = np.zeros((size, size), dtype=bool)
+    step = region + 2
+    for rr in range(regions):
+        for rc in range(regions):
+            r0, c0 = rr * step, rc * step
+            finder[r0:r0 + step, c0] = True                    # левая граница
+            finder[r0 + step - 1, c0:c0 + step] = True         # нижняя граница
+            finder[r0, c0:c0 + step:2] = True                  # верхние «часы»
+            finder[r0 + 1:r0 + step:2, c0 + step - 1] = True   # правые «часы»
+            bit_index[r0 + 1:r0 + 1 + region, c0 + 1:c0 + 1 + region] = \
+                mapping[rr * region:(rr + 1) * region, rc * region:(rc + 1) * region]
+    return bit_index, finder
+
+
+def codewords_to_matrix(codewords: list, size: int) -> np.ndarray:
+    bit_index, finder = _layout(size)
+    bits = np.unpackbits(np.asarray(codewords, dtype=np.uint8))
+    matrix = finder.copy()
+    data = bit_index >= 0
+    matrix[data] = bits[bit_index[data]].astype(bool)
+    matrix[bit_index == -2] = True
+    return matrix
+
+
+def _data_codewords(text, gs1: bool) -> list:
+    data = text.encode('utf-8') if isinstance(text, str) else bytes(text)
+    if gs1 and data[:1] == b"\x1d":
+        data = data[1:]
+    return encode_codewords(data, gs1)
+
+
+def encode_matrix(text, gs1: bool = False) -> np.ndarray:
+    """
+    Data Matrix для text (str кодируется в UTF-8, bytes — как есть): матрица модулей,
+    True — чёрный. gs1=True добавляет FNC1 в начале (GS1 / «Честный знак»); ведущий
+    символ GS (0x1D), которым некоторые сканеры передают FNC1, при этом отбрасывается.
+    """
+    codewords = _data_codewords(text, gs1)
+    size, _, _, n_data, n_ecc, blocks = pick_symbol(len(codewords))
+    full = add_ecc(pad_codewords(codewords, n_data), n_ecc, blocks)
+    return codewords_to_matrix(full, size)
+
+
+def symbol_size(text, gs1: bool = False) -> int:
+    """Сторона символа в модулях (без тихой зоны) — без построения матрицы"""
+    return pick_symbol(len(_data_codewords(text, gs1)))[0]
+
+
+def _check(codes):
+    """Сверка декодированного содержимого с pylibdmtx: кодирование может отличаться выбором режимов."""
+    from pylibdmtx.pylibdmtx import decode, encode
+    from PIL import Image
+
+    ok = 0
+    for text in codes:
+        encoded = encode(text.encode('utf-8'))
+        ref = Image.frombytes('RGB', (encoded.width, encoded.height), encoded.pixels)
+        matrix = np.pad(encode_matrix(text), 2)
+        img = Image.fromarray(np.where(np.repeat(np.repeat(matrix, 5, 0), 5, 1), 0, 255).astype(np.uint8))
+        ours = decode(img)
+        theirs = decode(ref)
+        if ours and theirs and ours[0].data == theirs[0].data == text.encode('utf-8'):
+            ok += 1
+        else:
+            print(f"Расхождение: {text!r}: наш={ours[:1]} pylibdmtx={theirs[:1]}")
+    print(f"Совпало {ok} из {len(codes)}")
+    return ok == len(codes)
+
+
+def _module_image(matrix, scale: int = 4):
+    from PIL import Image
+
+    matrix = np.pad(matrix, 2)
+    return Image.fromarray(np.where(np.repeat(np.repeat(matrix, scale, 0), scale, 1), 0, 255).astype(np.uint8))
+
+
+def _decoder():
+    """Функция img -> (данные bytes или None, GS1 ли это или None, если декодер не сообщает); None — декодера нет"""
+    try:
+        from pylibdmtx.pylibdmtx import decode
+        decode(_module_image(encode_matrix("probe")))
+    except Exception:
+        decode = None
+    if decode is not None:
+        def decode_libdmtx(img):
+            found = decode(img)
+            if not found:
+                return None, None
+            # FNC1 libdmtx отдаёт байтом 232 (или GS); в начале — признак GS1, он отбрасывается
+            data = found[0].data.replace(b"\xe8", b"\x1d")
+            return data[1:] if data.startswith(b"\x1d") else data, None
+        return decode_libdmtx
+    try:
+        import zxingcpp
+    except ImportError:
+        return None
+
+    def decode_zxing(img):
+        found = zxingcpp.read_barcodes(img, formats=zxingcpp.BarcodeFormat.DataMatrix)
+        if not found:
+            return None, None
+        return found[0].bytes, found[0].content_type == zxingcpp.ContentType.GS1
+    return decode_zxing
+
+
+def _selftest() -> bool:
+    """Символ каждого размера из SYMBOLS, разные режимы и GS1 декодируются обратно в исходные данные"""
+    decode = _decoder()
+    if decode is None:
+        print("Пропуск: нет декодера Data Matrix (libdmtx для pylibdmtx или pip install zxing-cpp)")
+        return True
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    # (текст, gs1, ожидаемая сторона символа или None)
+    cases = []
+    for size, _, _, n_data, _, _ in SYMBOLS:
+        # Строчные латинские — ASCII, одно кодовое слово на символ: символ заполнен целиком
+        cases.append(((letters * (n_data // 26 + 1))[:n_data], False, size))
+    cases += [
+        ("HELLO WORLD 1234567890", False, None),   # C40 и пары цифр
+        ("Привет, мир", False, None),              # Base256
+        ("0104600439931256215Ak)\"gTJ6O-5f\x1d91EE06\x1d92YWCXbmK6SN8vvwoxZFk7WAY8WoJNMGGr6Cgtiuja04c=", True, None),
+        ("\x1d010460043993125621JgXJ5.T\x1d93Ka2J", True, None),   # ведущий GS от сканера
+    ]
+    ok = 0
+    for text, gs1, size in cases:
+        problems = []
+        matrix = encode_matrix(text, gs1)
+        if size is not None and matrix.shape[0] != size:
+            problems.append(f"размер {matrix.shape[0]} вместо {size}")
+        data, is_gs1 = decode(_module_image(matrix))
+        expected = (text[1:] if gs1 and text.startswith("\x1d") else text).encode("utf-8")
+        if data != expected:
+            problems.append(f"декодировано {data!r}")
+        if is_gs1 is not None and is_gs1 != gs1:
+            problems.append("GS1 (FNC1 в начале) " + ("потерян" if gs1 else "лишний"))
+        if problems:
+            print(f"Ошибка: {text[:40]!r} (gs1={gs1}): {'; '.join(problems)}")
+        else:
+            ok += 1
+    print(f"Самопроверка: совпало {ok} из {len(cases)}")
+    return ok == len(cases)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:2] == ["--selftest"]:
+        sys.exit(0 if _selftest() else 1)
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "--check":
+        if len(sys.argv) > 2:
+            with open(sys.argv[2], encoding='utf-8') as f:
+                sample = [line.rstrip("\r\n") for line in f if line.strip()]
+        else:
+            sample = [
+                "0104600439931256215Ak)\"gTJ6O-5f\x1d91EE06\x1d92YWCXbmK6SN8vvwoxZFk7WAY8WoJNMGGr6Cgtiuja04c=",
+                "010460043993125621JgXJ5.T\x1d93Ka2J",
+                "HELLO WORLD 1234567890",
+                "Привет, мир",
+                "1234",
+                "a",
+            ]
+        sys.exit(0 if _check(sample) else 1)
+    print(__doc__)
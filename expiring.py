@@ -0,0 +1,71 @@
+"""
+Словарь и множество с истечением записей через ttl секунд (защита от дублей сканов).
+
+Записи хранятся в порядке добавления, а срок у всех одинаковый, поэтому истёкшие всегда
+в начале: при каждом обращении снимаем их с головы — амортизированно O(1) на операцию,
+без перебора всего словаря. max_items ограничивает память: при переполнении раньше срока
+вытесняются самые старые записи.
+"""
+import time
+from collections import OrderedDict
+
+
+class ExpiringDict:
+    def __init__(self, ttl: float, clock=time.monotonic, max_items: int = 0):
+        self.ttl = ttl
+        self.clock = clock
+        self.max_items = max_items
+        # key -> (момент истечения, значение)
+        self._items = OrderedDict()
+
+    def _purge(self, now: float):
+        items = self._items
+        while items:
+            key, (expires, _) = next(iter(items.items()))
+            if expires > now:
+                break
+            items.popitem(last=False)
+
+    def get(self, key, default=None):
+        self._purge(self.clock())
+        item = self._items.get(key)
+        return default if item is None else item[1]
+
+    def set(self, key, value):
+        now = self.clock()
+        self._purge(now)
+        # Переставляем в конец: порядок должен совпадать с порядком истечения
+        self._items.pop(key, None)
+        self._items[key] = (now + self.ttl, value)
+        if self.max_items and len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._items.pop(key, None)
+        return default if item is None else item[1]
+
+    def __contains__(self, key):
+        self._purge(self.clock())
+        return key in self._items
+
+    def __len__(self):
+        self._purge(self.clock())
+        return len(self._items)
+
+
+class ExpiringSet:
+    def __init__(self, ttl: float, clock=time.monotonic, max_items: int = 0):
+        self._items = ExpiringDict(ttl, clock, max_items)
+
+    def add(self, key) -> bool:
+        """Добавить key; False — он уже есть и ещё не истёк (дубль)"""
+        if key in self._items:
+            return False
+        self._items.set(key, True)
+        return True
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,149 @@
+"""
+Проверка сессии GdiPrinter без Windows и без принтера: win32print/win32ui/win32con и
+PIL.ImageWin подменяются заглушками, которые считают вызовы.
+
+    python gdi_check.py
+
+Проверяется, что DEVMODE и CreateDC выполняются один раз на сессию, StartDoc/EndDoc —
+один раз на задание (на всю пачку внутри batch()), а после смены принтера по умолчанию
+или ошибки печати сессия пересоздаётся ровно один раз. Код выхода 1 — что-то не так.
+"""
+import sys
+import types
+from collections import Counter
+
+from PIL import Image
+
+import printer_backend
+from printer_backend import GdiPrinter
+
+calls = Counter()
+default_printer = {"name": "Label-1"}
+# Сколько следующих EndPage завершатся ошибкой
+failures = {"end_page": 0}
+
+
+class FakeDevmode:
+    Fields = 0
+
+
+class FakeDC:
+    def CreateDC(self, driver, device, output, devmode):
+        calls["CreateDC"] += 1
+
+    def CreatePrinterDC(self, name):
+        calls["CreateDC"] += 1
+
+    def GetDeviceCaps(self, index):
+        return {"HORZRES": 464, "VERTRES": 320, "LOGPIXELSX": 203, "LOGPIXELSY": 203}[index]
+
+    def StartDoc(self, name):
+        calls["StartDoc"] += 1
+
+    def StartPage(self):
+        calls["StartPage"] += 1
+
+    def EndPage(self):
+        calls["EndPage"] += 1
+        if failures["end_page"]:
+            failures["end_page"] -= 1
+            raise RuntimeError("принтер не отвечает")
+
+    def EndDoc(self):
+        calls["EndDoc"] += 1
+
+    def DeleteDC(self):
+        calls["DeleteDC"] += 1
+
+    def GetHandleOutput(self):
+        return 0
+
+
+def _get_printer(handle, level):
+    calls["DEVMODE"] += 1
+    return {"pDevMode": FakeDevmode()}
+
+
+class FakeDib:
+    def __init__(self, img):
+        pass
+
+    def draw(self, handle, rect):
+        calls["draw"] += 1
+
+
+def install_fakes():
+    """Подменяет модули Windows в printer_backend на заглушки"""
+    names = ("DM_PAPERSIZE", "DM_PAPERWIDTH", "DM_PAPERLENGTH", "DM_ORIENTATION", "DMPAPER_USER",
+             "DMORIENT_LANDSCAPE", "DMORIENT_PORTRAIT")
+    con = types.SimpleNamespace(**{name: 1 << i for i, name in enumerate(names)})
+    # GetDeviceCaps у заглушки понимает имена констант
+    con.HORZRES, con.VERTRES, con.LOGPIXELSX, con.LOGPIXELSY = "HORZRES", "VERTRES", "LOGPIXELSX", "LOGPIXELSY"
+    printer_backend.win32con = con
+    printer_backend.win32print = types.SimpleNamespace(
+        OpenPrinter=lambda name: name,
+        ClosePrinter=lambda handle: None,
+        GetPrinter=_get_printer,
+        GetDefaultPrinter=lambda: default_printer["name"],
+    )
+    printer_backend.win32ui = types.SimpleNamespace(CreateDC=FakeDC)
+    printer_backend.ImageWin = types.SimpleNamespace(Dib=FakeDib)
+
+
+def print_labels(printer, count: int):
+    img = Image.new("1", (464, 320), 1)
+    for _ in range(count):
+        with printer.job():
+            printer.print_label(img)
+
+
+def expect(name: str, **expected) -> bool:
+    """Сравнивает счётчики вызовов с ожидаемыми и обнуляет их"""
+    got = {key: calls[key] for key in expected}
+    calls.clear()
+    ok = got == expected
+    print(f"{'OK ' if ok else 'ОШИБКА'} {name}: {got}" + ("" if ok else f", ожидалось {expected}"))
+    return ok
+
+
+def main() -> int:
+    install_fakes()
+    # recheck_sec=0: принтер по умолчанию проверяется перед каждой этикеткой
+    printer = GdiPrinter(recheck_sec=0)
+    results = []
+
+    print_labels(printer, 5)
+    results.append(expect("5 этикеток: одна сессия, задание на каждую",
+                          DEVMODE=1, CreateDC=1, StartDoc=5, EndDoc=5, StartPage=5, DeleteDC=0))
+
+    with printer.batch():
+        print_labels(printer, 5)
+    results.append(expect("пачка из 5: одно задание спулера",
+                          DEVMODE=0, CreateDC=0, StartDoc=1, EndDoc=1, StartPage=5))
+
+    default_printer["name"] = "Label-2"
+    print_labels(printer, 3)
+    results.append(expect("смена принтера по умолчанию: сессия пересоздана один раз",
+                          DEVMODE=1, CreateDC=1, DeleteDC=1, StartDoc=3, EndDoc=3))
+
+    failures["end_page"] = 1
+    try:
+        print_labels(printer, 1)
+        results.append(expect("ошибка печати не дошла до вызывающего", StartDoc=-1))
+    except RuntimeError:
+        pass
+    print_labels(printer, 3)
+    results.append(expect("ошибка печати: сессия пересоздана один раз",
+                          DEVMODE=1, CreateDC=1, DeleteDC=1, StartDoc=4, StartPage=4))
+
+    printer.close()
+    results.append(expect("close: DC освобождён", DeleteDC=1, EndDoc=0))
+
+    if all(results):
+        print("Все проверки пройдены")
+        return 0
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
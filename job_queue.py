@@ -0,0 +1,680 @@
+"""
+Очередь заданий печати с арендой и подтверждением; бэкенд выбирается по URL.
+
+Задание не удаляется при выдаче: /get-job «арендует» его на lease_sec секунд,
+клиент подтверждает (ack) после EndDoc. Неподтверждённые задания по истечении
+аренды выдаются снова, поэтому ни перезапуск сервера, ни падение клиента
+посреди печати не теряют коды маркировки.
+
+Очередь станции ограничена capacity заданиями (put бросает QueueFull), задания старше
+ttl_sec секунд не выдаются и удаляются — коды не печатаются через несколько часов после
+скана, а место в очереди освобождается, даже если клиент печати долго не подключается.
+
+Бэкенды (create_job_queue):
+    memory://                — в памяти процесса; только для одного воркера и тестов
+    sqlite:///path/queue.db  — файл SQLite (WAL), общий для воркеров на одной машине
+    redis://host:6379/0      — Redis (или совместимый сервер), общий для нескольких серверов
+"""
+import asyncio
+import concurrent.futures
+import sqlite3
+import time
+from collections import deque
+
+
+class QueueFull(Exception):
+    """В очереди станции уже capacity заданий"""
+
+
+class JobQueue:
+    """
+    Общая часть бэкендов: ожидание заданий для long-poll и WebSocket поверх
+    _lease_now. Задание, выданное max_attempts раз и так и не подтверждённое,
+    удаляется при следующей выдаче (чтобы «битый» код не печатался по кругу).
+    """
+
+    def __init__(self, lease_sec: float = 120.0, max_attempts: int = 5, recheck_sec: float = 1.0,
+                 capacity: int = 0, ttl_sec: float = 0.0):
+        self.lease_sec = lease_sec
+        self.max_attempts = max_attempts
+        # Не больше capacity неподтверждённых заданий на станцию (0 — без ограничения)
+        self.capacity = capacity
+        # Задания старше ttl_sec секунд не печатаются (0 — бессрочно)
+        self.ttl_sec = ttl_sec
+        # Как часто ожидающий long-poll перепроверяет очередь (истёкшие аренды, другие воркеры)
+        self.recheck_sec = recheck_sec
+        # station -> asyncio.Condition «в очереди станции появились задания»
+        self._conds = {}
+        # station -> счётчик уведомлений: по нему ожидающий видит, что задания
+        # пришли, пока он сам ходил в хранилище (иначе уведомление можно пропустить)
+        self._seq = {}
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    # --- Уведомления внутри процесса ---
+
+    def _cond(self, station: str) -> asyncio.Condition:
+        cond = self._conds.get(station)
+        if cond is None:
+            cond = self._conds[station] = asyncio.Condition()
+        return cond
+
+    async def _notify(self, station: str):
+        self._seq[station] = self._seq.get(station, 0) + 1
+        cond = self._cond(station)
+        async with cond:
+            cond.notify_all()
+
+    async def _notify_all(self):
+        for station in list(self._conds):
+            await self._notify(station)
+
+    async def _wait_notify(self, station: str, seen: int, timeout: float):
+        """Ждёт уведомления, пришедшего после seen, не дольше timeout секунд."""
+        cond = self._cond(station)
+        async with cond:
+            try:
+                await asyncio.wait_for(cond.wait_for(lambda: self._seq.get(station, 0) != seen), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    # --- API очереди ---
+
+    def _cutoff(self) -> float:
+        """created_at, раньше которого задание просрочено (0 — TTL выключен)"""
+        return time.time() - self.ttl_sec if self.ttl_sec else 0.0
+
+    async def put(self, station: str, data: str) -> int:
+        """Добавляет задание; возвращает его id. QueueFull — в очереди станции уже capacity заданий."""
+        raise NotImplementedError
+
+    async def lease(self, station: str, max_items: int = 1, wait: float = 0.0) -> list:
+        """
+        Арендует до max_items заданий станции: [{"id": ..., "data": ..., "created_at": ...}, ...]
+        по порядку поступления (created_at — time.time() постановки в очередь).
+        При пустой очереди ждёт до wait секунд.
+        """
+        deadline = time.monotonic() + wait
+        while True:
+            seen = self._seq.get(station, 0)
+            jobs = await self._lease_now(station, max_items)
+            remaining = deadline - time.monotonic()
+            if jobs or remaining <= 0:
+                return jobs
+            await self._wait_notify(station, seen, min(remaining, self.recheck_sec))
+
+    async def _lease_now(self, station: str, max_items: int) -> list:
+        raise NotImplementedError
+
+    async def ack(self, station: str, ids) -> int:
+        """Подтверждает напечатанные задания (удаляет их). Возвращает число удалённых."""
+        raise NotImplementedError
+
+    async def release(self, station: str, ids) -> int:
+        """Возвращает арендованные задания в очередь сразу (клиент отключился, не напечатав)."""
+        raise NotImplementedError
+
+    async def depth(self, station: str) -> int:
+        """Сколько заданий станции ждут выдачи (без учёта арендованных)."""
+        raise NotImplementedError
+
+    async def wait_ready(self, station: str):
+        """Ждёт, пока у станции появится задание, доступное для аренды (ничего не забирает)."""
+        while True:
+            seen = self._seq.get(station, 0)
+            if await self.depth(station):
+                return
+            await self._wait_notify(station, seen, self.recheck_sec)
+
+
+class _MemoryStation:
+    __slots__ = ("ready", "leased")
+
+    def __init__(self):
+        # id заданий в порядке выдачи
+        self.ready = deque()
+        # id -> срок аренды; lease_sec постоянный, поэтому порядок вставки = порядок истечения
+        self.leased = {}
+
+
+class MemoryJobQueue(JobQueue):
+    """Очередь в памяти процесса: быстрая, но не переживает перезапуск и не делится между воркерами."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._stations = {}
+        # id -> [station, data, attempts, created_at]
+        self._jobs = {}
+        self._next_id = 1
+
+    def _station(self, station: str) -> _MemoryStation:
+        st = self._stations.get(station)
+        if st is None:
+            st = self._stations[station] = _MemoryStation()
+        return st
+
+    def _expire(self, st: _MemoryStation):
+        now = time.monotonic()
+        requeue = []
+        while st.leased:
+            job_id, until = next(iter(st.leased.items()))
+            if until > now:
+                break
+            del st.leased[job_id]
+            if self._jobs[job_id][2] >= self.max_attempts:
+                job = self._jobs.pop(job_id)
+                print(f"Задание {job_id} не подтверждено после {self.max_attempts} попыток, удалено: {job[1][:30]}...")
+            else:
+                requeue.append(job_id)
+        st.ready.extendleft(reversed(requeue))
+
+    def _drop_stale(self, st: _MemoryStation, station: str):
+        """Просроченные задания с головы очереди (там самые старые) — амортизированно O(1)"""
+        cutoff = self._cutoff()
+        count = 0
+        while st.ready and self._jobs[st.ready[0]][3] < cutoff:
+            del self._jobs[st.ready.popleft()]
+            count += 1
+        if count:
+            print(f"Станция {station}: удалено просроченных заданий: {count}")
+
+    async def put(self, station: str, data: str) -> int:
+        st = self._station(station)
+        self._drop_stale(st, station)
+        if self.capacity and len(st.ready) + len(st.leased) >= self.capacity:
+            raise QueueFull(station)
+        job_id = self._next_id
+        self._next_id += 1
+        self._jobs[job_id] = [station, data, 0, time.time()]
+        st.ready.append(job_id)
+        await self._notify(station)
+        return job_id
+
+    async def _lease_now(self, station: str, max_items: int) -> list:
+        st = self._station(station)
+        self._expire(st)
+        self._drop_stale(st, station)
+        cutoff = self._cutoff()
+        until = time.monotonic() + self.lease_sec
+        jobs = []
+        while st.ready and len(jobs) < max_items:
+            job_id = st.ready.popleft()
+            job = self._jobs[job_id]
+            if job[3] < cutoff:
+                # Вернулось в очередь после истёкшей аренды уже просроченным
+                del self._jobs[job_id]
+                continue
+            job[2] += 1
+            st.leased[job_id] = until
+            jobs.append({"id": job_id, "data": job[1], "created_at": job[3]})
+        return jobs
+
+    async def ack(self, station: str, ids) -> int:
+        st = self._station(station)
+        count = 0
+        for job_id in ids:
+            job = self._jobs.get(int(job_id))
+            if job is None or job[0] != station:
+                continue
+            job_id = int(job_id)
+            del self._jobs[job_id]
+            if st.leased.pop(job_id, None) is None:
+                # Аренда успела истечь и задание вернулось в очередь — убираем и оттуда
+                st.ready.remove(job_id)
+            count += 1
+        return count
+
+    async def release(self, station: str, ids) -> int:
+        st = self._station(station)
+        released = sorted(int(i) for i in ids if st.leased.pop(int(i), None) is not None)
+        st.ready.extendleft(reversed(released))
+        if released:
+            await self._notify(station)
+        return len(released)
+
+    async def depth(self, station: str) -> int:
+        st = self._station(station)
+        self._expire(st)
+        self._drop_stale(st, station)
+        return len(st.ready)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    station     TEXT    NOT NULL,
+    data        TEXT    NOT NULL,
+    created_at  REAL    NOT NULL,
+    lease_until REAL    NOT NULL DEFAULT 0,
+    attempts    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (station, lease_until, id);
+CREATE INDEX IF NOT EXISTS jobs_created ON jobs (station, created_at);
+-- Число заданий станции для проверки capacity за O(1); ведут триггеры
+CREATE TABLE IF NOT EXISTS job_counts (
+    station TEXT PRIMARY KEY,
+    n       INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS jobs_count_insert AFTER INSERT ON jobs BEGIN
+    INSERT INTO job_counts (station, n) VALUES (NEW.station, 1)
+    ON CONFLICT (station) DO UPDATE SET n = n + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS jobs_count_delete AFTER DELETE ON jobs BEGIN
+    UPDATE job_counts SET n = n - 1 WHERE station = OLD.station;
+END;
+"""
+
+
+class SQLiteJobQueue(JobQueue):
+    """
+    Очередь в файле SQLite (WAL). Всё состояние (в т.ч. аренды) лежит в базе,
+    поэтому несколько воркеров uvicorn на одной машине могут работать с одним файлом.
+
+    Все обращения к базе идут через один поток. Операции, пришедшие пока идёт
+    предыдущий commit, складываются в одну транзакцию (group commit): один fsync
+    на пачку, а не на каждый скан. Коммиты других процессов замечаем по
+    PRAGMA data_version и будим своих ожидающих.
+    """
+
+    def __init__(self, path: str, watch_sec: float = 0.05, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.watch_sec = watch_sec
+        self._db = None
+        self._executor = None
+        self._pending = []
+        self._wakeup = None
+        self._tasks = []
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-queue")
+        await loop.run_in_executor(self._executor, self._open)
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._writer()), asyncio.create_task(self._watch())]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self._executor is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._close_db)
+            self._executor.shutdown()
+            self._executor = None
+
+    def _open(self):
+        self._db = sqlite3.connect(self.path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # FULL: commit возвращается только после fsync WAL — скан не потеряется при сбое питания
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(SQLITE_SCHEMA)
+        # База от версии без job_counts: один раз считаем задания, дальше счётчики ведут триггеры
+        self._db.execute("BEGIN IMMEDIATE")
+        if not self._db.execute("SELECT 1 FROM job_counts LIMIT 1").fetchone():
+            self._db.execute("INSERT INTO job_counts SELECT station, COUNT(*) FROM jobs GROUP BY station")
+        self._db.execute("COMMIT")
+
+    def _close_db(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _run(self, fn):
+        return asyncio.get_running_loop().run_in_executor(self._executor, fn)
+
+    # --- Group commit ---
+
+    def _submit(self, op):
+        """Ставит операцию op(db) в следующую транзакцию; возвращает future с её результатом."""
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((op, fut))
+        self._wakeup.set()
+        return fut
+
+    async def _writer(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            batch, self._pending = self._pending, []
+            if not batch:
+                continue
+            try:
+                results = await self._run(lambda: self._run_batch([op for op, _ in batch]))
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+
+    def _run_batch(self, ops):
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            results = [op(db) for op in ops]
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return results
+
+    async def _watch(self):
+        """Следит за коммитами других процессов (воркеров) и будит ожидающих в этом процессе."""
+        version = await self._run(self._data_version)
+        while True:
+            await asyncio.sleep(self.watch_sec)
+            if not self._conds:
+                continue
+            current = await self._run(self._data_version)
+            if current != version:
+                version = current
+                await self._notify_all()
+
+    def _data_version(self):
+        return self._db.execute("PRAGMA data_version").fetchone()[0]
+
+    # --- API очереди ---
+
+    async def put(self, station: str, data: str) -> int:
+        """Добавляет задание; возвращает его id после того, как оно записано на диск."""
+        now = time.time()
+
+        def op(db):
+            # Не исключение: оно откатило бы всю пачку group commit, а не только этот put
+            if self.capacity and self._count(db, station) >= self.capacity:
+                # Очередь полна — сначала освобождаем место от просроченных
+                self._delete_stale(db, station)
+                if self._count(db, station) >= self.capacity:
+                    return None
+            cur = db.execute("INSERT INTO jobs (station, data, created_at) VALUES (?, ?, ?)", (station, data, now))
+            return cur.lastrowid
+
+        job_id = await self._submit(op)
+        if job_id is None:
+            raise QueueFull(station)
+        await self._notify(station)
+        return job_id
+
+    @staticmethod
+    def _count(db, station: str) -> int:
+        row = db.execute("SELECT n FROM job_counts WHERE station = ?", (station,)).fetchone()
+        return row[0] if row else 0
+
+    def _delete_stale(self, db, station: str):
+        cutoff = self._cutoff()
+        if cutoff:
+            count = db.execute("DELETE FROM jobs WHERE station = ? AND created_at < ?", (station, cutoff)).rowcount
+            if count:
+                print(f"Станция {station}: удалено просроченных заданий: {count}")
+
+    async def _lease_now(self, station: str, max_items: int) -> list:
+        return await self._submit(lambda db: self._lease_op(db, station, max_items))
+
+    def _lease_op(self, db, station, max_items):
+        now = time.time()
+        dead = db.execute(
+            "DELETE FROM jobs WHERE station = ? AND lease_until > 0 AND lease_until <= ? AND attempts >= ? "
+            "RETURNING id, data",
+            (station, now, self.max_attempts),
+        ).fetchall()
+        for job_id, data in dead:
+            print(f"Задание {job_id} не подтверждено после {self.max_attempts} попыток, удалено: {data[:30]}...")
+        self._delete_stale(db, station)
+        rows = db.execute(
+            "UPDATE jobs SET lease_until = ?, attempts = attempts + 1 WHERE id IN ("
+            "  SELECT id FROM jobs WHERE station = ? AND lease_until <= ? ORDER BY id LIMIT ?"
+            ") RETURNING id, data, created_at",
+            (now + self.lease_sec, station, now, max_items),
+        ).fetchall()
+        rows.sort()
+        return [{"id": job_id, "data": data, "created_at": created_at} for job_id, data, created_at in rows]
+
+    async def ack(self, station: str, ids) -> int:
+        ids = [int(i) for i in ids]
+        if not ids:
+            return 0
+
+        def op(db):
+            cur = db.executemany("DELETE FROM jobs WHERE id = ? AND station = ?", [(i, station) for i in ids])
+            return cur.rowcount
+
+        return await self._submit(op)
+
+    async def release(self, station: str, ids) -> int:
+        ids = [int(i) for i in ids]
+        if not ids:
+            return 0
+
+        def op(db):
+            cur = db.executemany(
+                "UPDATE jobs SET lease_until = 0 WHERE id = ? AND station = ? AND lease_until > 0",
+                [(i, station) for i in ids],
+            )
+            return cur.rowcount
+
+        count = await self._submit(op)
+        if count:
+            await self._notify(station)
+        return count
+
+    async def depth(self, station: str) -> int:
+        now = time.time()
+        return await self._run(
+            lambda: self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE station = ? AND lease_until <= ?", (station, now)
+            ).fetchone()[0]
+        )
+
+
+# Lua-скрипты выполняются в Redis атомарно, поэтому воркеры не делят одно задание
+_REDIS_PUT = """
+local cap = tonumber(ARGV[6])
+if cap > 0 and redis.call('LLEN', KEYS[1]) + redis.call('ZCARD', KEYS[3]) >= cap then
+    -- Очередь полна: сначала снимаем с головы просроченные задания
+    local cutoff = tonumber(ARGV[7])
+    while cutoff > 0 do
+        local head = redis.call('LINDEX', KEYS[1], 0)
+        if not head then break end
+        if tonumber(redis.call('HGET', ARGV[1] .. head, 'created_at') or '0') >= cutoff then break end
+        redis.call('LPOP', KEYS[1])
+        redis.call('DEL', ARGV[1] .. head)
+    end
+    if redis.call('LLEN', KEYS[1]) + redis.call('ZCARD', KEYS[3]) >= cap then
+        return -1
+    end
+end
+local id = redis.call('INCR', KEYS[2])
+redis.call('HSET', ARGV[1] .. id, 'station', ARGV[2], 'data', ARGV[3], 'created_at', ARGV[4], 'attempts', 0)
+redis.call('RPUSH', KEYS[1], id)
+redis.call('PUBLISH', ARGV[5], ARGV[2])
+return id
+"""
+
+_REDIS_LEASE = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+if #expired > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+    for i = #expired, 1, -1 do
+        local key = ARGV[5] .. expired[i]
+        if tonumber(redis.call('HGET', key, 'attempts') or '0') >= tonumber(ARGV[4]) then
+            redis.call('DEL', key)
+        else
+            redis.call('LPUSH', KEYS[1], expired[i])
+        end
+    end
+end
+local out = {}
+for i = 1, tonumber(ARGV[3]) do
+    local id = redis.call('LPOP', KEYS[1])
+    if not id then break end
+    local job = redis.call('HMGET', ARGV[5] .. id, 'data', 'created_at')
+    if job[1] and tonumber(job[2]) < tonumber(ARGV[6]) then
+        -- Просрочено (ARGV[6] — граница created_at, 0 — без TTL)
+        redis.call('DEL', ARGV[5] .. id)
+    elseif job[1] then
+        redis.call('HINCRBY', ARGV[5] .. id, 'attempts', 1)
+        redis.call('ZADD', KEYS[2], ARGV[2], id)
+        table.insert(out, id)
+        table.insert(out, job[1])
+        table.insert(out, job[2])
+    end
+end
+return out
+"""
+
+_REDIS_ACK = """
+local n = 0
+for i = 3, #ARGV do
+    local key = ARGV[1] .. ARGV[i]
+    if redis.call('HGET', key, 'station') == ARGV[2] then
+        redis.call('ZREM', KEYS[2], ARGV[i])
+        redis.call('LREM', KEYS[1], 0, ARGV[i])
+        n = n + redis.call('DEL', key)
+    end
+end
+return n
+"""
+
+_REDIS_RELEASE = """
+local ids = {}
+for i = 1, #ARGV do
+    if redis.call('ZREM', KEYS[2], ARGV[i]) == 1 then
+        table.insert(ids, tonumber(ARGV[i]))
+    end
+end
+table.sort(ids)
+for i = #ids, 1, -1 do
+    redis.call('LPUSH', KEYS[1], ids[i])
+end
+return #ids
+"""
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Очередь в Redis: общая для всех воркеров и серверов за балансировщиком.
+    Новые задания анонсируются через pub/sub, чтобы long-poll в любом воркере
+    просыпался сразу. Надёжность хранения определяется настройками Redis (AOF).
+
+    Ключи: {prefix}:{station}:ready (list id), {prefix}:{station}:leased (zset id -> срок),
+    {prefix}:job:{id} (hash), {prefix}:seq, канал {prefix}:notify.
+    """
+
+    def __init__(self, url: str, prefix: str = "qr", **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+        self.prefix = prefix
+        self._redis = None
+        self._listener = None
+        self._scripts = {}
+
+    def _keys(self, station: str):
+        return f"{self.prefix}:{station}:ready", f"{self.prefix}:{station}:leased"
+
+    @property
+    def _job_prefix(self):
+        return f"{self.prefix}:job:"
+
+    @property
+    def _channel(self):
+        return f"{self.prefix}:notify"
+
+    async def start(self):
+        import redis.asyncio as aioredis  # необязательная зависимость: нужна только для redis://
+
+        self._redis = aioredis.from_url(self.url, decode_responses=True)
+        for name, source in (("put", _REDIS_PUT), ("lease", _REDIS_LEASE),
+                             ("ack", _REDIS_ACK), ("release", _REDIS_RELEASE)):
+            self._scripts[name] = self._redis.register_script(source)
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self._channel)
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def _listen(self, pubsub):
+        """Задания, добавленные другими воркерами, будят ожидающих в этом процессе."""
+        try:
+            async for msg in pubsub.listen():
+                if msg.get("type") == "message" and msg["data"] in self._conds:
+                    await self._notify(msg["data"])
+        finally:
+            await pubsub.aclose()
+
+    async def put(self, station: str, data: str) -> int:
+        ready, leased = self._keys(station)
+        job_id = int(await self._scripts["put"](
+            keys=[ready, f"{self.prefix}:seq", leased],
+            args=[self._job_prefix, station, data, time.time(), self._channel, self.capacity, self._cutoff()],
+        ))
+        if job_id < 0:
+            raise QueueFull(station)
+        return job_id
+
+    async def _lease_now(self, station: str, max_items: int) -> list:
+        now = time.time()
+        out = await self._scripts["lease"](
+            keys=list(self._keys(station)),
+            args=[now, now + self.lease_sec, max_items, self.max_attempts, self._job_prefix, self._cutoff()],
+        )
+        return [{"id": int(out[i]), "data": out[i + 1], "created_at": float(out[i + 2])}
+                for i in range(0, len(out), 3)]
+
+    async def ack(self, station: str, ids) -> int:
+        ids = [int(i) for i in ids]
+        if not ids:
+            return 0
+        return int(await self._scripts["ack"](keys=list(self._keys(station)), args=[self._job_prefix, station, *ids]))
+
+    async def release(self, station: str, ids) -> int:
+        ids = [int(i) for i in ids]
+        if not ids:
+            return 0
+        count = int(await self._scripts["release"](keys=list(self._keys(station)), args=ids))
+        if count:
+            await self._redis.publish(self._channel, station)
+        return count
+
+    async def depth(self, station: str) -> int:
+        ready, leased = self._keys(station)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.llen(ready)
+            pipe.zcount(leased, "-inf", time.time())
+            n_ready, n_expired = await pipe.execute()
+        return n_ready + n_expired
+
+
+def create_job_queue(url: str, **kwargs) -> JobQueue:
+    """
+    Очередь по URL: memory://, sqlite:///путь (или просто путь к файлу), redis://... / rediss://...
+    kwargs (lease_sec, max_attempts, capacity, ttl_sec, ...) передаются бэкенду.
+    """
+    if url.startswith("memory:"):
+        return MemoryJobQueue(**kwargs)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisJobQueue(url, **kwargs)
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    return SQLiteJobQueue(url, **kwargs)
@@ -0,0 +1,119 @@
+"""
+Этикетка на языке принтера (ZPL — Zebra и совместимые, TSPL — TSC, Xprinter и т.п.).
+Data Matrix рисует сам принтер: на этикетку уходит несколько сотен байт вместо растра
+на всю страницу. Размер символа, модуль и положение считаются так же, как в label_render,
+поэтому этикетка выглядит как растровая.
+
+Если кода нет (печатается готовая картинка), этикетка уходит растром в том же языке
+(^GFA / BITMAP).
+"""
+from label_render import DM_GS1, LABEL_MM, PRINTER_DPI, QR_FILL_RATIO, mm_to_px, symbol_placement
+import dm_encoder
+
+LANGS = ("zpl", "tspl")
+
+
+def label_page(label_mm=LABEL_MM, dpi: int = PRINTER_DPI) -> tuple[int, int]:
+    return mm_to_px(label_mm[0], dpi), mm_to_px(label_mm[1], dpi)
+
+
+def _split_gs1(text: str) -> list[str]:
+    """Поля GS1 между разделителями GS (0x1D); ведущий GS — это FNC1 от сканера"""
+    if text.startswith("\x1d"):
+        text = text[1:]
+    return text.split("\x1d")
+
+
+# --- ZPL ---
+
+def _zpl_hex(text: str) -> str:
+    """Служебные символы ZPL (^ ~ \\) в поле данных — шестнадцатеричными кодами (^FH\\)"""
+    out = []
+    for ch in text:
+        if ch in "^~\\" or ord(ch) < 32:
+            out.append("".join(f"\\{b:02X}" for b in ch.encode("utf-8")))
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def zpl_label(text: str, label_mm=LABEL_MM, dpi: int = PRINTER_DPI,
+              fill_ratio: float = QR_FILL_RATIO, gs1: bool = DM_GS1) -> bytes:
+    page_w, page_h = label_page(label_mm, dpi)
+    size = dm_encoder.symbol_size(text, gs1)
+    module, x, y = symbol_placement(size, page_w, page_h, fill_ratio)
+    # Escape-символ ^BX задаём всегда '_' (_1 — FNC1, _d095 — сам символ '_'): без него при
+    # качестве 200 принтер берёт '~', и '~' в коде испортил бы символ
+    if gs1:
+        data = "_1" + "_1".join(_zpl_hex(f.replace("_", "_d095")) for f in _split_gs1(text))
+    else:
+        data = _zpl_hex(text.replace("_", "_d095"))
+    return (
+        "^XA^CI28"
+        f"^PW{page_w}^LL{page_h}^LH0,0"
+        f"^FO{x},{y}^BXN,{module},200,{size},{size},6,_"
+        f"^FH\\^FD{data}^FS"
+        "^PQ1^XZ\n"
+    ).encode("utf-8")
+
+
+def zpl_raster(bits: bytes, page_w: int, page_h: int) -> bytes:
+    """Готовая картинка режима '1' (упакованные строки, 1 — белый) как ^GFA (в ZPL 1 — чёрный)"""
+    row = (page_w + 7) // 8
+    data = bytes(b ^ 0xFF for b in bits).hex().upper()
+    total = row * page_h
+    return (f"^XA^PW{page_w}^LL{page_h}^LH0,0^FO0,0^GFA,{total},{total},{row},{data}^FS^PQ1^XZ\n").encode("ascii")
+
+
+# --- TSPL ---
+
+def _tspl_string(text: str) -> str:
+    return text.replace('"', '\\["]')
+
+
+def _tspl_header(label_mm) -> str:
+    return f"SIZE {label_mm[0]} mm,{label_mm[1]} mm\r\nDIRECTION 1\r\nCODEPAGE UTF-8\r\nCLS\r\n"
+
+
+def tspl_label(text: str, label_mm=LABEL_MM, dpi: int = PRINTER_DPI,
+               fill_ratio: float = QR_FILL_RATIO, gs1: bool = DM_GS1) -> bytes:
+    page_w, page_h = label_page(label_mm, dpi)
+    size = dm_encoder.symbol_size(text, gs1)
+    module, x, y = symbol_placement(size, page_w, page_h, fill_ratio)
+    side = size * module
+    if gs1:
+        # Escape-символ c126 ('~'): ~1 — FNC1, ~d126 — сам символ '~'
+        fields = [_tspl_string(f.replace("~", "~d126")) for f in _split_gs1(text)]
+        opts, data = "c126,", "~1" + "~1".join(fields)
+    else:
+        opts, data = "", _tspl_string(text)
+    return (
+        _tspl_header(label_mm)
+        + f'DMATRIX {x},{y},{side},{side},{opts}x{module},{size},{size},"{data}"\r\n'
+        + "PRINT 1\r\n"
+    ).encode("utf-8")
+
+
+def tspl_raster(bits: bytes, page_w: int, page_h: int, label_mm=LABEL_MM) -> bytes:
+    """Готовая картинка режима '1' как BITMAP (в TSPL 0 — чёрная точка, как и в режиме '1')"""
+    row = (page_w + 7) // 8
+    return (_tspl_header(label_mm) + f"BITMAP 0,0,{row},{page_h},0,").encode("ascii") + bits + b"\r\nPRINT 1\r\n"
+
+
+def label_commands(lang: str, text: str, **kw) -> bytes:
+    """Этикетка с кодом text на языке lang ("zpl" или "tspl")"""
+    if lang == "zpl":
+        return zpl_label(text, **kw)
+    if lang == "tspl":
+        return tspl_label(text, **kw)
+    raise ValueError(f"Неизвестный язык принтера: {lang} ({', '.join(LANGS)})")
+
+
+def raster_commands(lang: str, img, label_mm=LABEL_MM) -> bytes:
+    """Готовая этикетка-картинка растром на языке lang"""
+    img = img.convert('1')
+    if lang == "zpl":
+        return zpl_raster(img.tobytes(), img.width, img.height)
+    if lang == "tspl":
+        return tspl_raster(img.tobytes(), img.width, img.height, label_mm)
+    raise ValueError(f"Неизвестный язык принтера: {lang} ({', '.join(LANGS)})")
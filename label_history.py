@@ -0,0 +1,241 @@
+"""
+История этикеток: вместо PNG на каждый скан — индекс SQLite с текстом кода и параметрами
+отрисовки (этикетка восстанавливается по ним один в один) и, по желанию, архив картинок.
+
+Картинки (PNG 1 бит, ~1-2 КБ) складываются в пачки history/ГГГГ-ММ-ДД/pack-001.bin
+не больше HISTORY_PACK_MB каждая; в индексе — пачка и смещение. Повторный скан того же
+кода с теми же параметрами только обновляет счётчик и время: место на диске и число
+файлов растут с числом уникальных кодов, а не сканов.
+
+Хранение: записи и пачки старше HISTORY_DAYS дней удаляются, архив картинок
+ограничен HISTORY_MAX_MB (сначала удаляются самые старые дни). Проверяется при запуске,
+с наступлением нового дня и при открытии каждой новой пачки — клиент может работать неделями.
+
+    python label_history.py stats
+    python label_history.py export "010460..." -o label.png
+"""
+import argparse
+import datetime
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+from label_render import DM_ENCODER, DM_GS1, LABEL_MM, QR_FILL_RATIO, mm_to_px
+
+HISTORY_FOLDER = "history"
+# Сохранять ли картинки этикеток (0 — только индекс: этикетка всё равно восстанавливается по коду)
+HISTORY_IMAGES = os.environ.get("HISTORY_IMAGES", "1").lower() in ("1", "true", "yes")
+HISTORY_PACK_MB = float(os.environ.get("HISTORY_PACK_MB", "64"))
+HISTORY_DAYS = int(os.environ.get("HISTORY_DAYS", "365"))
+HISTORY_MAX_MB = float(os.environ.get("HISTORY_MAX_MB", "2048"))
+
+
+def label_key(text: str, page_w: int, page_h: int, fill_ratio: float = QR_FILL_RATIO,
+              encoder: str = DM_ENCODER, gs1: bool = DM_GS1) -> str:
+    """Ключ этикетки: одинаковые код и параметры отрисовки дают одинаковую картинку"""
+    raw = repr((text, page_w, page_h, round(fill_ratio, 4), encoder, bool(gs1))).encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()[:20]
+
+
+class HistoryStore:
+    def __init__(self, folder: str = HISTORY_FOLDER, images: bool = HISTORY_IMAGES,
+                 pack_mb: float = HISTORY_PACK_MB, keep_days: int = HISTORY_DAYS,
+                 max_mb: float = HISTORY_MAX_MB):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.images = images
+        self.pack_bytes = int(pack_mb * 1024 * 1024)
+        self.keep_days = keep_days
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        # Пишет этап сохранения конвейера, а создаётся объект в главном потоке
+        self._db = sqlite3.connect(os.path.join(folder, "index.db"), isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS labels (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                page_w INTEGER NOT NULL,
+                page_h INTEGER NOT NULL,
+                fill_ratio REAL NOT NULL,
+                encoder TEXT NOT NULL,
+                gs1 INTEGER NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                count INTEGER NOT NULL,
+                pack TEXT,
+                offset INTEGER,
+                length INTEGER
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS labels_last_seen ON labels (last_seen)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS labels_text ON labels (text)")
+        self._pack = None
+        self._pack_name = None
+        # День последней проверки хранения
+        self._evicted_day = None
+        self.evict()
+
+    # --- Запись ---
+
+    def add(self, text: str, img, fill_ratio: float = QR_FILL_RATIO) -> str:
+        """
+        Отметить печать этикетки; картинка пишется в архив только для нового ключа. Возвращает ключ.
+        img=None — этикетку не рисовали (принтер ZPL/TSPL): размер страницы — из LABEL_MM.
+        """
+        page_w, page_h = img.size if img is not None else (mm_to_px(LABEL_MM[0]), mm_to_px(LABEL_MM[1]))
+        key = label_key(text, page_w, page_h, fill_ratio)
+        now = time.time()
+        with self._lock:
+            if datetime.date.today().isoformat() != self._evicted_day:
+                self._evict()
+            updated = self._db.execute(
+                "UPDATE labels SET last_seen = ?, count = count + 1 WHERE key = ?", (now, key)).rowcount
+            if updated:
+                return key
+            pack = offset = length = None
+            if self.images and img is not None:
+                pack, offset, length = self._append_image(img)
+            self._db.execute(
+                "INSERT INTO labels VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?, ?, ?)",
+                (key, text, page_w, page_h, fill_ratio, DM_ENCODER, int(DM_GS1), now, now, pack, offset, length))
+        return key
+
+    def _append_image(self, img):
+        buf = io.BytesIO()
+        img.convert('1').save(buf, format="PNG", optimize=True)
+        data = buf.getvalue()
+        day = datetime.date.today().isoformat()
+        if self._pack is None or not self._pack_name.startswith(day) or self._pack.tell() + len(data) > self.pack_bytes:
+            self._open_pack(day)
+        offset = self._pack.tell()
+        self._pack.write(data)
+        self._pack.flush()
+        return self._pack_name, offset, len(data)
+
+    def _open_pack(self, day: str):
+        if self._pack is not None:
+            self._pack.close()
+            self._pack = None
+        # Архив вырос на целую пачку — проверяем HISTORY_MAX_MB
+        self._evict()
+        shard = os.path.join(self.folder, day)
+        os.makedirs(shard, exist_ok=True)
+        n = 1
+        while True:
+            path = os.path.join(shard, f"pack-{n:03d}.bin")
+            if not os.path.exists(path) or os.path.getsize(path) < self.pack_bytes:
+                break
+            n += 1
+        self._pack = open(path, "ab")
+        self._pack_name = f"{day}/pack-{n:03d}.bin"
+
+    # --- Чтение ---
+
+    def get(self, key: str):
+        row = self._db.execute(
+            "SELECT text, page_w, page_h, fill_ratio, first_seen, last_seen, count, pack, offset, length "
+            "FROM labels WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        names = ("text", "page_w", "page_h", "fill_ratio", "first_seen", "last_seen", "count", "pack", "offset", "length")
+        return dict(zip(names, row), key=key)
+
+    def find(self, text: str) -> list:
+        keys = self._db.execute("SELECT key FROM labels WHERE text = ? ORDER BY last_seen DESC", (text,)).fetchall()
+        return [self.get(k) for (k,) in keys]
+
+    def load_image(self, key: str):
+        """Картинка этикетки: из архива, а если её там нет — отрисовывается заново по параметрам"""
+        from PIL import Image
+
+        rec = self.get(key)
+        if rec is None:
+            return None
+        if rec["pack"]:
+            path = os.path.join(self.folder, rec["pack"])
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    f.seek(rec["offset"])
+                    return Image.open(io.BytesIO(f.read(rec["length"])))
+        from label_render import render_label
+
+        return render_label(rec["text"], rec["page_w"], rec["page_h"], rec["fill_ratio"])
+
+    # --- Хранение ---
+
+    def evict(self):
+        """Удалить записи старше keep_days и старые дни архива сверх max_bytes"""
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        today = datetime.date.today().isoformat()
+        self._evicted_day = today
+        cutoff = time.time() - self.keep_days * 86400
+        self._db.execute("DELETE FROM labels WHERE last_seen < ?", (cutoff,))
+        oldest = (datetime.date.today() - datetime.timedelta(days=self.keep_days)).isoformat()
+
+        shards = sorted(d for d in os.listdir(self.folder)
+                        if len(d) == 10 and d[4] == "-" and os.path.isdir(os.path.join(self.folder, d)))
+        sizes = {d: sum(e.stat().st_size for e in os.scandir(os.path.join(self.folder, d)) if e.is_file())
+                 for d in shards}
+        total = sum(sizes.values())
+        for d in shards:
+            if d >= today or (d >= oldest and total <= self.max_bytes):
+                break
+            shutil.rmtree(os.path.join(self.folder, d), ignore_errors=True)
+            total -= sizes[d]
+            # Картинки удалены — этикетка по-прежнему восстанавливается по коду
+            self._db.execute("UPDATE labels SET pack = NULL, offset = NULL, length = NULL WHERE pack LIKE ?",
+                             (d + "/%",))
+            print(f"История: удалён архив этикеток за {d}")
+
+    def stats(self) -> dict:
+        labels, scans = self._db.execute("SELECT COUNT(*), COALESCE(SUM(count), 0) FROM labels").fetchone()
+        archived = self._db.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM labels WHERE pack IS NOT NULL").fetchone()
+        return {"labels": labels, "scans": scans, "archived": archived[0], "archived_bytes": archived[1]}
+
+    def close(self):
+        with self._lock:
+            if self._pack is not None:
+                self._pack.close()
+                self._pack = None
+            self._db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="История этикеток")
+    parser.add_argument("--folder", default=HISTORY_FOLDER)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats", help="сколько этикеток и сканов в истории")
+    export = sub.add_parser("export", help="сохранить этикетку кода в PNG")
+    export.add_argument("code")
+    export.add_argument("-o", "--output", required=True)
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.folder)
+    try:
+        if args.cmd == "stats":
+            for name, value in store.stats().items():
+                print(f"{name}: {value}")
+            return 0
+        recs = store.find(args.code)
+        if not recs:
+            print("Код в истории не найден")
+            return 1
+        store.load_image(recs[0]["key"]).save(args.output)
+        print(f"Этикетка (печаталась {recs[0]['count']} раз) -> {args.output}")
+        return 0
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+Генерация этикетки с Data Matrix (общая для main.py и qr_scanner_app.py)
+и LRU-кэш готовых этикеток: повторная печать того же кода не кодирует
+и не рисует его заново.
+
+Этикетка чисто чёрно-белая, поэтому рисуем её из матрицы модулей (NumPy bool)
+целочисленным повторением модулей сразу в картинку режима '1' (1 бит на пиксель):
+без промежуточных RGB-копий и с одинаковыми по размеру модулями.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+import dm_encoder
+from metrics import Histogram
+
+# Размер этикетки 58×40 мм, DPI термопринтера (обычно 203)
+LABEL_MM = (58, 40)
+PRINTER_DPI = 203
+QR_FILL_RATIO = float(os.environ.get("QR_FILL_RATIO", "0.82"))  # было 0.9; 0.82 безопаснее для полей/перекоса ленты
+# Не меньше 80 px — иначе принтер "размазывает"
+MIN_QR_SIZE = 80
+# Предел памяти под кэш этикеток (МБ)
+LABEL_CACHE_MB = float(os.environ.get("LABEL_CACHE_MB", "64"))
+# Кодировщик Data Matrix: "pylibdmtx" (libdmtx через ctypes) или "builtin" (dm_encoder.py, без DLL)
+DM_ENCODER = os.environ.get("DM_ENCODER", "pylibdmtx").lower()
+# GS1 («Честный знак»): FNC1 в начале символа. Поддерживается только встроенным кодировщиком
+DM_GS1 = os.environ.get("DM_GS1", "0").lower() in ("1", "true", "yes")
+
+# Время этапов печати этикетки: encode, render (здесь), page, print, persist, ... (print_pipeline, main)
+STAGE_SECONDS = Histogram("qr_print_stage_seconds", "Время этапа печати этикетки", ("stage",))
+
+
+def mm_to_px(mm, dpi=PRINTER_DPI):
+    """Конвертация миллиметров в пиксели принтера"""
+    return int(mm / 25.4 * dpi)
+
+
+def matrix_from_pixels(width: int, height: int, pixels: bytes) -> np.ndarray:
+    """
+    Матрица модулей (True — чёрный) из RGB-картинки pylibdmtx.
+    Размер модуля определяем по первому ряду символа: у Data Matrix он
+    начинается с чёрного модуля и дальше чередуется (граница «часов»).
+    """
+    dark = np.frombuffer(pixels, dtype=np.uint8).reshape(height, width, 3)[:, :, 0] < 128
+    rows = np.flatnonzero(dark.any(axis=1))
+    cols = np.flatnonzero(dark.any(axis=0))
+    if rows.size == 0:
+        raise ValueError("pylibdmtx вернул пустое изображение")
+    symbol = dark[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    top = symbol[0]
+    module = int(np.argmin(top)) if not top.all() else symbol.shape[1]
+    half = module // 2
+    return symbol[half::module, half::module].copy()
+
+
+def encode_matrix(text: str) -> np.ndarray:
+    """Data Matrix для текста в виде матрицы модулей (True — чёрный), без тихой зоны"""
+    if DM_ENCODER == "builtin" or DM_GS1:
+        return dm_encoder.encode_matrix(text, gs1=DM_GS1)
+    # Импорт здесь: при встроенном кодировщике libdmtx вообще не загружается
+    from pylibdmtx.pylibdmtx import encode
+
+    encoded = encode(text.encode('utf-8'))
+    return matrix_from_pixels(encoded.width, encoded.height, encoded.pixels)
+
+
+def quiet_zone_modules(size: int) -> int:
+    """Тихая зона (белая рамка) в модулях для символа size x size — обязательна для надёжного сканирования"""
+    return max(2, size // 4)
+
+
+def module_px(n_modules: int, page_w: int, page_h: int, fill_ratio: float = QR_FILL_RATIO) -> int:
+    """Размер модуля в пикселях: символ из n_modules (с тихой зоной) занимает не больше fill_ratio меньшей стороны"""
+    qr_size = max(MIN_QR_SIZE, int(min(page_w, page_h) * fill_ratio))
+    return max(1, qr_size // n_modules)
+
+
+def symbol_placement(size: int, page_w: int, page_h: int, fill_ratio: float = QR_FILL_RATIO):
+    """
+    (модуль в пикселях, x, y) символа size x size модулей — так же, как его рисует render_matrix:
+    по центру страницы, x/y — левый верхний угол самого символа (без тихой зоны).
+    Нужно для языков принтера, где код рисует сам принтер.
+    """
+    qz = quiet_zone_modules(size)
+    padded = size + 2 * qz
+    scale = module_px(padded, page_w, page_h, fill_ratio)
+    x = max(0, (page_w - padded * scale) // 2) + qz * scale
+    y = max(0, (page_h - padded * scale) // 2) + qz * scale
+    return scale, x, y
+
+
+def render_matrix(matrix: np.ndarray, page_w: int, page_h: int, fill_ratio: float = QR_FILL_RATIO) -> Image.Image:
+    """
+    Этикетка page_w x page_h (режим '1') с кодом по центру. Код вместе с тихой зоной
+    занимает не больше fill_ratio меньшей стороны; каждый модуль — целое число пикселей.
+    """
+    qz = quiet_zone_modules(min(matrix.shape))
+    padded = np.pad(matrix, qz, constant_values=False)
+    scale = module_px(padded.shape[0], page_w, page_h, fill_ratio)
+    symbol = np.repeat(np.repeat(padded, scale, axis=0), scale, axis=1)
+
+    # В режиме '1' True — белый пиксель
+    canvas = np.ones((page_h, page_w), dtype=bool)
+    size_h, size_w = min(symbol.shape[0], page_h), min(symbol.shape[1], page_w)
+    x = max(0, (page_w - size_w) // 2)
+    y = max(0, (page_h - size_h) // 2)
+    canvas[y:y + size_h, x:x + size_w] = ~symbol[:size_h, :size_w]
+    return Image.frombytes('1', (page_w, page_h), np.packbits(canvas, axis=1).tobytes())
+
+
+def render_label(text: str, page_w: int, page_h: int, fill_ratio: float = QR_FILL_RATIO) -> Image.Image:
+    """Полная этикетка page_w x page_h с кодом по центру"""
+    with STAGE_SECONDS.time(stage="encode"):
+        matrix = encode_matrix(text)
+    with STAGE_SECONDS.time(stage="render"):
+        return render_matrix(matrix, page_w, page_h, fill_ratio)
+
+
+def _image_bytes(img: Image.Image) -> int:
+    if img.mode == '1':
+        return (img.width + 7) // 8 * img.height
+    return img.width * img.height * len(img.getbands())
+
+
+class LabelCache:
+    """LRU-кэш этикеток, ограниченный суммарным размером картинок в байтах. Потокобезопасный."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            img = self._items.get(key)
+            if img is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return img
+
+    def put(self, key, img: Image.Image):
+        nbytes = _image_bytes(img)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= _image_bytes(old)
+            self._items[key] = img
+            self.size += nbytes
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= _image_bytes(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"items": len(self._items), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+
+label_cache = LabelCache(int(LABEL_CACHE_MB * 1024 * 1024))
+
+
+def get_label(text: str, page_w: int, page_h: int, fill_ratio: float = QR_FILL_RATIO) -> Image.Image:
+    """
+    Этикетка из кэша или свежесгенерированная. Возвращаемую картинку нельзя менять:
+    она может быть отдана повторно.
+    """
+    key = (text, page_w, page_h, fill_ratio)
+    img = label_cache.get(key)
+    if img is None:
+        img = render_label(text, page_w, page_h, fill_ratio)
+        label_cache.put(key, img)
+    return img
@@ -0,0 +1,370 @@
+"""
+Нагрузочный тест server.py: поднимает сервер локально (uvicorn в отдельном процессе, очередь
+и история — во временной папке), N «телефонов» шлют сканы пачками, как кладовщик со сканером,
+M клиентов печати забирают задания (long-poll /get-jobs, обычный опрос или WebSocket) и
+подтверждают их. В конце — пропускная способность, задержки p50/p95/p99 (запрос /send-to-print,
+от скана до получения клиентом печати) и глубина очереди по времени.
+
+    python load_test.py --phones 20 --consumers 2 --duration 30
+    python load_test.py --queue-url memory:// --consumer ws --json memory_ws.json
+    python load_test.py --workers 4 --phones 100 --stations 4 --json sqlite_4w.json
+    python load_test.py --url http://192.168.1.50:8000 --phones 5      # уже запущенный сервер
+
+--json сохраняет настройки и результаты, чтобы сравнивать конфигурации перед выкаткой.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+_dir = os.path.dirname(os.path.abspath(__file__))
+# Станция, когда --stations 1 (как у телефона без ?station=)
+DEFAULT_STATION = "default"
+# Сколько ждать запуска сервера и дочитывания очереди после окончания теста (сек)
+STARTUP_TIMEOUT = 30
+DRAIN_TIMEOUT = 15
+
+
+def percentile(values: list, p: float) -> float:
+    """p-й процентиль (0..100) ближайшим рангом; None для пустого списка"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def latency_summary(values: list) -> dict:
+    """Задержки в мс: count, p50, p95, p99, max"""
+    ms = [v * 1000 for v in values]
+    return {"count": len(ms), "p50": percentile(ms, 50), "p95": percentile(ms, 95),
+            "p99": percentile(ms, 99), "max": max(ms) if ms else None}
+
+
+class Stats:
+    def __init__(self):
+        self.started = time.monotonic()
+        # data -> момент отправки скана (для задержки «скан -> клиент печати»)
+        self.sent_at = {}
+        self.enqueued = 0
+        self.duplicates = 0
+        self.received = 0
+        self.redelivered = 0
+        self.errors = {}
+        self.send_latency = []
+        self.end_to_end = []
+        self.timeline = []
+        # Сколько сек телефоны сканировали и сколько длился тест вместе с дочитыванием очереди
+        self.produce_sec = 0.0
+        self.total_sec = 0.0
+
+    def error(self, where: str, e):
+        name = f"{where}: {type(e).__name__}" if isinstance(e, Exception) else f"{where}: {e}"
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def job_received(self, data: str):
+        sent = self.sent_at.pop(data, None)
+        if sent is None:
+            # Задание выдано повторно (аренда истекла до /ack) или не из этого теста
+            self.redelivered += 1
+            return
+        self.received += 1
+        self.end_to_end.append(time.monotonic() - sent)
+
+
+def scan_code(phone: int, n: int) -> str:
+    """Уникальный код вида «Честного знака»: 01<GTIN>21<серийный>\\x1d93<ключ>"""
+    serial = f"{phone:04d}{n:07d}" + "".join(random.choices(string.ascii_letters, k=2))
+    return f"0104600000{phone % 10000:04d}21{serial}\x1d93" + "".join(random.choices(string.ascii_letters, k=4))
+
+
+async def phone(session, base: str, station: str, index: int, args, stats: Stats, deadline: float):
+    """Телефон: пачка сканов с интервалом scan_interval, затем пауза ~ pause (экспоненциально)"""
+    n = 0
+    await asyncio.sleep(random.uniform(0, args.pause))
+    while time.monotonic() < deadline:
+        for _ in range(random.randint(1, args.burst)):
+            if time.monotonic() >= deadline:
+                return
+            n += 1
+            data = scan_code(index, n)
+            started = time.monotonic()
+            stats.sent_at[data] = started
+            try:
+                async with session.post(f"{base}/send-to-print", params={"station": station},
+                                        json={"data": data}) as response:
+                    body = await response.json()
+                    if response.status != 200:
+                        stats.error("send-to-print", response.status)
+                        stats.sent_at.pop(data, None)
+                        continue
+            except Exception as e:
+                stats.error("send-to-print", e)
+                stats.sent_at.pop(data, None)
+                continue
+            stats.send_latency.append(time.monotonic() - started)
+            if body.get("duplicate"):
+                stats.duplicates += 1
+            else:
+                stats.enqueued += 1
+            await asyncio.sleep(random.uniform(0.5, 1.5) * args.scan_interval)
+        pause = random.expovariate(1 / args.pause) if args.pause > 0 else 0
+        await asyncio.sleep(min(pause, max(0.0, deadline - time.monotonic())))
+
+
+async def consumer_poll(session, base: str, station: str, args, stats: Stats, stop: asyncio.Event):
+    """Клиент печати через /get-jobs: long-poll (wait>0) или опрос каждые poll_interval сек"""
+    wait = args.poll_wait if args.consumer == "long-poll" else 0
+    while not stop.is_set():
+        try:
+            async with session.get(f"{base}/get-jobs", params={"station": station, "max": args.max_jobs,
+                                                              "wait": wait}) as response:
+                jobs = (await response.json()).get("jobs", [])
+            for job in jobs:
+                stats.job_received(job["data"])
+            if jobs:
+                async with session.post(f"{base}/ack", params={"station": station},
+                                        json={"ids": [job["id"] for job in jobs]}) as response:
+                    await response.read()
+            elif args.consumer == "poll":
+                await asyncio.sleep(args.poll_interval)
+        except Exception as e:
+            stats.error("get-jobs", e)
+            await asyncio.sleep(0.5)
+
+
+async def consumer_ws(session, base: str, station: str, args, stats: Stats, stop: asyncio.Event):
+    """Клиент печати через WebSocket /ws-jobs (как main.py)"""
+    url = base.replace("http", "ws", 1) + "/ws-jobs"
+    while not stop.is_set():
+        try:
+            async with session.ws_connect(url, params={"station": station}) as ws:
+                while not stop.is_set():
+                    try:
+                        msg = await ws.receive(timeout=0.5)
+                    except asyncio.TimeoutError:
+                        continue
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    jobs = json.loads(msg.data).get("jobs", [])
+                    for job in jobs:
+                        stats.job_received(job["data"])
+                    await ws.send_json({"ack": [job["id"] for job in jobs]})
+        except Exception as e:
+            stats.error("ws-jobs", e)
+            await asyncio.sleep(0.5)
+
+
+async def sample_depth(session, base: str, args, stats: Stats, stop: asyncio.Event):
+    """Раз в sample_sec: глубина очередей (сумма qr_queue_depth с /metrics) и счётчики теста"""
+    while not stop.is_set():
+        depth = None
+        try:
+            async with session.get(f"{base}/metrics") as response:
+                text = await response.text()
+            depth = sum(int(float(line.rsplit(" ", 1)[1])) for line in text.splitlines()
+                        if line.startswith("qr_queue_depth{"))
+        except Exception as e:
+            stats.error("metrics", e)
+        stats.timeline.append({"t": round(time.monotonic() - stats.started, 1), "depth": depth,
+                               "enqueued": stats.enqueued, "received": stats.received,
+                               "in_flight": len(stats.sent_at)})
+        try:
+            await asyncio.wait_for(stop.wait(), args.sample_sec)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_load(base: str, args) -> Stats:
+    stats = Stats()
+    stations = [DEFAULT_STATION] if args.stations == 1 else [f"load{i}" for i in range(args.stations)]
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=args.poll_wait + 30)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        stop_consumers = asyncio.Event()
+        stop_sampler = asyncio.Event()
+        consume = consumer_ws if args.consumer == "ws" else consumer_poll
+        background = [asyncio.create_task(consume(session, base, stations[i % len(stations)], args, stats,
+                                                  stop_consumers))
+                      for i in range(args.consumers)]
+        background.append(asyncio.create_task(sample_depth(session, base, args, stats, stop_sampler)))
+
+        deadline = time.monotonic() + args.duration
+        await asyncio.gather(*(phone(session, base, stations[i % len(stations)], i, args, stats, deadline)
+                               for i in range(args.phones)))
+        produced_at = time.monotonic()
+
+        # Дочитываем то, что осталось в очереди
+        drain_until = time.monotonic() + DRAIN_TIMEOUT
+        while stats.sent_at and time.monotonic() < drain_until:
+            await asyncio.sleep(0.1)
+        stats.produce_sec = produced_at - stats.started
+        stats.total_sec = time.monotonic() - stats.started
+
+        stop_consumers.set()
+        stop_sampler.set()
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+    return stats
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, tmp: str):
+    """uvicorn server:app в отдельном процессе: нагрузка и сервер не делят один event loop"""
+    port = _free_port()
+    env = dict(os.environ)
+    env["QUEUE_URL"] = args.queue_url or os.path.join(tmp, "print_queue.db")
+    env["HISTORY_DB"] = os.path.join(tmp, "scan_history.db")
+    env["WORKERS"] = str(args.workers)
+    # Все «телефоны» идут с 127.0.0.1 — ограничение частоты по адресу мерило бы само себя
+    env.setdefault("RATE_LIMIT_PER_SEC", "0")
+    # Страницу сканера нагрузка не открывает — сервер запускается и без скачанной html5-qrcode
+    env.setdefault("HTML5_QRCODE_CDN", "1")
+    cmd = [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+           # Висящие long-poll запросы при остановке не дожидаемся
+           "--timeout-graceful-shutdown", "2"]
+    # Вывод сервера — в файл: показываем его, если сервер не запустился или падал во время теста
+    log = open(os.path.join(tmp, "server.log"), "w+", encoding="utf-8")
+    proc = subprocess.Popen(cmd, cwd=_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    proc.log = log
+    base = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    while time.monotonic() - started < STARTUP_TIMEOUT:
+        if proc.poll() is not None:
+            raise SystemExit(f"Сервер не запустился (код {proc.returncode}):\n{_read_log(proc)}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return proc, base
+        except OSError:
+            time.sleep(0.1)
+    stop_server(proc)
+    raise SystemExit(f"Сервер не ответил за {STARTUP_TIMEOUT} сек:\n{_read_log(proc)}")
+
+
+def _read_log(proc) -> str:
+    proc.log.flush()
+    proc.log.seek(0)
+    return proc.log.read()
+
+
+def stop_server(proc):
+    # Что сервер писал до остановки (ошибки обработчиков); сообщения самой остановки не нужны
+    output = _read_log(proc).strip()
+    if output:
+        print(f"\nВывод сервера:\n{output}")
+    proc.terminate()
+    try:
+        proc.wait(10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+    proc.log.close()
+
+
+def report(stats: Stats) -> dict:
+    return {
+        "enqueued": stats.enqueued,
+        "duplicates": stats.duplicates,
+        "received": stats.received,
+        "lost": len(stats.sent_at),
+        "redelivered": stats.redelivered,
+        "errors": stats.errors,
+        "enqueue_per_sec": round(stats.enqueued / stats.produce_sec, 1),
+        "dequeue_per_sec": round(stats.received / stats.total_sec, 1),
+        "send_latency_ms": latency_summary(stats.send_latency),
+        "end_to_end_ms": latency_summary(stats.end_to_end),
+        "max_depth": max((s["depth"] for s in stats.timeline if s["depth"] is not None), default=None),
+        "timeline": stats.timeline,
+    }
+
+
+def print_report(result: dict):
+    def row(name, s):
+        if not s["count"]:
+            return f"  {name:34} —"
+        return (f"  {name:34} p50 {s['p50']:8.1f}  p95 {s['p95']:8.1f}  p99 {s['p99']:8.1f}  "
+                f"max {s['max']:8.1f} мс  (n={s['count']})")
+
+    print("\nГлубина очереди по времени:")
+    print(f"  {'t, с':>6} {'в очереди':>10} {'отправлено':>11} {'получено':>9} {'в пути':>7}")
+    for s in result["timeline"]:
+        depth = "—" if s["depth"] is None else str(s["depth"])
+        print(f"  {s['t']:6.1f} {depth:>10} {s['enqueued']:11} {s['received']:9} {s['in_flight']:7}")
+    print(f"\nПоставлено в очередь: {result['enqueued']} ({result['enqueue_per_sec']}/с), "
+          f"дублей: {result['duplicates']}")
+    print(f"Получено клиентами печати: {result['received']} ({result['dequeue_per_sec']}/с), "
+          f"не дошло: {result['lost']}, повторных выдач: {result['redelivered']}")
+    print(f"Максимальная глубина очереди: {result['max_depth']}")
+    print("Задержки:")
+    print(row("/send-to-print", result["send_latency_ms"]))
+    print(row("скан -> клиент печати", result["end_to_end_ms"]))
+    if result["errors"]:
+        print("Ошибки:")
+        for name, count in sorted(result["errors"].items()):
+            print(f"  {name}: {count}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест server.py")
+    parser.add_argument("--url", help="не запускать сервер, а нагружать уже работающий (http://host:port)")
+    parser.add_argument("--queue-url", help="QUEUE_URL запускаемого сервера (по умолчанию SQLite во временной папке)")
+    parser.add_argument("--workers", type=int, default=1, help="процессов uvicorn (по умолчанию 1)")
+    parser.add_argument("--phones", type=int, default=10, help="телефонов-сканеров (по умолчанию 10)")
+    parser.add_argument("--consumers", type=int, default=1, help="клиентов печати (по умолчанию 1)")
+    parser.add_argument("--stations", type=int, default=1, help="станций: телефоны и клиенты делятся по кругу")
+    parser.add_argument("--consumer", choices=("long-poll", "poll", "ws"), default="long-poll",
+                        help="как клиент печати получает задания (по умолчанию long-poll)")
+    parser.add_argument("--duration", type=float, default=20, help="сколько секунд телефоны сканируют")
+    parser.add_argument("--burst", type=int, default=20, help="до стольких сканов подряд в пачке")
+    parser.add_argument("--scan-interval", type=float, default=0.3, help="секунд между сканами в пачке")
+    parser.add_argument("--pause", type=float, default=3.0, help="средняя пауза между пачками, сек")
+    parser.add_argument("--max-jobs", type=int, default=10, help="?max= для /get-jobs")
+    parser.add_argument("--poll-wait", type=float, default=25, help="?wait= для long-poll")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="период обычного опроса, сек")
+    parser.add_argument("--sample-sec", type=float, default=1.0, help="период замера глубины очереди, сек")
+    parser.add_argument("--json", help="сохранить настройки и результаты в файл")
+    args = parser.parse_args(argv)
+
+    if args.url is None and args.workers > 1 and (args.queue_url or "").startswith("memory:"):
+        parser.error("--queue-url memory:// нельзя с --workers > 1")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        proc = None
+        base = args.url.rstrip("/") if args.url else None
+        if base is None:
+            proc, base = start_server(args, tmp)
+        print(f"Сервер: {base}; телефонов {args.phones}, клиентов печати {args.consumers} ({args.consumer}), "
+              f"станций {args.stations}, {args.duration:g} сек")
+        try:
+            stats = asyncio.run(run_load(base, args))
+        finally:
+            if proc is not None:
+                stop_server(proc)
+
+    result = report(stats)
+    print_report(result)
+    if args.json:
+        config = {k: v for k, v in vars(args).items() if k != "json"}
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "result": result}, f, ensure_ascii=False, indent=2)
+        print(f"Результаты: {args.json}")
+    # Для скриптов: 1, если часть сканов так и не дошла до клиентов печати
+    return 1 if result["lost"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,22 @@
 import time
+_STARTED = time.perf_counter()
 import asyncio
-import aiohttp
 import ssl
 import os
+import sys
 import datetime
-import win32print
-import win32ui
-import win32con
-from PIL import Image, ImageWin
-from pylibdmtx.pylibdmtx import encode
-from pynput import keyboard
-from openpyxl import Workbook, load_workbook
-from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+import threading
+from concurrent.futures import Future
 from dotenv import load_dotenv
 
+# Здесь только лёгкие модули: pynput, aiohttp, NumPy/PIL, libdmtx, win32 и openpyxl загружаются
+# при первом использовании или в фоне, когда сканер уже принимает коды
+import metrics
+from print_pipeline import PrintPipeline
+from expiring import ExpiringSet
+from scanner_input import ScannerInput
+from scan_journal import ScanJournal, export_xlsx
+
 load_dotenv()
 
 # --- НАСТРОЙКИ ---
@@ -21,229 +24,222 @@ SERVER_IP = "84.54.29.24"
 SERVER_DOMAIN = "fffzar-tool.ru"
 # Используем HTTPS после настройки SSL
 SERVER_URL = f"https://{SERVER_DOMAIN}"
-HISTORY_FOLDER = "history"
-# При каждом запуске — новый отчёт: report_дд-мм-гггг_чч-мм.xlsx
-EXCEL_FILE = f"report_{datetime.datetime.now().strftime('%d-%m-%Y_%H-%M')}.xlsx"
+# Станция печати: клиент получает только задания своей очереди (?station=X на странице телефона)
+STATION = os.environ.get("STATION", "default")
+# Порт метрик клиента (http://localhost:PORT/metrics); пусто — не поднимать
+METRICS_PORT = os.environ.get("METRICS_PORT", "")
+# Адрес метрик: по умолчанию только этот компьютер; 0.0.0.0 — доступны всей сети (для Prometheus на сервере)
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+# STARTUP_PROFILE=1 — печатать, сколько мс от запуска занял каждый этап старта
+STARTUP_PROFILE = os.environ.get("STARTUP_PROFILE", "0").lower() in ("1", "true", "yes")
+# При каждом запуске — новый отчёт: сканы пишутся в журнал report_дд-мм-гггг_чч-мм.csv,
+# report_дд-мм-гггг_чч-мм.xlsx собирается из него при выходе (или: python scan_journal.py журнал.csv)
+REPORT_NAME = f"report_{datetime.datetime.now().strftime('%d-%m-%Y_%H-%M')}"
+JOURNAL_FILE = f"{REPORT_NAME}.csv"
+EXCEL_FILE = f"{REPORT_NAME}.xlsx"
+
+# Журнал и история этикеток (код + параметры, картинки — в пачках по дням, см. label_history.py)
+# открываются в фоне при старте (open_storage); этап сохранения ждёт их готовности
+journal = None
+history = None
+_storage_ready = threading.Event()
+
+
+def startup_log(stage):
+    if STARTUP_PROFILE:
+        print(f"[старт] {(time.perf_counter() - _STARTED) * 1000:7.0f} мс  {stage}")
+
+
+def open_storage():
+    global journal, history
+    try:
+        journal = ScanJournal(JOURNAL_FILE)
+        from label_history import HistoryStore
+        history = HistoryStore()
+    finally:
+        _storage_ready.set()
+    startup_log("журнал и история открыты")
 
-# Создаем папку для истории, если её нет
-if not os.path.exists(HISTORY_FOLDER):
-    os.makedirs(HISTORY_FOLDER)
 
-def save_to_report(text, file_path):
-    """Записывает данные о сканировании в Excel"""
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    if not os.path.exists(EXCEL_FILE):
-        wb = Workbook()
-        ws = wb.active
-        ws.append(["Дата и время", "Содержимое кода", "Имя файла"])
-    else:
-        wb = load_workbook(EXCEL_FILE)
-        ws = wb.active
+def warm_up():
+    """Фоновый старт: хранилища, затем ждём прогрева конвейера (принтер, кодировщик)"""
+    open_storage()
+    pipeline.ready.wait()
+    if STARTUP_PROFILE:
+        steps = ", ".join(f"{name} {sec * 1000:.0f} мс" for name, sec in pipeline.warmup.items())
+        startup_log(f"печать готова ({steps})")
 
-    ws.append([timestamp, ILLEGAL_CHARACTERS_RE.sub(r'', text), os.path.basename(file_path)])
-    wb.save(EXCEL_FILE)
 
-# Размер этикетки 58×40 мм, DPI термопринтера (обычно 203)
-LABEL_MM = (58, 40)
-PRINTER_DPI = 203
-QR_FILL_RATIO = float(os.environ.get("QR_FILL_RATIO", "0.82"))  # было 0.9; 0.82 безопаснее для полей/перекоса ленты
+def save_to_report(text, label_key):
+    """Записывает данные о сканировании в журнал (на диск — пачками, см. scan_journal.py)"""
+    journal.append(text, label_key)
 
 
-def mm_to_px(mm, dpi=PRINTER_DPI):
-    """Конвертация миллиметров в пиксели принтера"""
-    return int(mm / 25.4 * dpi)
-
+def write_excel_report():
+    """Дописать журнал и собрать из него отчёт Excel"""
+    if journal is None:
+        return
+    journal.close()
+    try:
+        count = export_xlsx(JOURNAL_FILE, EXCEL_FILE)
+        print(f"Отчёт: {count} строк -> {EXCEL_FILE}")
+    except Exception as e:
+        print(f"Не удалось собрать отчёт {EXCEL_FILE}: {e} (журнал: {JOURNAL_FILE})")
 
-# --- Печать: пытаемся зафиксировать формат 58x40 в драйвере и всегда опираемся на реальные размеры DC ---
-def _dmpaper_user_const() -> int:
-    # В некоторых сборках pywin32 константа может отсутствовать
-    return int(getattr(win32con, "DMPAPER_USER", 256))
 
+def history_keeps_images() -> bool:
+    """Нужна ли истории картинка этикетки (HISTORY_IMAGES); пока история не открыта — считаем, что нужна"""
+    return history is None or history.images
 
-def build_label_devmode(printer_name: str, width_mm: int, height_mm: int):
-    """
-    Возвращает DEVMODE с кастомным размером бумаги (в 0.1 мм), если драйвер это поддерживает.
-    Даже если драйвер проигнорирует, дальше мы всё равно используем реальные DeviceCaps.
-    """
-    try:
-        hPrinter = win32print.OpenPrinter(printer_name)
-        try:
-            info2 = win32print.GetPrinter(hPrinter, 2)
-            devmode = info2.get("pDevMode")
-            if devmode is None:
-                return None
-
-            devmode.Fields |= (
-                win32con.DM_PAPERSIZE
-                | win32con.DM_PAPERWIDTH
-                | win32con.DM_PAPERLENGTH
-                | win32con.DM_ORIENTATION
-            )
-            devmode.PaperSize = _dmpaper_user_const()
-            devmode.PaperWidth = int(width_mm * 10)   # 0.1 мм
-            devmode.PaperLength = int(height_mm * 10) # 0.1 мм
-            devmode.Orientation = (
-                win32con.DMORIENT_LANDSCAPE
-                if width_mm >= height_mm
-                else win32con.DMORIENT_PORTRAIT
-            )
-            return devmode
-        finally:
-            win32print.ClosePrinter(hPrinter)
-    except Exception as e:
-        print(f"Не удалось подготовить настройки бумаги принтера (DEVMODE): {e}")
-        return None
 
+def save_history(text, label_img):
+    """Этап сохранения: этикетка в историю (новый код — с картинкой) и строка в журнал"""
+    from label_render import STAGE_SECONDS
 
-def create_printer_dc(printer_name: str, label_mm: tuple[int, int] = LABEL_MM):
-    """
-    Создаёт DC принтера; пытается выставить нужный размер этикетки через DEVMODE.
-    """
-    devmode = build_label_devmode(printer_name, label_mm[0], label_mm[1])
-    hDC = win32ui.CreateDC()
+    _storage_ready.wait()
+    with STAGE_SECONDS.time(stage="history"):
+        key = history.add(text, label_img)
+    with STAGE_SECONDS.time(stage="journal"):
+        save_to_report(text, key)
 
-    if devmode is not None:
-        try:
-            # CreateDC(driver, device, output, devmode)
-            hDC.CreateDC("WINSPOOL", printer_name, None, devmode)
-            return hDC
-        except Exception as e:
-            print(f"DEVMODE не применился, печатаю с настройками драйвера по умолчанию: {e}")
 
-    hDC.CreatePrinterDC(printer_name)
-    return hDC
+def create_printer():
+    """Принтер: PRINTER=gdi (по умолчанию), gdi:Имя, file:путь или tcp://host:port — см. printer_backend.py"""
+    from printer_backend import create_printer
+    return create_printer()
 
 
-def get_dc_page_px(hDC) -> tuple[int, int]:
-    """
-    Размер печатаемой области (в пикселях устройства) для текущих настроек драйвера.
-    """
-    w = int(hDC.GetDeviceCaps(win32con.HORZRES) or 0)
-    h = int(hDC.GetDeviceCaps(win32con.VERTRES) or 0)
-    return w, h
+# Отрисовка, печать и сохранение — в своих потоках (см. print_pipeline.py);
+# принтер создаётся и прогревается в потоке отрисовки
+pipeline = PrintPipeline(create_printer, persist=save_history, persist_images=history_keeps_images)
 
 
-# Защита от дублей: один и тот же код не печатаем повторно в течение 5 сек
-_last_printed = {}
+# Защита от дублей: один и тот же код не печатаем повторно в течение _DEDUP_SEC сек
 _DEDUP_SEC = 2
+_last_printed = ExpiringSet(_DEDUP_SEC)
+_last_printed_lock = threading.Lock()
+_first_scan = threading.Event()
 
 
-def process_and_print(text):
-    """Генерация, сохранение, логирование и печать"""
-    global _last_printed
-    now = time.time()
-    if text in _last_printed and (now - _last_printed[text]) < _DEDUP_SEC:
+def process_and_print(text) -> Future:
+    """
+    Ставит код в конвейер печати и сразу возвращается.
+    Future -> True, если этикетка отправлена на принтер (или это дубль только что напечатанной).
+    """
+    with _last_printed_lock:
+        is_new = _last_printed.add(text)
+    if not is_new:
         print(f"Пропуск дубля: {text[:30]}...")
-        return
-    _last_printed[text] = now
-    # Очистка старых записей
-    _last_printed = {k: v for k, v in _last_printed.items() if now - v < 60}
+        fut = Future()
+        fut.set_result(True)
+        return fut
 
     print(f"Обработка: {text}")
-    try:
-        # 1. Генерация Data Matrix
-        encoded = encode(text.encode('utf-8'))
-        img = Image.frombytes('RGB', (encoded.width, encoded.height), encoded.pixels)
-
-        # Тихая зона (белая рамка) — обязательна для надёжного сканирования
-        quiet_zone = max(2, min(encoded.width, encoded.height) // 4)
-        w, h = img.size
-        padded = Image.new('RGB', (w + 2 * quiet_zone, h + 2 * quiet_zone), 'white')
-        padded.paste(img, (quiet_zone, quiet_zone))
-        img = padded
-
-        # 2. Создаём DC заранее и берём РЕАЛЬНЫЙ размер страницы у принтера
-        printer_name = win32print.GetDefaultPrinter()
-        hDC = create_printer_dc(printer_name, LABEL_MM)
-        try:
-            page_w, page_h = get_dc_page_px(hDC)
-
-            # Фолбэк, если драйвер вернул 0 (редко, но бывает)
-            if page_w <= 0 or page_h <= 0:
-                dpi_x = int(hDC.GetDeviceCaps(win32con.LOGPIXELSX) or PRINTER_DPI)
-                dpi_y = int(hDC.GetDeviceCaps(win32con.LOGPIXELSY) or PRINTER_DPI)
-                page_w = mm_to_px(LABEL_MM[0], dpi_x)
-                page_h = mm_to_px(LABEL_MM[1], dpi_y)
-
-            # Лог полезен для диагностики "вдруг драйвер сменил бумагу/ориентацию"
-            try:
-                dpi_x = int(hDC.GetDeviceCaps(win32con.LOGPIXELSX) or 0)
-                dpi_y = int(hDC.GetDeviceCaps(win32con.LOGPIXELSY) or 0)
-                print(f"Принтер: {printer_name} | page={page_w}x{page_h}px | dpi={dpi_x}x{dpi_y}")
-            except Exception:
-                pass
-
-            # 3. QR/DM занимает заданную долю меньшей стороны; не меньше 80 px — иначе принтер "размазывает"
-            min_qr_size = 80
-            qr_size = max(min_qr_size, int(min(page_w, page_h) * QR_FILL_RATIO))
-            img = img.resize((qr_size, qr_size), Image.NEAREST)
-
-            # 4. Создаём полную этикетку с центрированным QR
-            label_img = Image.new('RGB', (page_w, page_h), 'white')
-            x = max(0, (page_w - qr_size) // 2)
-            y = max(0, (page_h - qr_size) // 2)
-            label_img.paste(img, (x, y))
-
-            # 5. Сохранение в папку истории с уникальным именем
-            file_name = f"scan_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.png"
-            full_path = os.path.join(HISTORY_FOLDER, file_name)
-            label_img.save(full_path)
-
-            # 6. Запись в Excel
-            save_to_report(text, full_path)
-
-            # 7. Печать всей этикетки (ровно в размеры страницы DC)
-            hDC.StartDoc("DM_Job")
-            hDC.StartPage()
-            dib = ImageWin.Dib(label_img)
-            dib.draw(hDC.GetHandleOutput(), (0, 0, page_w, page_h))
-            hDC.EndPage()
-            hDC.EndDoc()
-            print(f"Успешно: данные сохранены и отправлены на принтер.")
-        finally:
-            try:
-                hDC.DeleteDC()
-            except Exception:
-                pass
-        
-    except Exception as e:
-        print(f"Ошибка при обработке: {e}")
+    fut = pipeline.submit(text)
+    if not _first_scan.is_set():
+        _first_scan.set()
+        startup_log("первый код принят")
+    return fut
 
-# --- Логика перехвата (USB/Bluetooth сканер) ---
-buffer = []
+# --- Перехват сканера (USB/Bluetooth в режиме клавиатуры), см. scanner_input.py ---
+scanner = ScannerInput()
 
-last_key_time = 0
-is_scanner_typing = True
 
-def on_press(key):
-    global buffer, last_key_time, is_scanner_typing
-    
-    current_time = time.time()
-    # Считаем время с момента прошлого нажатия
-    delay = current_time - last_key_time
-    last_key_time = current_time
+def dispatch_scans():
+    """Готовые коды из перехвата — в печать (хук клавиатуры сам ничего не ждёт)"""
+    while True:
+        process_and_print(scanner.codes.get())
 
-    # Если пауза между буквами больше 50мс — это скорее всего человек
-    if delay > 0.05:
-        is_scanner_typing = False
+# --- Связь с сервером (WebSocket push / HTTP long-poll) ---
+# Сколько секунд сервер держит long-poll запрос /get-job?wait=N, если очередь пуста
+LONG_POLL_SEC = 25
+# Интервал опроса, если сервер не поддерживает long-poll (старая версия отвечает сразу)
+POLL_INTERVAL_SEC = 2
+# Сколько заданий забирать за один запрос /get-jobs
+JOBS_BATCH = 20
+
+
+def _ws_url(http_url):
+    """https://host -> wss://host, http://host -> ws://host"""
+    if http_url.startswith("https://"):
+        return "wss://" + http_url[len("https://"):]
+    if http_url.startswith("http://"):
+        return "ws://" + http_url[len("http://"):]
+    return http_url
+
+
+async def handle_jobs(data):
+    """
+    Ставит задания из ответа сервера в конвейер печати и ждёт их, не блокируя цикл событий.
+    Возвращает id напечатанных заданий — их нужно подтвердить (ack);
+    неподтверждённые сервер выдаст повторно после истечения аренды.
+    """
+    if data.get("status") != "ok":
+        return []
+    jobs = data.get("jobs") or []
+    if len(jobs) > 1:
+        print(f"Получена пачка заданий: {len(jobs)}")
+    pending = []
+    for job in jobs:
+        print(f"Получено задание: {job['data']}")
+        pending.append((job["id"], process_and_print(job["data"])))
+    done = []
+    for job_id, fut in pending:
+        if await asyncio.wrap_future(fut):
+            done.append(job_id)
+    return done
+
+
+async def listen_ws(session):
+    """Push-режим: сервер сам присылает задания по WebSocket, простоя без трафика нет (кроме ping)"""
+    import aiohttp
+
+    url = f"{_ws_url(SERVER_URL)}/ws-jobs"
+    async with session.ws_connect(url, params={"station": STATION}, heartbeat=30) as ws:
+        print(f"Подключено к серверу (WebSocket), станция: {STATION}")
+        async for msg in ws:
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                done = await handle_jobs(msg.json())
+                if done:
+                    await ws.send_json({"ack": done})
+            elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                break
+    raise ConnectionError("WebSocket закрыт сервером")
+
+
+async def listen_long_poll(session):
+    """
+    Фолбэк: long-poll /get-jobs?wait=N — ответ приходит сразу, как только появится задание.
+    Пока на сервере остаются задания, перезапрашиваем без ожидания.
+    """
+    import aiohttp
+
+    print(f"Подключено к серверу (long-poll), станция: {STATION}")
+    timeout = aiohttp.ClientTimeout(total=LONG_POLL_SEC + 10)
+    while True:
+        started = time.monotonic()
+        params = {"max": JOBS_BATCH, "wait": LONG_POLL_SEC, "station": STATION}
+        async with session.get(f"{SERVER_URL}/get-jobs", params=params, timeout=timeout) as response:
+            if response.status != 200:
+                raise ConnectionError(f"HTTP {response.status}")
+            data = await response.json()
+        if data.get("status") == "ok":
+            done = await handle_jobs(data)
+            if done:
+                async with session.post(f"{SERVER_URL}/ack", params={"station": STATION}, json={"ids": done},
+                                        timeout=aiohttp.ClientTimeout(total=10)) as response:
+                    if response.status != 200:
+                        print(f"Не удалось подтвердить задания {done}: HTTP {response.status}")
+        elif time.monotonic() - started < 1:
+            # Сервер без long-poll отвечает мгновенно — не долбим его в цикле
+            await asyncio.sleep(POLL_INTERVAL_SEC)
 
-    try:
-        if key == keyboard.Key.enter:
-            msg = "".join(buffer)
-            if is_scanner_typing and len(msg) > 15:
-                process_and_print(msg)
-
-            buffer = []
-            is_scanner_typing = True 
-        elif hasattr(key, 'char') and key.char:
-            buffer.append(key.char)
-    except:
-        pass
 
-# --- Связь с сервером (HTTP API) ---
 async def listen():
-    """Опрос сервера на наличие новых заданий для печати"""
+    """Получение заданий для печати: WebSocket, при недоступности — long-poll"""
+    import aiohttp
+
+    startup_log("aiohttp загружен")
     # Настройка SSL для работы в exe (отключаем проверку сертификата)
     ssl_context = ssl.create_default_context()
     ssl_context.check_hostname = False
@@ -256,13 +252,12 @@ async def listen():
         print(f"Подключение к серверу: {SERVER_URL}")
         while True:
             try:
-                async with session.get(f"{SERVER_URL}/get-job", timeout=aiohttp.ClientTimeout(total=10)) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data.get("status") == "ok" and data.get("data"):
-                            process_and_print(data["data"])
-                            print(f"Получено задание: {data['data']}")
-                    await asyncio.sleep(2)  # Проверка каждые 2 секунды
+                try:
+                    await listen_ws(session)
+                except aiohttp.WSServerHandshakeError as e:
+                    # Сервер/прокси не пускает WebSocket — переходим на long-poll
+                    print(f"WebSocket недоступен ({e.status}), переключаюсь на long-poll")
+                    await listen_long_poll(session)
             except asyncio.TimeoutError:
                 print("Таймаут подключения. Повтор через 5 сек...")
                 await asyncio.sleep(5)
@@ -271,5 +266,20 @@ async def listen():
                 await asyncio.sleep(5)
 
 if __name__ == "__main__":
-    keyboard.Listener(on_press=on_press).start()
-    asyncio.run(listen())
\ No newline at end of file
+    startup_log(f"модули загружены ({len(sys.modules)})")
+    scanner.start()
+    threading.Thread(target=dispatch_scans, name="scans", daemon=True).start()
+    startup_log("сканер принимает коды")
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    if METRICS_PORT:
+        metrics.serve(int(METRICS_PORT), host=METRICS_HOST)
+        print(f"Метрики: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    try:
+        asyncio.run(listen())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.close(timeout=10)
+        if history is not None:
+            history.close()
+        write_excel_report()
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""
+Конвейер печати: отрисовка -> печать -> сохранение (PNG/отчёт), у каждого этапа свой поток
+и своя ограниченная очередь. Поток клавиатуры и цикл опроса сервера только кладут код
+в очередь (submit) и не ждут ни диска, ни принтера.
+
+    pipeline = PrintPipeline(printer, persist=save_history)
+    fut = pipeline.submit(text)        # concurrent.futures.Future -> True/False (напечатано ли)
+    ok = await asyncio.wrap_future(fut)
+
+Всё, что накопилось в очереди печати, печатается одной пачкой (printer.batch()),
+результат отдаётся после того, как пачка ушла в спулер. Сохранение — после печати,
+его ошибки на результат не влияют.
+
+Картинка этикетки рисуется, только если она кому-то нужна: принтеру без своего языка или
+этапу сохранения (persist_images); иначе в печать и в persist уходит img=None.
+
+printer может быть функцией, создающей принтер: тогда NumPy/PIL, принтер и кодировщик
+загружаются в потоке отрисовки (ready — когда готово), а submit принимает коды сразу.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import Histogram
+
+# Сколько кодов может ждать отрисовки; дальше submit сразу отвечает False (сервер выдаст задание повторно)
+QUEUE_SIZE = 256
+# Готовых этикеток в очереди к принтеру — держим немного, чтобы отрисовка не убегала вперёд
+PRINT_QUEUE_SIZE = 16
+# Не больше этикеток в одном задании принтера
+MAX_BATCH = 50
+
+_STOP = object()
+
+# От submit до отправки на принтер (включая ожидание в очередях)
+LATENCY_SECONDS = Histogram("qr_print_latency_seconds", "От получения кода до отправки этикетки на принтер")
+
+
+class PrintPipeline:
+    def __init__(self, printer, persist=None, queue_size: int = QUEUE_SIZE, persist_images=True):
+        self.printer = printer
+        self.persist = persist
+        # Нужна ли persist картинка: bool или функция без аргументов (спрашивается на каждой этикетке)
+        self.persist_images = persist_images
+        # Прогрев в потоке отрисовки закончен; warmup — сколько сек занял каждый шаг
+        self.ready = threading.Event()
+        self.warmup = {}
+        # (printer.generation, размер страницы): page_size() берёт замок принтера, который поток
+        # печати держит всю пачку, поэтому спрашиваем его только после сброса сессии принтера
+        self._page = None
+        self._render_q = queue.Queue(queue_size)
+        self._print_q = queue.Queue(PRINT_QUEUE_SIZE)
+        self._persist_q = queue.Queue(queue_size)
+        self._threads = [
+            threading.Thread(target=self._render_loop, name="render", daemon=True),
+            threading.Thread(target=self._print_loop, name="print", daemon=True),
+            threading.Thread(target=self._persist_loop, name="persist", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, text: str) -> Future:
+        """Поставить код в печать, не блокируясь. Future -> True, если этикетка ушла на принтер."""
+        fut = Future()
+        fut.submitted = time.perf_counter()
+        try:
+            self._render_q.put_nowait((text, fut))
+        except queue.Full:
+            print(f"Очередь печати переполнена, пропуск: {text[:30]}...")
+            fut.set_result(False)
+        return fut
+
+    def close(self, timeout: float = None):
+        """Допечатать то, что уже в очереди, и остановить потоки"""
+        self._render_q.put(_STOP)
+        for t in self._threads:
+            t.join(timeout)
+
+    # --- Этапы ---
+
+    def _get_printer(self):
+        if not hasattr(self.printer, "print_label"):
+            self.printer = self.printer()
+        return self.printer
+
+    def _warm_up(self):
+        """Импорт отрисовки, создание принтера (для GDI — и DC), загрузка кодировщика (libdmtx)"""
+        started = time.perf_counter()
+        import label_render
+        self.warmup["imports"] = time.perf_counter() - started
+        try:
+            started = time.perf_counter()
+            printer = self._get_printer()
+            if self._needs_image(printer):
+                self._page_size(printer)
+                self.warmup["printer"] = time.perf_counter() - started
+                started = time.perf_counter()
+                label_render.encode_matrix("warm-up")
+                self.warmup["encoder"] = time.perf_counter() - started
+        except Exception as e:
+            # Ошибка повторится (и будет видна) на первом коде; здесь только сообщаем о ней заранее
+            print(f"Ошибка подготовки печати: {e}")
+        finally:
+            self.ready.set()
+
+    def _needs_image(self, printer) -> bool:
+        if not printer.native:
+            return True
+        if self.persist is None:
+            return False
+        return self.persist_images() if callable(self.persist_images) else self.persist_images
+
+    def _page_size(self, printer) -> tuple[int, int]:
+        generation = printer.generation
+        if self._page is None or self._page[0] != generation:
+            self._page = generation, printer.page_size()
+        return self._page[1]
+
+    def _render_loop(self):
+        # Импорт здесь, а не при загрузке модуля: запуск программы не ждёт NumPy/PIL
+        from label_render import STAGE_SECONDS, get_label
+
+        self._warm_up()
+        while True:
+            item = self._render_q.get()
+            if item is _STOP:
+                self._print_q.put(_STOP)
+                return
+            text, fut = item
+            try:
+                img = None
+                printer = self._get_printer()
+                if self._needs_image(printer):
+                    # Для GDI — создание DC (только при первой этикетке сессии)
+                    with STAGE_SECONDS.time(stage="page"):
+                        page_w, page_h = self._page_size(printer)
+                    # Повторы того же кода — из кэша (тогда encode/render не вызываются)
+                    img = get_label(text, page_w, page_h)
+            except Exception as e:
+                print(f"Ошибка при обработке: {e}")
+                fut.set_result(False)
+                continue
+            self._print_q.put((text, img, fut))
+
+    def _print_loop(self):
+        from label_render import STAGE_SECONDS
+
+        stop = False
+        while not stop:
+            item = self._print_q.get()
+            if item is _STOP:
+                break
+            # Всё, что уже готово, — одним заданием принтера
+            batch = [item]
+            while len(batch) < MAX_BATCH:
+                try:
+                    item = self._print_q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            results = []
+            try:
+                with self.printer.batch():
+                    for text, img, fut in batch:
+                        try:
+                            with STAGE_SECONDS.time(stage="print"), self.printer.job():
+                                self.printer.print_label(img, text)
+                            results.append(True)
+                        except Exception as e:
+                            print(f"Ошибка печати: {e}")
+                            results.append(False)
+            except Exception as e:
+                # Не закрылось задание пачки — считаем, что пачка не напечатана
+                print(f"Ошибка печати: {e}")
+                results = [False] * len(batch)
+
+            now = time.perf_counter()
+            for (text, img, fut), ok in zip(batch, results):
+                if ok:
+                    LATENCY_SECONDS.observe(now - fut.submitted)
+                    print("Успешно: этикетка отправлена на принтер.")
+                    if self.persist is not None:
+                        self._persist_q.put((text, img))
+                fut.set_result(ok)
+        self._persist_q.put(_STOP)
+
+    def _persist_loop(self):
+        from label_render import STAGE_SECONDS
+
+        while True:
+            item = self._persist_q.get()
+            if item is _STOP:
+                return
+            try:
+                with STAGE_SECONDS.time(stage="persist"):
+                    self.persist(*item)
+            except Exception as e:
+                print(f"Ошибка сохранения истории: {e}")
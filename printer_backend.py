@@ -0,0 +1,361 @@
+"""
+Принтеры этикеток. Общий интерфейс PrinterBackend и реализации:
+
+    gdi            — принтер Windows по умолчанию через GDI (win32print/win32ui), как раньше
+    gdi:Имя        — конкретный принтер Windows
+    file:путь      — дописывать этикетки в файл (работает на любой ОС)
+    tcp://host:9100 — отправлять этикетки в сокет (сетевой принтер или заглушка для нагрузочных тестов)
+
+Выбор — переменная окружения PRINTER (см. create_printer). Для file/tcp язык принтера —
+PRINTER_LANG: pbm (растр, по умолчанию), zpl или tspl (код рисует сам принтер, см. label_commands.py).
+
+Печать одной этикетки:
+
+    with printer.job() as (page_w, page_h):
+        img = get_label(text, page_w, page_h)
+        printer.print_label(img, text)
+
+Несколько этикеток подряд (пачка заданий с сервера) — внутри printer.batch(): для GDI это
+одно задание спулера (StartDoc/EndDoc) на всю пачку.
+"""
+import io
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from label_commands import LANGS, label_commands, raster_commands
+from label_render import LABEL_MM, PRINTER_DPI, mm_to_px
+
+try:
+    import win32con
+    import win32print
+    import win32ui
+    from PIL import ImageWin
+except ImportError:  # не Windows: доступны только file/tcp
+    win32con = win32print = win32ui = ImageWin = None
+
+
+class PrinterBackend:
+    """Принтер: begin() готовит задание и возвращает размер страницы в пикселях, end() освобождает ресурсы"""
+
+    # True — принтер сам рисует код по тексту (ZPL/TSPL), картинка ему не нужна
+    native = False
+    # Растёт при каждом сбросе сессии принтера: размер страницы мог измениться
+    generation = 0
+
+    def __init__(self):
+        # Печатают из разных потоков (клавиатура, сеть) — задание/пачка держат принтер целиком
+        self.lock = threading.RLock()
+
+    def begin(self) -> tuple[int, int]:
+        raise NotImplementedError
+
+    def print_label(self, img, text: str = None):
+        """Печать этикетки: img — готовая картинка (может быть None, если native), text — её код"""
+        raise NotImplementedError
+
+    def end(self):
+        pass
+
+    def close(self):
+        pass
+
+    @contextmanager
+    def job(self):
+        with self.lock:
+            page = self.begin()
+            try:
+                yield page
+            finally:
+                self.end()
+
+    def page_size(self) -> tuple[int, int]:
+        """Размер страницы в пикселях (для отрисовки этикетки заранее, до печати)"""
+        with self.job() as page:
+            return page
+
+    @contextmanager
+    def batch(self):
+        """Несколько job() подряд как одно задание принтера"""
+        with self.lock:
+            yield
+
+
+# --- GDI (Windows) ---
+# Пытаемся зафиксировать формат 58x40 в драйвере и всегда опираемся на реальные размеры DC
+
+def _dmpaper_user_const() -> int:
+    # В некоторых сборках pywin32 константа может отсутствовать
+    return int(getattr(win32con, "DMPAPER_USER", 256))
+
+
+def build_label_devmode(printer_name: str, width_mm: int, height_mm: int):
+    """
+    Возвращает DEVMODE с кастомным размером бумаги (в 0.1 мм), если драйвер это поддерживает.
+    Даже если драйвер проигнорирует, дальше мы всё равно используем реальные DeviceCaps.
+    """
+    try:
+        hPrinter = win32print.OpenPrinter(printer_name)
+        try:
+            info2 = win32print.GetPrinter(hPrinter, 2)
+            devmode = info2.get("pDevMode")
+            if devmode is None:
+                return None
+
+            devmode.Fields |= (
+                win32con.DM_PAPERSIZE
+                | win32con.DM_PAPERWIDTH
+                | win32con.DM_PAPERLENGTH
+                | win32con.DM_ORIENTATION
+            )
+            devmode.PaperSize = _dmpaper_user_const()
+            devmode.PaperWidth = int(width_mm * 10)   # 0.1 мм
+            devmode.PaperLength = int(height_mm * 10) # 0.1 мм
+            devmode.Orientation = (
+                win32con.DMORIENT_LANDSCAPE
+                if width_mm >= height_mm
+                else win32con.DMORIENT_PORTRAIT
+            )
+            return devmode
+        finally:
+            win32print.ClosePrinter(hPrinter)
+    except Exception as e:
+        print(f"Не удалось подготовить настройки бумаги принтера (DEVMODE): {e}")
+        return None
+
+
+def create_printer_dc(printer_name: str, label_mm: tuple[int, int] = LABEL_MM):
+    """
+    Создаёт DC принтера; пытается выставить нужный размер этикетки через DEVMODE.
+    """
+    devmode = build_label_devmode(printer_name, label_mm[0], label_mm[1])
+    hDC = win32ui.CreateDC()
+
+    if devmode is not None:
+        try:
+            # CreateDC(driver, device, output, devmode)
+            hDC.CreateDC("WINSPOOL", printer_name, None, devmode)
+            return hDC
+        except Exception as e:
+            print(f"DEVMODE не применился, печатаю с настройками драйвера по умолчанию: {e}")
+
+    hDC.CreatePrinterDC(printer_name)
+    return hDC
+
+
+def get_dc_page_px(hDC) -> tuple[int, int]:
+    """
+    Размер печатаемой области (в пикселях устройства) для текущих настроек драйвера.
+    """
+    w = int(hDC.GetDeviceCaps(win32con.HORZRES) or 0)
+    h = int(hDC.GetDeviceCaps(win32con.VERTRES) or 0)
+    return w, h
+
+
+class GdiPrinter(PrinterBackend):
+    """
+    Печать через GDI на принтер Windows (по умолчанию — принтер по умолчанию).
+    Сессия: DEVMODE, DC и размер страницы готовятся один раз и живут между этикетками.
+    Сессия пересоздаётся после ошибки печати и при смене принтера по умолчанию
+    (проверяем не чаще раза в recheck_sec).
+    """
+
+    def __init__(self, printer_name: str = None, label_mm=LABEL_MM, recheck_sec: float = 5.0):
+        if win32print is None:
+            raise RuntimeError("Печать через GDI доступна только в Windows (нужен pywin32)")
+        super().__init__()
+        self.printer_name = printer_name
+        self.label_mm = label_mm
+        self.recheck_sec = recheck_sec
+        self.hDC = None
+        self.page = (0, 0)
+        self._name = None
+        self._checked = 0.0
+        self._batch = 0
+        self._doc_open = False
+
+    def _current_name(self) -> str:
+        if self.printer_name:
+            return self.printer_name
+        now = time.monotonic()
+        if self._name is None or now - self._checked >= self.recheck_sec:
+            self._checked = now
+            return win32print.GetDefaultPrinter()
+        return self._name
+
+    def begin(self):
+        printer_name = self._current_name()
+        if self.hDC is not None:
+            if printer_name == self._name:
+                return self.page
+            print(f"Принтер по умолчанию сменился: {self._name} -> {printer_name}")
+            self.invalidate()
+
+        # Создаём DC и берём РЕАЛЬНЫЙ размер страницы у принтера
+        hDC = create_printer_dc(printer_name, self.label_mm)
+        page_w, page_h = get_dc_page_px(hDC)
+
+        # Фолбэк, если драйвер вернул 0 (редко, но бывает)
+        if page_w <= 0 or page_h <= 0:
+            dpi_x = int(hDC.GetDeviceCaps(win32con.LOGPIXELSX) or PRINTER_DPI)
+            dpi_y = int(hDC.GetDeviceCaps(win32con.LOGPIXELSY) or PRINTER_DPI)
+            page_w = mm_to_px(self.label_mm[0], dpi_x)
+            page_h = mm_to_px(self.label_mm[1], dpi_y)
+
+        # Лог полезен для диагностики "вдруг драйвер сменил бумагу/ориентацию"
+        try:
+            dpi_x = int(hDC.GetDeviceCaps(win32con.LOGPIXELSX) or 0)
+            dpi_y = int(hDC.GetDeviceCaps(win32con.LOGPIXELSY) or 0)
+            print(f"Принтер: {printer_name} | page={page_w}x{page_h}px | dpi={dpi_x}x{dpi_y}")
+        except Exception:
+            pass
+
+        self.hDC, self._name, self.page = hDC, printer_name, (page_w, page_h)
+        return self.page
+
+    def print_label(self, img, text=None):
+        # Печать всей этикетки (ровно в размеры страницы DC); в пачке — страницей общего задания
+        hDC = self.hDC
+        try:
+            if not self._doc_open:
+                hDC.StartDoc("DM_Job")
+                self._doc_open = True
+            hDC.StartPage()
+            dib = ImageWin.Dib(img)
+            dib.draw(hDC.GetHandleOutput(), (0, 0, self.page[0], self.page[1]))
+            hDC.EndPage()
+            if not self._batch:
+                self._doc_open = False
+                hDC.EndDoc()
+        except Exception:
+            self.invalidate()
+            raise
+
+    @contextmanager
+    def batch(self):
+        with self.lock:
+            self._batch += 1
+            try:
+                yield
+            finally:
+                self._batch -= 1
+                if not self._batch and self._doc_open:
+                    self._doc_open = False
+                    try:
+                        self.hDC.EndDoc()
+                    except Exception:
+                        self.invalidate()
+                        raise
+
+    def invalidate(self):
+        """Сбросить сессию: следующая этикетка заново найдёт принтер и создаст DC"""
+        if self.hDC is not None:
+            if self._doc_open:
+                # Уже нарисованные страницы пачки отдаём в спулер, а не выбрасываем
+                try:
+                    self.hDC.EndDoc()
+                except Exception:
+                    pass
+            try:
+                self.hDC.DeleteDC()
+            except Exception:
+                pass
+        self.hDC, self._name, self._doc_open = None, None, False
+        self.generation += 1
+
+    def close(self):
+        with self.lock:
+            self.invalidate()
+
+
+# --- Сырой вывод в файл/сокет ---
+
+def label_to_pbm(img) -> bytes:
+    """Этикетка в формате PBM (P4): заголовок + 1 бит на пиксель — самый простой растровый поток"""
+    buf = io.BytesIO()
+    img.convert('1').save(buf, format="PPM")
+    return buf.getvalue()
+
+
+class RawPrinter(PrinterBackend):
+    """
+    Отправляет этикетки «как есть» в файл или TCP-сокет. Размер страницы — из LABEL_MM и dpi.
+    Соединение/файл держим открытыми между этикетками и переоткрываем после ошибки.
+    lang: "pbm" — растр; "zpl"/"tspl" — команды принтера, растр только если кода нет
+    или принтерный язык не смог его описать.
+    """
+
+    def __init__(self, target: str, lang: str = "pbm", label_mm=LABEL_MM, dpi: int = PRINTER_DPI,
+                 timeout: float = 10.0):
+        if lang != "pbm" and lang not in LANGS:
+            raise ValueError(f"Неизвестный язык принтера: {lang} (pbm, {', '.join(LANGS)})")
+        super().__init__()
+        self.target = target
+        self.lang = lang
+        self.native = lang in LANGS
+        self.label_mm = label_mm
+        self.dpi = dpi
+        self.timeout = timeout
+        self._out = None
+
+    def begin(self):
+        return mm_to_px(self.label_mm[0], self.dpi), mm_to_px(self.label_mm[1], self.dpi)
+
+    def render(self, img, text: str = None) -> bytes:
+        """Байты, которые уходят в канал для одной этикетки"""
+        if not self.native:
+            return label_to_pbm(img)
+        if text is not None:
+            try:
+                return label_commands(self.lang, text, label_mm=self.label_mm, dpi=self.dpi)
+            except ValueError as e:
+                if img is None:
+                    raise
+                print(f"Код не поддержан в {self.lang.upper()}, печатаю растром: {e}")
+        return raster_commands(self.lang, img, self.label_mm)
+
+    def _open(self):
+        if self.target.startswith("tcp://"):
+            host, _, port = self.target[len("tcp://"):].rpartition(":")
+            sock = socket.create_connection((host, int(port)), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return sock.makefile("wb")
+        return open(self.target, "ab")
+
+    def send(self, payload: bytes):
+        if self._out is None:
+            self._out = self._open()
+        try:
+            self._out.write(payload)
+            self._out.flush()
+        except OSError:
+            self.close()
+            raise
+
+    def print_label(self, img, text=None):
+        self.send(self.render(img, text))
+
+    def close(self):
+        if self._out is not None:
+            try:
+                self._out.close()
+            except OSError:
+                pass
+            self._out = None
+
+
+def create_printer(spec: str = None, lang: str = None) -> PrinterBackend:
+    """Принтер по строке настройки (по умолчанию — переменные PRINTER, иначе gdi, и PRINTER_LANG)"""
+    spec = spec or os.environ.get("PRINTER", "gdi")
+    lang = (lang or os.environ.get("PRINTER_LANG", "pbm")).lower()
+    if spec == "gdi":
+        return GdiPrinter()
+    if spec.startswith("gdi:"):
+        return GdiPrinter(spec[len("gdi:"):])
+    if spec.startswith("file:"):
+        return RawPrinter(spec[len("file:"):], lang)
+    if spec.startswith("tcp://"):
+        return RawPrinter(spec, lang)
+    raise ValueError(f"Неизвестный принтер: {spec} (gdi, gdi:Имя, file:путь, tcp://host:port)")
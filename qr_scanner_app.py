@@ -1,94 +1,33 @@
+import queue
 import sys
-import os
 import time
-import datetime
-import win32print
-import win32ui
-import win32con
-from PIL import Image, ImageWin
-from pylibdmtx.pylibdmtx import encode
-from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QLabel, QPushButton
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from label_render import get_label
+from expiring import ExpiringSet
+from label_history import HistoryStore
+from printer_backend import create_printer
+from PyQt5.QtWidgets import QApplication, QMainWindow, QMessageBox, QVBoxLayout, QWidget, QLabel, QListWidget, QPushButton
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
 from PyQt5.QtGui import QFont, QPalette, QColor
 
-# Импортируем функции печати из main.py (если они там есть, иначе дублируем)
-HISTORY_FOLDER = "history"
-LABEL_MM = (58, 40)
-PRINTER_DPI = 203
-QR_FILL_RATIO = float(os.environ.get("QR_FILL_RATIO", "0.82"))
+# История этикеток (общая с main.py): код + параметры, картинки — в пачках по дням
+history = HistoryStore()
 
-# Создаем папку для истории, если её нет
-if not os.path.exists(HISTORY_FOLDER):
-    os.makedirs(HISTORY_FOLDER)
 
+# Принтер: PRINTER=gdi (по умолчанию), gdi:Имя, file:путь или tcp://host:port — см. printer_backend.py
+printer = create_printer()
 
-def mm_to_px(mm, dpi=PRINTER_DPI):
-    """Конвертация миллиметров в пиксели принтера"""
-    return int(mm / 25.4 * dpi)
 
-
-def _dmpaper_user_const() -> int:
-    return int(getattr(win32con, "DMPAPER_USER", 256))
-
-
-def build_label_devmode(printer_name: str, width_mm: int, height_mm: int):
-    """Возвращает DEVMODE с кастомным размером бумаги"""
-    try:
-        hPrinter = win32print.OpenPrinter(printer_name)
-        try:
-            info2 = win32print.GetPrinter(hPrinter, 2)
-            devmode = info2.get("pDevMode")
-            if devmode is None:
-                return None
-
-            devmode.Fields |= (
-                win32con.DM_PAPERSIZE
-                | win32con.DM_PAPERWIDTH
-                | win32con.DM_PAPERLENGTH
-                | win32con.DM_ORIENTATION
-            )
-            devmode.PaperSize = _dmpaper_user_const()
-            devmode.PaperWidth = int(width_mm * 10)
-            devmode.PaperLength = int(height_mm * 10)
-            devmode.Orientation = (
-                win32con.DMORIENT_LANDSCAPE
-                if width_mm >= height_mm
-                else win32con.DMORIENT_PORTRAIT
-            )
-            return devmode
-        finally:
-            win32print.ClosePrinter(hPrinter)
-    except Exception as e:
-        print(f"Не удалось подготовить настройки бумаги принтера (DEVMODE): {e}")
-        return None
-
-
-def create_printer_dc(printer_name: str, label_mm: tuple[int, int] = LABEL_MM):
-    """Создаёт DC принтера"""
-    devmode = build_label_devmode(printer_name, label_mm[0], label_mm[1])
-    hDC = win32ui.CreateDC()
-
-    if devmode is not None:
-        try:
-            hDC.CreateDC("WINSPOOL", printer_name, None, devmode)
-            return hDC
-        except Exception as e:
-            print(f"DEVMODE не применился, печатаю с настройками драйвера по умолчанию: {e}")
-
-    hDC.CreatePrinterDC(printer_name)
-    return hDC
-
-
-def get_dc_page_px(hDC) -> tuple[int, int]:
-    """Размер печатаемой области (в пикселях устройства)"""
-    w = int(hDC.GetDeviceCaps(win32con.HORZRES) or 0)
-    h = int(hDC.GetDeviceCaps(win32con.VERTRES) or 0)
-    return w, h
-
-
-# Защита от дублей
-_last_printed = {}
+# Защита от дублей: тот же код, отсканированный повторно в течение _DEDUP_SEC сек, в очередь не ставится
 _DEDUP_SEC = 2
+_last_scanned = ExpiringSet(_DEDUP_SEC)
+
+# Сколько сканов может ждать печати; больше — скан не принимается (об этом пишет статус)
+PRINT_QUEUE_SIZE = 1000
+# Сколько последних заданий показывать в списке
+JOBS_SHOWN = 50
+# Через сколько мс после успеха / ошибки статус возвращается к «Ожидаются данные...»
+STATUS_RESET_OK_MS = 2000
+STATUS_RESET_ERROR_MS = 3000
 
 
 def print_data_matrix(text: str) -> tuple[bool, str]:
@@ -96,87 +35,75 @@ def print_data_matrix(text: str) -> tuple[bool, str]:
     Генерирует Data Matrix и печатает на дефолтный принтер.
     Возвращает (успех, сообщение об ошибке или успехе).
     """
-    global _last_printed
-    now = time.time()
-    if text in _last_printed and (now - _last_printed[text]) < _DEDUP_SEC:
-        return False, "Пропуск дубля"
-    _last_printed[text] = now
-    _last_printed = {k: v for k, v in _last_printed.items() if now - v < 60}
-
     try:
-        # 1. Генерация Data Matrix
-        encoded = encode(text.encode('utf-8'))
-        img = Image.frombytes('RGB', (encoded.width, encoded.height), encoded.pixels)
-
-        # Тихая зона (белая рамка) — обязательна для надёжного сканирования
-        quiet_zone = max(2, min(encoded.width, encoded.height) // 4)
-        w, h = img.size
-        padded = Image.new('RGB', (w + 2 * quiet_zone, h + 2 * quiet_zone), 'white')
-        padded.paste(img, (quiet_zone, quiet_zone))
-        img = padded
-
-        # 2. Создаём DC и берём реальный размер страницы
-        printer_name = win32print.GetDefaultPrinter()
-        hDC = create_printer_dc(printer_name, LABEL_MM)
-        try:
-            page_w, page_h = get_dc_page_px(hDC)
-
-            # Фолбэк, если драйвер вернул 0
-            if page_w <= 0 or page_h <= 0:
-                dpi_x = int(hDC.GetDeviceCaps(win32con.LOGPIXELSX) or PRINTER_DPI)
-                dpi_y = int(hDC.GetDeviceCaps(win32con.LOGPIXELSY) or PRINTER_DPI)
-                page_w = mm_to_px(LABEL_MM[0], dpi_x)
-                page_h = mm_to_px(LABEL_MM[1], dpi_y)
-
-            # 3. QR/DM занимает заданную долю меньшей стороны; не меньше 80 px — иначе принтер "размазывает"
-            min_qr_size = 80
-            qr_size = max(min_qr_size, int(min(page_w, page_h) * QR_FILL_RATIO))
-            img = img.resize((qr_size, qr_size), Image.NEAREST)
-
-            # 4. Создаём полную этикетку с центрированным QR
-            label_img = Image.new('RGB', (page_w, page_h), 'white')
-            x = max(0, (page_w - qr_size) // 2)
-            y = max(0, (page_h - qr_size) // 2)
-            label_img.paste(img, (x, y))
-
-            # 5. Сохранение в папку истории
-            file_name = f"scan_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.png"
-            full_path = os.path.join(HISTORY_FOLDER, file_name)
-            label_img.save(full_path)
-
-            # 6. Печать
-            hDC.StartDoc("DM_Job")
-            hDC.StartPage()
-            dib = ImageWin.Dib(label_img)
-            dib.draw(hDC.GetHandleOutput(), (0, 0, page_w, page_h))
-            hDC.EndPage()
-            hDC.EndDoc()
-            return True, "Успешно отправлено на печать"
-        finally:
-            try:
-                hDC.DeleteDC()
-            except Exception:
-                pass
+        # 1. Готовим принтер и берём реальный размер страницы
+        with printer.job() as (page_w, page_h):
+            # 2. Этикетка с центрированным Data Matrix (повторы того же кода — из кэша)
+            label_img = get_label(text, page_w, page_h)
 
+            # 3. Печать
+            printer.print_label(label_img, text)
     except Exception as e:
         return False, f"Ошибка: {str(e)}"
 
+    # 4. Сохранение в историю (картинка пишется только для нового кода) — уже не держа принтер
+    try:
+        history.add(text, label_img)
+    except Exception as e:
+        print(f"Ошибка сохранения истории: {e}")
+    return True, "Успешно отправлено на печать"
+
 
 class PrintWorker(QThread):
-    """Поток для печати, чтобы не блокировать UI"""
-    finished = pyqtSignal(bool, str)
-    status_update = pyqtSignal(str)
+    """
+    Постоянный поток печати: задания из очереди печатаются строго по порядку.
+    Окно только кладёт задание в очередь (submit) и никогда не ждёт принтер.
+    """
+    job_started = pyqtSignal(int)
+    job_finished = pyqtSignal(int, bool, str)
 
-    def __init__(self, text: str):
+    def __init__(self, queue_size: int = PRINT_QUEUE_SIZE):
         super().__init__()
-        self.text = text
+        self.jobs = queue.Queue(queue_size)
+        self.finishing = False
+
+    def submit(self, job_id: int, text: str) -> bool:
+        """False — очередь заполнена"""
+        try:
+            self.jobs.put_nowait((job_id, text))
+            return True
+        except queue.Full:
+            return False
+
+    def finish(self):
+        """Допечатать очередь и завершить поток; не ждёт — об окончании сообщит сигнал finished"""
+        self.finishing = True
+        try:
+            self.jobs.put_nowait((None, None))
+        except queue.Full:
+            pass  # очередь полна — поток занят и сам увидит finishing, когда она опустеет
+
+    def discard(self) -> list:
+        """Убрать из очереди всё, что ещё не начало печататься; возвращает id этих заданий"""
+        dropped = []
+        while True:
+            try:
+                job_id, _ = self.jobs.get_nowait()
+            except queue.Empty:
+                return dropped
+            if job_id is not None:
+                dropped.append(job_id)
 
     def run(self):
-        self.status_update.emit("Генерация Data Matrix...")
-        time.sleep(0.1)  # Небольшая задержка для обновления UI
-        self.status_update.emit("Отправка на принтер...")
-        success, message = print_data_matrix(self.text)
-        self.finished.emit(success, message)
+        while True:
+            if self.finishing and self.jobs.empty():
+                return
+            job_id, text = self.jobs.get()
+            if job_id is None:
+                return
+            self.job_started.emit(job_id)
+            success, message = print_data_matrix(text)
+            self.job_finished.emit(job_id, success, message)
 
 
 class QRScannerWindow(QMainWindow):
@@ -184,12 +111,27 @@ class QRScannerWindow(QMainWindow):
         super().__init__()
         self.input_buffer = ""
         self.last_key_time = 0
-        self.print_worker = None
+        # id задания -> строка в списке заданий
+        self.job_items = {}
+        self.next_job_id = 1
+        self.pending = 0
+        # Окно закрывается: новые сканы не принимаются, очередь допечатывается
+        self.closing = False
         self.init_ui()
 
+        self.status_timer = QTimer(self)
+        self.status_timer.setSingleShot(True)
+        self.status_timer.timeout.connect(self.reset_status)
+
+        self.print_worker = PrintWorker()
+        self.print_worker.job_started.connect(self.on_job_started)
+        self.print_worker.job_finished.connect(self.on_print_finished)
+        self.print_worker.finished.connect(self.on_worker_finished)
+        self.print_worker.start()
+
     def init_ui(self):
         self.setWindowTitle("QR Сканер - Печать")
-        self.setFixedSize(400, 300)
+        self.setFixedSize(400, 480)
         self.setWindowFlags(Qt.WindowStaysOnTopHint)  # Окно всегда сверху
 
         # Центрируем окно
@@ -231,6 +173,15 @@ class QRScannerWindow(QMainWindow):
         """)
         layout.addWidget(self.status_label)
 
+        # Очередь печати: сколько ждёт и последние задания со статусом
+        self.queue_label = QLabel()
+        self.queue_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.queue_label)
+        self.jobs_list = QListWidget()
+        self.jobs_list.setFocusPolicy(Qt.NoFocus)  # ввод сканера остаётся у окна
+        layout.addWidget(self.jobs_list)
+        self.update_queue_label()
+
         # Кнопка закрытия
         close_btn = QPushButton("Закрыть")
         close_btn.clicked.connect(self.close)
@@ -298,18 +249,32 @@ class QRScannerWindow(QMainWindow):
         event.accept()
 
     def process_input(self, text: str):
-        """Обрабатывает введенный текст"""
-        if self.print_worker and self.print_worker.isRunning():
-            return  # Уже печатаем
-
-        self.update_status("Данные получены", "#28a745")
+        """Ставит код в очередь печати и сразу возвращается к вводу"""
         self.input_buffer = ""
-
-        # Запускаем печать в отдельном потоке
-        self.print_worker = PrintWorker(text)
-        self.print_worker.status_update.connect(self.update_status)
-        self.print_worker.finished.connect(self.on_print_finished)
-        self.print_worker.start()
+        if self.closing:
+            return
+        # Дубль определяется по времени скана, а не по тому, когда до него дойдёт очередь печати
+        if text in _last_scanned:
+            self.show_result(f"Повтор того же кода пропущен: {text[:20]}...", "#333", STATUS_RESET_OK_MS)
+            return
+        job_id = self.next_job_id
+        if not self.print_worker.submit(job_id, text):
+            self.show_result(f"Очередь печати заполнена, код не принят: {text[:20]}...", "#dc3545",
+                             STATUS_RESET_ERROR_MS)
+            return
+        _last_scanned.add(text)
+        self.next_job_id += 1
+        self.pending += 1
+
+        self.jobs_list.insertItem(0, f"#{job_id} в очереди  {text[:30]}")
+        self.job_items[job_id] = self.jobs_list.item(0)
+        while self.jobs_list.count() > JOBS_SHOWN:
+            self.jobs_list.takeItem(self.jobs_list.count() - 1)
+        self.job_items = {i: item for i, item in self.job_items.items() if i > job_id - JOBS_SHOWN}
+
+        self.update_queue_label()
+        self.status_timer.stop()
+        self.update_status("Данные получены", "#28a745")
 
     def update_status(self, message: str, color: str = "#333"):
         """Обновляет статус"""
@@ -324,21 +289,80 @@ class QRScannerWindow(QMainWindow):
             }}
         """)
 
-    def on_print_finished(self, success: bool, message: str):
-        """Обработчик завершения печати"""
+    def update_queue_label(self):
+        self.queue_label.setText(f"В очереди печати: {self.pending}")
+
+    def set_job_status(self, job_id: int, status: str):
+        item = self.job_items.get(job_id)
+        if item is not None:
+            # Текст строки: "#id статус  код" — меняем только статус
+            code = item.text().split("  ", 1)[1]
+            item.setText(f"#{job_id} {status}  {code}")
+
+    def on_job_started(self, job_id: int):
+        self.set_job_status(job_id, "печать...")
+        if not self.closing:
+            self.update_status("Отправка на принтер...", "#333")
+
+    def on_print_finished(self, job_id: int, success: bool, message: str):
+        """Обработчик завершения задания: статус в списке, сброс статуса окна — таймером"""
+        self.pending -= 1
+        self.update_queue_label()
         if success:
-            self.update_status("Отправлено на печать ✓", "#28a745")
-            # Через 2 секунды возвращаемся к ожиданию
-            QApplication.processEvents()
-            time.sleep(2)
-            self.update_status("Ожидаются данные...", "#333")
+            self.set_job_status(job_id, "✓")
+            self.show_result("Отправлено на печать ✓", "#28a745", STATUS_RESET_OK_MS)
+        else:
+            self.set_job_status(job_id, f"✗ {message}")
+            self.show_result(f"Ошибка: {message}", "#dc3545", STATUS_RESET_ERROR_MS)
+        if self.closing:
+            self.show_closing()
+
+    def show_result(self, message: str, color: str, reset_ms: int):
+        self.update_status(message, color)
+        self.status_timer.start(reset_ms)
+
+    def reset_status(self):
+        if self.closing:
+            self.show_closing()
+        elif self.pending:
+            self.update_status("Отправка на принтер...", "#333")
         else:
-            self.update_status(f"Ошибка: {message}", "#dc3545")
-            # Через 3 секунды возвращаемся к ожиданию
-            QApplication.processEvents()
-            time.sleep(3)
             self.update_status("Ожидаются данные...", "#333")
 
+    def show_closing(self):
+        self.status_timer.stop()
+        self.update_status(f"Допечатываю: осталось {self.pending}.\nОкно закроется само", "#333")
+
+    def closeEvent(self, event):
+        """
+        Закрытие окна: очередь допечатывается в фоне, окно закрывается, когда поток печати
+        завершится. Повторное закрытие предлагает бросить то, что ещё не напечатано.
+        """
+        if self.print_worker.isFinished():
+            super().closeEvent(event)
+            return
+        event.ignore()
+        if not self.closing:
+            self.closing = True
+            self.print_worker.finish()
+            self.show_closing()
+        elif self.pending and QMessageBox.question(
+                self, "QR Сканер", f"Не напечатано заданий: {self.pending}. Закрыть, не печатая их?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No) == QMessageBox.Yes:
+            for job_id in self.print_worker.discard():
+                self.pending -= 1
+                self.set_job_status(job_id, "✗ отменено")
+            self.update_queue_label()
+            self.show_closing()
+            # Текущую этикетку поток допечатает и завершится
+            self.print_worker.finish()
+
+    def on_worker_finished(self):
+        # finished приходит чуть раньше, чем поток действительно завершится
+        self.print_worker.wait()
+        if self.closing:
+            self.close()
+
 
 def main():
     app = QApplication(sys.argv)
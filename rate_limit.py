@@ -0,0 +1,33 @@
+"""
+Ограничение частоты запросов по клиенту (token bucket): у каждого клиента ведро на burst
+жетонов, которое пополняется со скоростью rate жетонов в секунду; запрос тратит cost жетонов.
+
+Вёдра лежат в ExpiringDict: ведро, которое не трогали burst/rate секунд, всё равно уже
+полное, поэтому его можно просто забыть. Число вёдер ограничено max_clients — память
+не растёт, сколько бы адресов ни приходило. O(1) на запрос.
+"""
+import time
+
+from expiring import ExpiringDict
+
+
+class TokenBuckets:
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        # client -> (жетонов, момент последнего пересчёта)
+        self._buckets = ExpiringDict(burst / rate, clock, max_clients)
+
+    def allow(self, client, cost: float = 1) -> float:
+        """0 — запрос разрешён (жетоны списаны); иначе — через сколько секунд повторить"""
+        now = self.clock()
+        tokens, last = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        # Запрос дороже полного ведра иначе не прошёл бы никогда
+        cost = min(cost, self.burst)
+        if tokens < cost:
+            self._buckets.set(client, (tokens, now))
+            return (cost - tokens) / self.rate
+        self._buckets.set(client, (tokens - cost, now))
+        return 0.0
@@ -0,0 +1,98 @@
+"""
+История сканов на сервере: каждый /send-to-print записывается в SQLite (код, станция,
+id задания, когда принят, когда подтверждена печать). Поиск по коду и по началу кода
+идёт по индексу (code, created_at), поэтому не зависит от размера истории.
+
+Все обращения к базе — в одном отдельном потоке, цикл событий не ждёт диск.
+"""
+import asyncio
+import concurrent.futures
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    code TEXT NOT NULL,
+    station TEXT NOT NULL,
+    job_id INTEGER,
+    created_at REAL NOT NULL,
+    printed_at REAL
+);
+CREATE INDEX IF NOT EXISTS scans_code ON scans (code, created_at);
+CREATE INDEX IF NOT EXISTS scans_job ON scans (job_id);
+"""
+
+# Верхняя граница для поиска по префиксу: code >= prefix AND code < prefix + MAX_CHAR
+_MAX_CHAR = "\U0010ffff"
+
+_COLUMNS = ("id", "code", "station", "job_id", "created_at", "printed_at")
+
+
+class ScanHistory:
+    def __init__(self, path: str):
+        self.path = path
+        self._db = None
+        self._executor = None
+
+    async def start(self):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="scan-history")
+        await self._run(self._open)
+
+    async def close(self):
+        if self._executor is not None:
+            await self._run(self._close_db)
+            self._executor.shutdown()
+            self._executor = None
+
+    def _open(self):
+        self._db = sqlite3.connect(self.path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # История — не очередь: потеря последних строк при сбое питания допустима
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(SCHEMA)
+
+    def _close_db(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _run(self, fn):
+        return asyncio.get_running_loop().run_in_executor(self._executor, fn)
+
+    async def record(self, station: str, code: str, job_id: int) -> int:
+        """Скан принят в очередь; возвращает id записи истории"""
+        now = time.time()
+        return await self._run(lambda: self._db.execute(
+            "INSERT INTO scans (code, station, job_id, created_at) VALUES (?, ?, ?, ?)",
+            (code, station, job_id, now)).lastrowid)
+
+    async def mark_printed(self, station: str, job_ids) -> int:
+        """Клиент подтвердил печать заданий"""
+        job_ids = [int(i) for i in job_ids]
+        if not job_ids:
+            return 0
+        now = time.time()
+        return await self._run(lambda: self._db.executemany(
+            "UPDATE scans SET printed_at = ? WHERE job_id = ? AND station = ? AND printed_at IS NULL",
+            [(now, i, station) for i in job_ids]).rowcount)
+
+    async def get(self, scan_id: int):
+        row = await self._run(lambda: self._db.execute(
+            f"SELECT {', '.join(_COLUMNS)} FROM scans WHERE id = ?", (scan_id,)).fetchone())
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    async def find(self, code: str = None, prefix: str = None, station: str = None, limit: int = 100) -> list:
+        """Сканы кода (или всех кодов, начинающихся с prefix), новые первыми"""
+        if code is not None:
+            where, args, order = "code = ?", [code], "created_at DESC"
+        else:
+            # Диапазон по индексу; LIKE 'prefix%' индекс бы не использовал
+            where, args, order = "code >= ? AND code < ?", [prefix, prefix + _MAX_CHAR], "code, created_at DESC"
+        if station is not None:
+            where += " AND station = ?"
+            args.append(station)
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM scans WHERE {where} ORDER BY {order} LIMIT ?"
+        rows = await self._run(lambda: self._db.execute(sql, (*args, limit)).fetchall())
+        return [dict(zip(_COLUMNS, row)) for row in rows]
@@ -0,0 +1,98 @@
+"""
+Журнал сканирований: строки дописываются в CSV пачками (раз в flush_sec или каждые
+flush_rows строк), стоимость записи не зависит от длины смены. Отчёт .xlsx собирается
+из журнала по запросу или при выходе — потоково (openpyxl write-only).
+
+    python scan_journal.py report_18-10-2026_08-00.csv            -> report_18-10-2026_08-00.xlsx
+    python scan_journal.py journal.csv -o report.xlsx
+"""
+import argparse
+import csv
+import datetime
+import os
+import sys
+import threading
+
+HEADER = ["Дата и время", "Содержимое кода", "Этикетка в истории"]
+
+
+class ScanJournal:
+    def __init__(self, path: str, flush_sec: float = 2.0, flush_rows: int = 100):
+        self.path = path
+        self.flush_sec = flush_sec
+        self.flush_rows = flush_rows
+        self._rows = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        # utf-8-sig: Excel открывает CSV с кириллицей без «кракозябр»
+        self._f = open(path, "a", newline="", encoding="utf-8-sig" if new else "utf-8")
+        self._writer = csv.writer(self._f)
+        if new:
+            self._writer.writerow(HEADER)
+            self._f.flush()
+        self._flusher = threading.Thread(target=self._flush_loop, name="journal", daemon=True)
+        self._flusher.start()
+
+    def append(self, text: str, label_key: str = ""):
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            self._rows.append((timestamp, text, label_key))
+            full = len(self._rows) >= self.flush_rows
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+            if rows and not self._f.closed:
+                self._writer.writerows(rows)
+                self._f.flush()
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_sec):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Ошибка записи журнала {self.path}: {e}")
+
+    def close(self):
+        self._closed.set()
+        self.flush()
+        with self._lock:
+            self._f.close()
+
+
+def export_xlsx(journal_path: str, xlsx_path: str) -> int:
+    """Отчёт .xlsx из журнала (построчно, без загрузки всего файла в память). Возвращает число строк."""
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    count = 0
+    with open(journal_path, newline="", encoding="utf-8-sig") as f:
+        for i, row in enumerate(csv.reader(f)):
+            if i == 0:
+                ws.append(HEADER)
+                continue
+            # Управляющие символы (GS в кодах «Честного знака») Excel не принимает
+            ws.append([ILLEGAL_CHARACTERS_RE.sub(r'', value) for value in row])
+            count += 1
+    wb.save(xlsx_path)
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Отчёт Excel из журнала сканирований")
+    parser.add_argument("journal", help="CSV-журнал (report_*.csv)")
+    parser.add_argument("-o", "--output", help="файл .xlsx (по умолчанию — рядом с журналом)")
+    args = parser.parse_args(argv)
+    output = args.output or os.path.splitext(args.journal)[0] + ".xlsx"
+    count = export_xlsx(args.journal, output)
+    print(f"Отчёт: {count} строк -> {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+"""
+Перехват клавиатурного сканера (USB/Bluetooth в режиме клавиатуры) для main.py.
+
+Хук клавиатуры (поток pynput) только ставит метку времени и кладёт символ в кольцевой
+буфер — без блокировок, ввода-вывода и печати, поэтому быстрые сканы подряд не теряются,
+даже если печать или сеть заняты. Отдельный поток забирает символы из буфера и режет их
+на коды (Segmenter):
+
+  * код заканчивается Enter/Tab или паузой больше SCANNER_END_GAP сек;
+  * код от сканера, если он не короче SCANNER_MIN_LEN и символы идут быстро: медиана
+    интервалов не больше SCANNER_MAX_GAP, медленных интервалов — не больше 10%
+    (одна задержка ОС не превращает скан в «ручной ввод»); остальное — ручной ввод, пропускаем;
+  * разделитель GS (FNC1 в кодах «Честного знака») сохраняется: символ \\x1d, Ctrl+]
+    или клавиша из SCANNER_GS_KEY (например f8 или ~, если сканер настроен подменять GS).
+
+Готовые коды — в очередь codes. SCANNER_TRACE=путь записывает все нажатия в файл (JSON
+по строке: {"t": время, "k": символ}); запись проигрывается и на Linux:
+
+    python scanner_input.py replay trace.jsonl [--expect codes.txt] [--realtime]
+    python scanner_input.py synth -o trace.jsonl --codes-out codes.txt   # синтетическая запись для проверки
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import statistics
+import string
+import sys
+import threading
+import time
+
+# Интервал между символами сканера (сек): у USB-сканеров 1-20 мс, у Bluetooth — до ~40 мс
+SCANNER_MAX_GAP = float(os.environ.get("SCANNER_MAX_GAP", "0.05"))
+# Пауза, после которой набранное считается законченным (если сканер не шлёт Enter)
+SCANNER_END_GAP = float(os.environ.get("SCANNER_END_GAP", "0.2"))
+# Коды короче — не коды маркировки (как раньше: больше 15 символов)
+SCANNER_MIN_LEN = int(os.environ.get("SCANNER_MIN_LEN", "16"))
+# Клавиша, которой сканер передаёт GS, если он настроен на подмену (имя клавиши pynput или символ)
+SCANNER_GS_KEY = os.environ.get("SCANNER_GS_KEY", "")
+# Файл записи нажатий (пусто — не писать)
+SCANNER_TRACE = os.environ.get("SCANNER_TRACE", "")
+# Ёмкость кольцевого буфера (нажатий); поток разбора забирает их каждые POLL_SEC сек
+RING_SIZE = 8192
+POLL_SEC = 0.005
+
+GS = "\x1d"
+# Символы, завершающие код (Enter, Tab)
+TERMINATORS = "\r\n\t"
+CTRL_KEYS = ("ctrl", "ctrl_l", "ctrl_r")
+# Код клавиши ']' (VK_OEM_6): Ctrl+] — стандартный способ ввести GS с клавиатуры
+_VK_CLOSE_BRACKET = 0xDD
+
+
+class RingBuffer:
+    """
+    Кольцевой буфер на одного писателя (хук) и одного читателя (поток разбора) без блокировок:
+    писатель меняет только head, читатель — только tail. При переполнении новое нажатие
+    отбрасывается и учитывается в dropped.
+    """
+
+    def __init__(self, size: int = RING_SIZE):
+        self.size = size
+        self._items = [None] * size
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+
+    def push(self, item) -> bool:
+        head = self.head
+        if head - self.tail >= self.size:
+            self.dropped += 1
+            return False
+        self._items[head % self.size] = item
+        self.head = head + 1
+        return True
+
+    def pop_all(self) -> list:
+        tail, head = self.tail, self.head
+        if tail == head:
+            return []
+        items = [self._items[i % self.size] for i in range(tail, head)]
+        self.tail = head
+        return items
+
+
+class Segmenter:
+    """Разбор потока (время, символ) на коды. Чистая логика без потоков — её и проигрывает replay."""
+
+    def __init__(self, max_gap: float = SCANNER_MAX_GAP, end_gap: float = SCANNER_END_GAP,
+                 min_len: int = SCANNER_MIN_LEN):
+        self.max_gap = max_gap
+        self.end_gap = end_gap
+        # По одному символу не отличить сканер от человека (и нет ни одного интервала для медианы)
+        self.min_len = max(min_len, 2)
+        self._chars = []
+        self._times = []
+
+    def feed(self, t: float, ch: str) -> list:
+        """Очередное нажатие; возвращает коды, которые оно завершило"""
+        codes = []
+        if self._times and t - self._times[-1] > self.end_gap:
+            codes += self._finish()
+        if ch in TERMINATORS:
+            codes += self._finish()
+        else:
+            self._chars.append(ch)
+            self._times.append(t)
+        return codes
+
+    def flush(self, now: float) -> list:
+        """Завершить код, если после последнего символа уже прошло больше end_gap"""
+        if self._times and now - self._times[-1] > self.end_gap:
+            return self._finish()
+        return []
+
+    def _finish(self) -> list:
+        chars, times = self._chars, self._times
+        self._chars, self._times = [], []
+        if len(chars) < self.min_len:
+            return []
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        slow = sum(g > self.max_gap for g in gaps)
+        if statistics.median(gaps) > self.max_gap or slow > len(gaps) // 10:
+            return []
+        return ["".join(chars)]
+
+
+def key_char(key, ctrl: bool = False, gs_key: str = SCANNER_GS_KEY):
+    """Символ нажатия pynput: обычный символ, \\n для Enter, \\t для Tab, GS; None — не интересует"""
+    name = getattr(key, "name", None)
+    char = getattr(key, "char", None)
+    if gs_key and gs_key in (name, char):
+        return GS
+    if name == "enter":
+        return "\n"
+    if name == "tab":
+        return "\t"
+    if char:
+        if ctrl and char in "]}":
+            return GS
+        return char
+    if ctrl and getattr(key, "vk", None) == _VK_CLOSE_BRACKET:
+        return GS
+    return None
+
+
+class ScannerInput:
+    """
+    scanner = ScannerInput()
+    scanner.start()               # хук клавиатуры + поток разбора
+    text = scanner.codes.get()    # готовые коды
+    """
+
+    def __init__(self, segmenter: Segmenter = None, ring_size: int = RING_SIZE,
+                 trace_path: str = SCANNER_TRACE, clock=time.monotonic):
+        self.segmenter = segmenter or Segmenter()
+        self.ring = RingBuffer(ring_size)
+        self.codes = queue.Queue()
+        self.trace_path = trace_path
+        self.clock = clock
+        self.listener = None
+        self._ctrl = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- Хук (поток pynput): только метка времени и запись в буфер ---
+
+    def on_press(self, key):
+        if getattr(key, "name", None) in CTRL_KEYS:
+            self._ctrl = True
+            return
+        ch = key_char(key, self._ctrl)
+        if ch is not None:
+            self.ring.push((self.clock(), ch))
+
+    def on_release(self, key):
+        if getattr(key, "name", None) in CTRL_KEYS:
+            self._ctrl = False
+
+    # --- Поток разбора ---
+
+    def start(self, hook: bool = True):
+        """hook=False — без перехвата клавиатуры (нажатия кладутся в ring вручную, как в replay)"""
+        self._thread = threading.Thread(target=self._loop, name="scanner", daemon=True)
+        self._thread.start()
+        if hook:
+            from pynput import keyboard
+
+            self.listener = keyboard.Listener(on_press=self.on_press, on_release=self.on_release)
+            self.listener.start()
+
+    def stop(self, timeout: float = None):
+        if self.listener is not None:
+            self.listener.stop()
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        trace = open(self.trace_path, "a", encoding="utf-8") if self.trace_path else None
+        dropped = 0
+        try:
+            while not self._stop.is_set():
+                events = self.ring.pop_all()
+                for t, ch in events:
+                    if trace is not None:
+                        trace.write(json.dumps({"t": round(t, 6), "k": ch}) + "\n")
+                    for code in self.segmenter.feed(t, ch):
+                        self.codes.put(code)
+                for code in self.segmenter.flush(self.clock()):
+                    self.codes.put(code)
+                if self.ring.dropped != dropped:
+                    print(f"Буфер сканера переполнен, потеряно нажатий: {self.ring.dropped - dropped}")
+                    dropped = self.ring.dropped
+                if trace is not None and events:
+                    trace.flush()
+                if not events:
+                    time.sleep(POLL_SEC)
+        finally:
+            if trace is not None:
+                trace.close()
+
+
+# --- Запись нажатий: чтение, проигрывание, синтетика ---
+
+def read_trace(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [(event["t"], event["k"]) for event in map(json.loads, f) if event]
+
+
+def replay(events: list, segmenter: Segmenter = None) -> list:
+    """Коды из записи по её собственным меткам времени (мгновенно и воспроизводимо)"""
+    segmenter = segmenter or Segmenter()
+    codes = []
+    for t, ch in events:
+        codes += segmenter.feed(t, ch)
+    if events:
+        codes += segmenter.flush(events[-1][0] + segmenter.end_gap + 1)
+    return codes
+
+
+def replay_realtime(events: list) -> list:
+    """Через ScannerInput в реальном времени: с настоящими потоками, буфером и паузами из записи"""
+    scanner = ScannerInput(trace_path="")
+    scanner.start(hook=False)
+    started, first = time.monotonic(), events[0][0] if events else 0
+    for t, ch in events:
+        delay = (t - first) - (time.monotonic() - started)
+        if delay > 0:
+            time.sleep(delay)
+        scanner.ring.push((scanner.clock(), ch))
+    time.sleep(scanner.segmenter.end_gap + 0.1)
+    scanner.stop()
+    codes = []
+    while not scanner.codes.empty():
+        codes.append(scanner.codes.get())
+    return codes
+
+
+def synth_trace(count: int = 200, seed: int = 1):
+    """
+    Запись «тяжёлой смены»: сканы подряд с минимальной паузой, коды с GS, с Enter и без,
+    задержки ОС внутри скана, ручной ввод между сканами. Возвращает (нажатия, ожидаемые коды).
+    """
+    rnd = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + "!\"%&'()*+,-./_:;=<>?"
+    events, expected = [], []
+    t = 0.0
+    for i in range(count):
+        code = (f"0104600{rnd.randrange(10 ** 7):07d}21" + "".join(rnd.choice(alphabet) for _ in range(13))
+                + GS + "91" + "".join(rnd.choice(alphabet) for _ in range(4))
+                + GS + "92" + "".join(rnd.choice(alphabet) for _ in range(44)))
+        with_enter = i % 5 != 0
+        for j, ch in enumerate(code):
+            t += rnd.uniform(0.002, 0.02)
+            if j and rnd.random() < 0.02:
+                t += rnd.uniform(0.06, 0.15)  # задержка ОС посреди скана
+            events.append((round(t, 6), ch))
+        if with_enter:
+            t += rnd.uniform(0.002, 0.02)
+            events.append((round(t, 6), "\n"))
+            t += rnd.uniform(0.01, 0.05)  # следующий скан почти сразу
+        else:
+            t += SCANNER_END_GAP + rnd.uniform(0.05, 0.2)
+        expected.append(code)
+        if rnd.random() < 0.1:
+            for ch in "ручной ввод оператора":  # человек печатает между сканами
+                t += rnd.uniform(0.08, 0.3)
+                events.append((round(t, 6), ch))
+            t += rnd.uniform(0.01, 0.05)
+            events.append((round(t, 6), "\n"))
+            t += rnd.uniform(0.3, 1.0)
+    return events, expected
+
+
+def _show(code: str) -> str:
+    return code.replace(GS, "<GS>")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Запись нажатий сканера: проигрывание и синтетика")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("replay", help="разобрать запись на коды")
+    p.add_argument("trace")
+    p.add_argument("--expect", help="файл ожидаемых кодов (по строке, GS как <GS>): код выхода 1 при расхождении")
+    p.add_argument("--realtime", action="store_true", help="через потоки и буфер, с паузами из записи")
+    p = sub.add_parser("synth", help="синтетическая запись быстрых сканов")
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("--codes-out", help="куда записать ожидаемые коды")
+    p.add_argument("-n", "--count", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    if args.command == "synth":
+        events, expected = synth_trace(args.count)
+        with open(args.output, "w", encoding="utf-8") as f:
+            for t, ch in events:
+                f.write(json.dumps({"t": t, "k": ch}) + "\n")
+        if args.codes_out:
+            with open(args.codes_out, "w", encoding="utf-8") as f:
+                f.writelines(_show(code) + "\n" for code in expected)
+        print(f"{len(events)} нажатий, {len(expected)} кодов -> {args.output}")
+        return 0
+
+    events = read_trace(args.trace)
+    codes = replay_realtime(events) if args.realtime else replay(events)
+    if not args.expect:
+        for code in codes:
+            print(_show(code))
+        return 0
+    with open(args.expect, encoding="utf-8") as f:
+        expected = [line.rstrip("\n") for line in f if line.strip()]
+    got = [_show(code) for code in codes]
+    if got == expected:
+        print(f"Совпадает: {len(got)} кодов")
+        return 0
+    missing = [c for c in expected if c not in got]
+    extra = [c for c in got if c not in expected]
+    print(f"Расхождение: ожидалось {len(expected)}, получено {len(got)}")
+    for code in missing[:10]:
+        print(f"  нет:    {code}")
+    for code in extra[:10]:
+        print(f"  лишний: {code}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
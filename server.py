@@ -1,12 +1,71 @@
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from collections import deque
+from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
+from typing import Annotated
 import asyncio
+import json
 import os
+import time
 
-app = FastAPI()
+from expiring import ExpiringDict
+from job_queue import MemoryJobQueue, QueueFull, create_job_queue
+from metrics import REGISTRY, Counter, Gauge, Histogram
+from rate_limit import TokenBuckets
+from scan_history import ScanHistory
+from static_assets import StaticAssets
+
+@asynccontextmanager
+async def lifespan(app):
+    await job_queue.start()
+    await scan_history.start()
+    try:
+        yield
+    finally:
+        await scan_history.close()
+        await job_queue.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Максимальный размер тела запроса (КБ): больше — 413, не дочитывая тело в память
+MAX_BODY_KB = int(os.environ.get("MAX_BODY_KB", "1024"))
+
+
+class BodySizeLimit:
+    """ASGI-прослойка: тело больше max_bytes — 413 (по Content-Length или по мере чтения)"""
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None:
+            try:
+                length = int(length)
+            except ValueError:
+                return await Response("Неверный Content-Length", status_code=400)(scope, receive, send)
+            if length > self.max_bytes:
+                response = Response(f"Тело запроса больше {MAX_BODY_KB} КБ", status_code=413)
+                return await response(scope, receive, send)
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            received += len(message.get("body", b""))
+            if received > self.max_bytes:
+                # chunked без Content-Length
+                raise HTTPException(status_code=413, detail=f"Тело запроса больше {MAX_BODY_KB} КБ")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(BodySizeLimit, max_bytes=MAX_BODY_KB * 1024)
 
 # CORS (можно оставить *)
 app.add_middleware(
@@ -17,69 +76,110 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Очередь заданий
-print_queue = deque()
-queue_lock = asyncio.Lock()
-
-
-@app.get("/", response_class=HTMLResponse)
-async def index():
-    return """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <script src="https://unpkg.com/html5-qrcode"></script>
-        <style>
-            body { font-family: sans-serif; text-align: center; margin: 0; padding: 20px; background: #eef2f7; }
-            #reader { width: 100%; max-width: 400px; margin: auto; border-radius: 12px; box-shadow: 0 4px 12px rgba(0,0,0,0.15); }
-            .info { margin-top: 15px; padding: 10px; background: #fff; border-radius: 8px; font-size: 14px; }
-        </style>
-    </head>
-    <body>
-        <h3>Сканер Маркировки</h3>
-        <div id="reader"></div>
-        <div id="status" class="info">Наведите камеру на Data Matrix</div>
-
-        <script>
-            const html5QrCode = new Html5Qrcode("reader");
-            let busy = false;
-            let lastScanned = { text: '', time: 0 };
-
-            async function onScan(text) {
-                const now = Date.now();
-                if (text === lastScanned.text && (now - lastScanned.time) < 2000) return;
-                lastScanned = { text: text, time: now };
-
-                if (busy) return;
-                busy = true;
-                html5QrCode.pause();
-
-                document.getElementById('status').innerText = "Отправка...";
-
-                await fetch('/send-to-print', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({data: text})
-                });
-
-                busy = false;
-                html5QrCode.resume();
-                document.getElementById('status').innerText = "Готово! Можно сканировать следующий";
-                setTimeout(() => {
-                    document.getElementById('status').innerText = "Жду следующий код";
-                }, 2000);
-            }
-
-            html5QrCode.start(
-                { facingMode: "environment" },
-                { fps: 10, qrbox: 250, formatsToSupport: [ Html5QrcodeSupportedFormats.DATA_MATRIX ] },
-                onScan
-            );
-        </script>
-    </body>
-    </html>
-    """
+# Очереди заданий по станциям печати: ?station=X (без параметра — "default")
+DEFAULT_STATION = "default"
+# Имя станции: латиница/цифры/._- , до 64 символов
+STATION_PATTERN = r"^[A-Za-z0-9_.-]{1,64}$"
+
+_dir = os.path.dirname(os.path.abspath(__file__))
+# Хранилище очереди (см. job_queue.py): sqlite:///путь (по умолчанию, файл рядом с server.py),
+# redis://host:6379/0 — для нескольких серверов, memory:// — только для одного воркера.
+# Выданное задание удаляется только после подтверждения клиентом (/ack)
+QUEUE_URL = os.environ.get("QUEUE_URL") or os.environ.get("QUEUE_DB") or os.path.join(_dir, "print_queue.db")
+# Число процессов uvicorn; очередь должна быть общей (sqlite/redis), если их больше одного
+WORKERS = int(os.environ.get("WORKERS", "1"))
+
+# Не больше QUEUE_CAPACITY заданий в очереди станции (0 — без ограничения): новые сканы
+# получают 429, пока клиент печати не разберёт очередь
+QUEUE_CAPACITY = int(os.environ.get("QUEUE_CAPACITY", "10000"))
+# Задания старше JOB_TTL_SEC секунд не печатаются и удаляются (0 — бессрочно)
+JOB_TTL_SEC = float(os.environ.get("JOB_TTL_SEC", "3600"))
+
+job_queue = create_job_queue(
+    QUEUE_URL,
+    lease_sec=float(os.environ.get("JOB_LEASE_SEC", "120")),
+    max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", "5")),
+    capacity=QUEUE_CAPACITY,
+    ttl_sec=JOB_TTL_SEC,
+)
+
+# История сканов (поиск /history, повторная печать /reprint): файл SQLite рядом с server.py
+scan_history = ScanHistory(os.environ.get("HISTORY_DB") or os.path.join(_dir, "scan_history.db"))
+
+Station = Annotated[str, Query(pattern=STATION_PATTERN)]
+# Не больше MAX_STATIONS разных станций на процесс (0 — без ограничения): у каждой своя очередь
+# и метрики, опечатка или перебор имён в ?station= не должны раздувать память. Станция считается,
+# когда в неё ставят скан (опрос клиентом печати — нет), и забывается, если сканов не было
+# STATION_IDLE_SEC секунд
+MAX_STATIONS = int(os.environ.get("MAX_STATIONS", "5000"))
+STATION_IDLE_SEC = float(os.environ.get("STATION_IDLE_SEC", "86400"))
+_stations = ExpiringDict(STATION_IDLE_SEC)
+
+# Максимальная длина кода в скане: длиннее — не печатается (413 / "too_long" в пачке)
+SCAN_MAX_LEN = int(os.environ.get("SCAN_MAX_LEN", "512"))
+# Частота запросов с одного адреса: RATE_LIMIT_PER_SEC сканов в секунду в среднем и до
+# RATE_LIMIT_BURST подряд (пачка из N сканов считается за N); больше — 429 с Retry-After.
+# 0 — без ограничения
+RATE_LIMIT_PER_SEC = float(os.environ.get("RATE_LIMIT_PER_SEC", "20"))
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", "100"))
+# Через сколько секунд телефону повторить скан, если очередь станции полна
+QUEUE_FULL_RETRY_SEC = 5
+# Сколько ключей (адресов, сканов для защиты от дублей, ключей идемпотентности) помнить не больше
+MAX_TRACKED_KEYS = int(os.environ.get("MAX_TRACKED_KEYS", "100000"))
+rate_limiter = TokenBuckets(RATE_LIMIT_PER_SEC, RATE_LIMIT_BURST, MAX_TRACKED_KEYS) if RATE_LIMIT_PER_SEC > 0 else None
+# Сервер за прокси (nginx с HTTPS): адрес телефона — из заголовка CLIENT_IP_HEADER (X-Real-IP или
+# X-Forwarded-For), если запрос пришёл с адреса из TRUSTED_PROXIES. Пусто — адрес соединения
+CLIENT_IP_HEADER = os.environ.get("CLIENT_IP_HEADER", "")
+TRUSTED_PROXIES = {a.strip() for a in os.environ.get("TRUSTED_PROXIES", "127.0.0.1,::1").split(",") if a.strip()}
+
+# Защита от дублей: тот же код на ту же станцию в течение SCAN_DEDUP_SEC секунд не ставится
+# в очередь повторно (два телефона отсканировали одну коробку) — отвечаем id уже созданного задания.
+# Ключ идемпотентности клиента (поле key или заголовок Idempotency-Key) помним IDEMPOTENCY_TTL_SEC.
+# Действует в пределах одного процесса сервера.
+SCAN_DEDUP_SEC = float(os.environ.get("SCAN_DEDUP_SEC", "2"))
+IDEMPOTENCY_TTL_SEC = float(os.environ.get("IDEMPOTENCY_TTL_SEC", "600"))
+# (station, data) / key -> future с id задания (future — чтобы одновременные дубли ждали первый запрос)
+_recent_scans = ExpiringDict(SCAN_DEDUP_SEC, max_items=MAX_TRACKED_KEYS)
+_idempotency_keys = ExpiringDict(IDEMPOTENCY_TTL_SEC, max_items=MAX_TRACKED_KEYS)
+
+# --- Метрики (/metrics, формат Prometheus). Скорости считает сам Prometheus: rate(..._total[1m]) ---
+JOBS_ENQUEUED = Counter("qr_jobs_enqueued_total", "Заданий поставлено в очередь", ("station",))
+JOBS_DUPLICATE = Counter("qr_jobs_duplicate_total", "Сканов отброшено как дубли", ("station",))
+JOBS_LEASED = Counter("qr_jobs_leased_total", "Заданий выдано клиентам печати (с повторными выдачами)", ("station",))
+JOBS_ACKED = Counter("qr_jobs_acked_total", "Заданий подтверждено клиентами печати", ("station",))
+JOB_AGE = Histogram("qr_job_age_seconds", "Сколько задание ждало в очереди до выдачи", ("station",),
+                    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800))
+QUEUE_DEPTH = Gauge("qr_queue_depth", "Заданий ждут выдачи", ("station",))
+JOBS_REJECTED = Counter("qr_jobs_rejected_total", "Сканов не принято: queue_full, rate_limit, too_long",
+                        ("station", "reason"))
+
+# Максимальное время удержания long-poll запроса /get-job?wait=N (сек)
+LONG_POLL_MAX_SEC = float(os.environ.get("LONG_POLL_MAX_SEC", "30"))
+# Максимальное число заданий, выдаваемых за один запрос /get-jobs
+MAX_JOBS_BATCH = int(os.environ.get("MAX_JOBS_BATCH", "100"))
+# Максимальное число сканов в одном запросе /send-to-print/batch
+MAX_SCAN_BATCH = int(os.environ.get("MAX_SCAN_BATCH", "500"))
+
+
+# Страница сканера и её файлы (static/): из памяти, со сжатием и ETag, см. static_assets.py
+static_assets = StaticAssets()
+
+
+@app.get("/")
+async def index(request: Request):
+    return static_assets.response("index.html", request)
+
+
+@app.get("/sw.js")
+async def service_worker(request: Request):
+    # Service worker отдаётся из корня, чтобы его область действия покрывала всю страницу
+    return static_assets.response("sw.js", request)
+
+
+@app.get("/static/{name}")
+async def static_file(name: str, request: Request):
+    return static_assets.response(name, request)
+
 
 @app.head("/")
 async def head_root():
@@ -88,29 +188,290 @@ async def head_root():
 
 class ScanData(BaseModel):
     data: str
+    # Необязательный ключ идемпотентности: повтор запроса с тем же ключом не создаёт новое задание
+    key: str | None = Field(None, max_length=128)
+
+
+class ScanBatch(BaseModel):
+    scans: list[ScanData]
+
+
+class AckData(BaseModel):
+    ids: list[int]
+
+
+class ReprintData(BaseModel):
+    # Запись истории (id из /history) или код — тогда берётся его последний скан
+    id: int | None = None
+    code: str | None = None
+
+
+def _admit_station(station: str):
+    """Отмечает активность станции; 403 для новой станции сверх MAX_STATIONS активных"""
+    if station == DEFAULT_STATION or station in _stations or not MAX_STATIONS or len(_stations) < MAX_STATIONS:
+        _stations.set(station, True)
+        return
+    raise HTTPException(status_code=403, detail=f"Не больше {MAX_STATIONS} станций")
+
+
+def _client_key(request: Request) -> str:
+    host = request.client.host if request.client else ""
+    if CLIENT_IP_HEADER and host in TRUSTED_PROXIES:
+        forwarded = request.headers.get(CLIENT_IP_HEADER)
+        if forwarded:
+            # X-Forwarded-For: последний адрес дописал наш прокси, предыдущие мог подставить сам клиент
+            return forwarded.split(",")[-1].strip()
+    return host
+
+
+def _admit_client(request: Request, station: str, cost: int = 1):
+    """
+    Скан в очередь станции: 429 с Retry-After, если клиент превысил RATE_LIMIT_PER_SEC /
+    RATE_LIMIT_BURST, затем учёт станции (_admit_station)
+    """
+    if rate_limiter is not None:
+        retry_after = rate_limiter.allow(_client_key(request), cost)
+        if retry_after:
+            JOBS_REJECTED.inc(cost, station=station, reason="rate_limit")
+            raise HTTPException(status_code=429, detail="Слишком много запросов",
+                                headers={"Retry-After": str(max(1, round(retry_after)))})
+    _admit_station(station)
+
+
+def _queue_full(station: str) -> HTTPException:
+    JOBS_REJECTED.inc(station=station, reason="queue_full")
+    return HTTPException(status_code=429, detail="Очередь станции заполнена",
+                         headers={"Retry-After": str(QUEUE_FULL_RETRY_SEC)})
+
+
+def _wait_sec(wait: float) -> float:
+    return min(max(wait, 0.0), LONG_POLL_MAX_SEC)
+
+
+def _leased(station: str, jobs: list) -> list:
+    """Учитывает выданные задания в метриках; клиенту уходят только id и data"""
+    now = time.time()
+    for job in jobs:
+        JOB_AGE.observe(now - job.pop("created_at"), station=station)
+    if jobs:
+        JOBS_LEASED.inc(len(jobs), station=station)
+    return jobs
+
+
+async def _acked(station: str, ids) -> int:
+    acked = await job_queue.ack(station, ids)
+    await scan_history.mark_printed(station, ids)
+    JOBS_ACKED.inc(acked, station=station)
+    return acked
+
+
+async def _enqueue_once(station: str, data: str, key: str = None) -> tuple[int, bool]:
+    """Ставит скан в очередь, если это не дубль. Возвращает (id задания, дубль ли это)."""
+    entries = []
+    if SCAN_DEDUP_SEC > 0:
+        entries.append((_recent_scans, (station, data)))
+    if key:
+        entries.append((_idempotency_keys, key))
+    for store, k in entries:
+        fut = store.get(k)
+        if fut is not None:
+            JOBS_DUPLICATE.inc(station=station)
+            return await fut, True
+
+    fut = asyncio.get_running_loop().create_future()
+    for store, k in entries:
+        store.set(k, fut)
+    try:
+        job_id = await job_queue.put(station, data)
+    except Exception as e:
+        for store, k in entries:
+            store.pop(k)
+        fut.set_exception(e)
+        fut.exception()  # ожидающих может не быть — не пишем "exception was never retrieved"
+        raise
+    fut.set_result(job_id)
+    JOBS_ENQUEUED.inc(station=station)
+    await scan_history.record(station, data, job_id)
+    return job_id, False
 
 
 @app.post("/send-to-print")
-async def send_to_print(scan: ScanData):
-    async with queue_lock:
-        print_queue.append(scan.data)
-    return {"status": "ok"}
+async def send_to_print(scan: ScanData, request: Request, station: Station = DEFAULT_STATION,
+                        idempotency_key: Annotated[str | None, Header(max_length=128)] = None):
+    _admit_client(request, station)
+    if len(scan.data) > SCAN_MAX_LEN:
+        JOBS_REJECTED.inc(station=station, reason="too_long")
+        raise HTTPException(status_code=413, detail=f"Код длиннее {SCAN_MAX_LEN} символов")
+    try:
+        job_id, duplicate = await _enqueue_once(station, scan.data, scan.key or idempotency_key)
+    except QueueFull:
+        raise _queue_full(station)
+    return {"status": "ok", "id": job_id, "duplicate": duplicate}
+
+
+@app.post("/send-to-print/batch")
+async def send_to_print_batch(batch: ScanBatch, request: Request, station: Station = DEFAULT_STATION):
+    """
+    Пачка сканов одним запросом (телефон копит сканы, пока нет связи): {"scans": [{"data", "key"}, ...]}.
+    Ответ — results в том же порядке: [{"id", "duplicate"}, ...]. Сканы пачки ставятся в очередь
+    одновременно, поэтому в SQLite они попадают в одну транзакцию.
+    Не принятый скан — {"id": null, "error": ...}: "queue_full" (повторить позже) или "too_long" (не повторять).
+    """
+    if len(batch.scans) > MAX_SCAN_BATCH:
+        raise HTTPException(status_code=413, detail=f"Не больше {MAX_SCAN_BATCH} сканов в запросе")
+    _admit_client(request, station, len(batch.scans))
+
+    async def enqueue(scan: ScanData) -> dict:
+        if len(scan.data) > SCAN_MAX_LEN:
+            JOBS_REJECTED.inc(station=station, reason="too_long")
+            return {"id": None, "duplicate": False, "error": "too_long"}
+        try:
+            job_id, duplicate = await _enqueue_once(station, scan.data, scan.key)
+        except QueueFull:
+            JOBS_REJECTED.inc(station=station, reason="queue_full")
+            return {"id": None, "duplicate": False, "error": "queue_full"}
+        return {"id": job_id, "duplicate": duplicate}
+
+    return {"status": "ok", "results": await asyncio.gather(*map(enqueue, batch.scans))}
 
 
 @app.get("/get-job")
-async def get_job():
-    async with queue_lock:
-        if print_queue:
-            return {"status": "ok", "data": print_queue.popleft()}
-        return {"status": "empty", "data": None}
+async def get_job(wait: float = 0, station: Station = DEFAULT_STATION):
+    """
+    Арендует одно задание станции; после печати клиент подтверждает его через /ack.
+    wait > 0 включает long-poll: при пустой очереди запрос висит до wait секунд
+    (не больше LONG_POLL_MAX_SEC) и отвечает сразу, как только придёт скан.
+    """
+    jobs = _leased(station, await job_queue.lease(station, 1, _wait_sec(wait)))
+    if jobs:
+        return {"status": "ok", "id": jobs[0]["id"], "data": jobs[0]["data"]}
+    return {"status": "empty", "id": None, "data": None}
+
+
+@app.get("/get-jobs")
+async def get_jobs(max_jobs: int = Query(10, alias="max"), wait: float = 0, station: Station = DEFAULT_STATION):
+    """
+    Арендует пачку из не более чем ?max=N заданий станции за один запрос:
+    jobs = [{"id": ..., "data": ...}]. wait — как у /get-job.
+    """
+    jobs = _leased(station, await job_queue.lease(station, min(max(max_jobs, 1), MAX_JOBS_BATCH), _wait_sec(wait)))
+    return {"status": "ok" if jobs else "empty", "jobs": jobs}
+
+
+@app.post("/ack")
+async def ack(body: AckData, station: Station = DEFAULT_STATION):
+    """Подтверждение печати: задания удаляются из очереди и больше не выдаются."""
+    return {"status": "ok", "acked": await _acked(station, body.ids)}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики для Prometheus: счётчики заданий, возраст задания при выдаче, глубина очередей станций."""
+    stations = {key[0] for metric in (JOBS_ENQUEUED, JOBS_LEASED) for key in metric.label_values()}
+    stations.add(DEFAULT_STATION)
+    for station in stations:
+        QUEUE_DEPTH.set(await job_queue.depth(station), station=station)
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/history")
+async def history(code: str | None = None, prefix: Annotated[str | None, Query(min_length=3)] = None,
+                  station: Annotated[str | None, Query(pattern=STATION_PATTERN)] = None,
+                  limit: int = Query(100, ge=1, le=1000)):
+    """
+    Когда и где печатался код: ?code=... — точное совпадение, ?prefix=... — все коды с этим началом.
+    items = [{"id", "code", "station", "job_id", "created_at", "printed_at"}], новые первыми.
+    """
+    if code is None and prefix is None:
+        raise HTTPException(status_code=400, detail="Нужен параметр code или prefix")
+    items = await scan_history.find(code=code, prefix=prefix if code is None else None, station=station, limit=limit)
+    return {"status": "ok", "items": items}
+
+
+@app.post("/reprint")
+async def reprint(body: ReprintData, request: Request,
+                  station: Annotated[str | None, Query(pattern=STATION_PATTERN)] = None):
+    """Повторная печать кода из истории: на ?station=X или на ту станцию, где он печатался."""
+    if body.id is not None:
+        scan = await scan_history.get(body.id)
+    elif body.code is not None:
+        found = await scan_history.find(code=body.code, limit=1)
+        scan = found[0] if found else None
+    else:
+        raise HTTPException(status_code=400, detail="Нужен id записи истории или code")
+    if scan is None:
+        raise HTTPException(status_code=404, detail="Код в истории не найден")
+    station = station or scan["station"]
+    _admit_client(request, station)
+    try:
+        job_id = await job_queue.put(station, scan["code"])
+    except QueueFull:
+        raise _queue_full(station)
+    JOBS_ENQUEUED.inc(station=station)
+    await scan_history.record(station, scan["code"], job_id)
+    return {"status": "ok", "id": job_id, "station": station}
+
+
+@app.websocket("/ws-jobs")
+async def ws_jobs(websocket: WebSocket, station: Station = DEFAULT_STATION):
+    """
+    Push-канал для клиентов печати станции: задания отправляются сразу после /send-to-print.
+    Клиент подтверждает печать сообщением {"ack": [id, ...]}. Если он отключился,
+    не подтвердив задания, они сразу возвращаются в очередь.
+    Параллельно читаем сокет, чтобы заметить отключение, пока ждём задание.
+    """
+    await websocket.accept()
+    leased = set()
+    receiver = asyncio.ensure_future(websocket.receive())
+    try:
+        while True:
+            waiter = asyncio.ensure_future(job_queue.wait_ready(station))
+            done, _ = await asyncio.wait({receiver, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                waiter.cancel()
+                msg = receiver.result()
+                if msg.get("type") == "websocket.disconnect":
+                    break
+                ids = _parse_ws_ack(msg.get("text"))
+                if ids:
+                    await _acked(station, ids)
+                    leased.difference_update(ids)
+                receiver = asyncio.ensure_future(websocket.receive())
+                continue
+            waiter.result()
+            # Отдаём сразу всё, что накопилось, одним сообщением
+            jobs = _leased(station, await job_queue.lease(station, MAX_JOBS_BATCH))
+            if jobs:
+                leased.update(job["id"] for job in jobs)
+                await websocket.send_json({"status": "ok", "jobs": jobs})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        if leased:
+            await job_queue.release(station, leased)
+
+
+def _parse_ws_ack(text):
+    """Список id из сообщения клиента {"ack": [...]}; прочие сообщения (ping и т.п.) игнорируем."""
+    if not text:
+        return []
+    try:
+        return [int(i) for i in json.loads(text).get("ack", [])]
+    except (ValueError, TypeError, AttributeError):
+        return []
 
 
 if __name__ == "__main__":
     import uvicorn
-    _dir = os.path.dirname(os.path.abspath(__file__))
+    if WORKERS > 1 and isinstance(job_queue, MemoryJobQueue):
+        raise SystemExit("QUEUE_URL=memory:// нельзя использовать с WORKERS > 1: у каждого воркера была бы своя очередь")
+    # С несколькими воркерами uvicorn импортирует приложение сам, поэтому передаём строку
+    target = "server:app" if WORKERS > 1 else app
     ssl_certfile = os.environ.get("SSL_CERTFILE") or os.path.join(_dir, "fffzar-tool.ru-chain.pem")
     ssl_keyfile = os.environ.get("SSL_KEYFILE") or os.path.join(_dir, "fffzar-tool.ru-key.pem")
     if os.path.exists(ssl_certfile) and os.path.exists(ssl_keyfile):
-        uvicorn.run(app, host="0.0.0.0", port=443, ssl_certfile=ssl_certfile, ssl_keyfile=ssl_keyfile)
+        uvicorn.run(target, host="0.0.0.0", port=443, workers=WORKERS,
+                    ssl_certfile=ssl_certfile, ssl_keyfile=ssl_keyfile)
     else:
-        uvicorn.run(app, host="0.0.0.0", port=8000)  # 80 свободен для win-acme
+        uvicorn.run(target, host="0.0.0.0", port=8000, workers=WORKERS)  # 80 свободен для win-acme
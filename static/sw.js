@@ -0,0 +1,64 @@
+// Service worker страницы сканера: после первого визита страница и библиотека
+// открываются из кэша, в том числе без интернета. Версию кэша и список файлов
+// подставляет сервер — при изменении любого файла кэш обновляется целиком.
+const CACHE = 'scanner-{{version}}';
+const ASSETS = {{assets}};
+const ASSET_URLS = new Set(ASSETS.filter(url => url !== '/').map(url => new URL(url, self.location).href));
+// Сколько ждать сеть при открытии страницы, прежде чем показать её из кэша (слабый Wi-Fi)
+const NETWORK_TIMEOUT_MS = 1500;
+
+self.addEventListener('install', event => {
+    event.waitUntil(caches.open(CACHE).then(cache => cache.addAll(ASSETS)).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys.filter(k => k !== CACHE).map(k => caches.delete(k))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+
+    if (request.mode === 'navigate') {
+        // Кэшируем только саму страницу сканера: /metrics, /history и т.п. — всегда из сети
+        if (new URL(request.url).pathname !== '/') return;
+        const network = fetch(request).then(response => {
+            // Ошибку сервера в кэш не кладём — иначе без сети откроется она вместо страницы
+            if (response.ok) {
+                const copy = response.clone();
+                caches.open(CACHE).then(cache => cache.put('/', copy));
+            }
+            return response;
+        });
+        event.waitUntil(network.catch(() => null));
+        // Свежая версия, если сеть ответила за NETWORK_TIMEOUT_MS, иначе сразу из кэша
+        // (кэш обновится в фоне); ?station=X не важен
+        event.respondWith(
+            caches.match('/').then(cached => {
+                if (!cached) return network;
+                const fresh = network.then(response => response.ok ? response : cached, () => cached);
+                const timeout = new Promise(resolve => setTimeout(() => resolve(cached), NETWORK_TIMEOUT_MS));
+                return Promise.race([fresh, timeout]);
+            })
+        );
+        return;
+    }
+
+    // Библиотека (и прочие файлы из ASSETS): у адресов есть версия (?v=... или @версия), поэтому
+    // сразу из кэша. Остальные запросы (API, метрики) — мимо кэша
+    if (!ASSET_URLS.has(request.url)) return;
+    event.respondWith(
+        caches.match(request).then(cached => cached || fetch(request).then(response => {
+            // Ошибки и непрозрачные ответы (CDN без CORS — статус не проверить) не кэшируем
+            if (response.ok && response.type !== 'opaque') {
+                const copy = response.clone();
+                caches.open(CACHE).then(cache => cache.put(request, copy));
+            }
+            return response;
+        }))
+    );
+});
@@ -0,0 +1,134 @@
+"""
+Статика страницы сканера (папка static/): файлы читаются и сжимаются (gzip, brotli — если
+установлен пакет brotli) один раз при старте, отдаются из памяти с ETag.
+
+    index.html, sw.js             — Cache-Control: no-cache (браузер перепроверяет по ETag, 304)
+    html5-qrcode.min.js и прочие  — адрес с версией (?v=ETag), Cache-Control: immutable на год
+
+Библиотека html5-qrcode должна лежать в static/ и храниться в репозитории вместе со страницей
+(скачать зафиксированную версию — один раз, нужен интернет):
+
+    python static_assets.py --fetch && git add static/html5-qrcode.min.js
+
+Без неё сервер не запускается. Брать библиотеку с CDN (unpkg) можно только явно —
+HTML5_QRCODE_CDN=1; тогда страница при первом открытии без интернета не работает.
+"""
+import gzip
+import hashlib
+import json
+import os
+import sys
+import urllib.request
+
+from fastapi import Request, Response
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+HTML5_QRCODE_VERSION = "2.3.8"
+HTML5_QRCODE_FILE = "html5-qrcode.min.js"
+HTML5_QRCODE_CDN = f"https://unpkg.com/html5-qrcode@{HTML5_QRCODE_VERSION}/{HTML5_QRCODE_FILE}"
+# 1 — разрешить брать html5-qrcode с CDN, если её нет в static/ (страница без интернета не откроется)
+ALLOW_CDN = os.environ.get("HTML5_QRCODE_CDN", "0").lower() in ("1", "true", "yes")
+
+MEDIA_TYPES = {
+    ".html": "text/html; charset=utf-8",
+    ".js": "application/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+}
+# Страницу и service worker браузер должен перепроверять, иначе обновление не дойдёт
+NO_CACHE = "no-cache"
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него отдаём gzip
+    brotli = None
+
+
+class Asset:
+    def __init__(self, body: bytes, media_type: str, cache_control: str):
+        self.body = body
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.etag = hashlib.sha1(body).hexdigest()[:16]
+        self.variants = {"gzip": gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=11)
+        # Сжатый вариант хуже исходного (уже сжатые файлы) не отдаём
+        self.variants = {enc: data for enc, data in self.variants.items() if len(data) < len(body)}
+
+
+class StaticAssets:
+    def __init__(self, folder: str = STATIC_DIR, allow_cdn: bool = ALLOW_CDN):
+        self.folder = folder
+        self.allow_cdn = allow_cdn
+        self.assets = {}
+        self.load()
+
+    def load(self):
+        assets = {}
+        for name in sorted(os.listdir(self.folder)):
+            ext = os.path.splitext(name)[1]
+            if name in ("index.html", "sw.js") or ext not in MEDIA_TYPES:
+                continue
+            with open(os.path.join(self.folder, name), "rb") as f:
+                assets[name] = Asset(f.read(), MEDIA_TYPES[ext], IMMUTABLE)
+
+        lib = assets.get(HTML5_QRCODE_FILE)
+        if lib is not None:
+            lib_url = f"/static/{HTML5_QRCODE_FILE}?v={lib.etag}"
+        elif self.allow_cdn:
+            lib_url = HTML5_QRCODE_CDN
+            print(f"ВНИМАНИЕ: нет static/{HTML5_QRCODE_FILE}, библиотека берётся с unpkg (HTML5_QRCODE_CDN=1) — "
+                  f"без интернета страница при первом открытии не откроется")
+        else:
+            raise RuntimeError(f"Нет static/{HTML5_QRCODE_FILE}: скачайте её (python static_assets.py --fetch) "
+                               f"или разрешите CDN явно: HTML5_QRCODE_CDN=1")
+
+        with open(os.path.join(self.folder, "index.html"), encoding="utf-8") as f:
+            page = f.read().replace("{{html5-qrcode.min.js}}", lib_url)
+        assets["index.html"] = Asset(page.encode("utf-8"), MEDIA_TYPES[".html"], NO_CACHE)
+
+        version = hashlib.sha1("".join(a.etag for a in assets.values()).encode()).hexdigest()[:12]
+        with open(os.path.join(self.folder, "sw.js"), encoding="utf-8") as f:
+            sw = f.read().replace("{{version}}", version).replace("{{assets}}", json.dumps(["/", lib_url]))
+        assets["sw.js"] = Asset(sw.encode("utf-8"), MEDIA_TYPES[".js"], NO_CACHE)
+        self.assets = assets
+
+    def response(self, name: str, request: Request) -> Response:
+        asset = self.assets.get(name)
+        if asset is None:
+            return Response(status_code=404)
+        accepted = {part.split(";")[0].strip() for part in request.headers.get("accept-encoding", "").split(",")}
+        encoding = next((enc for enc in ("br", "gzip") if enc in accepted and enc in asset.variants), None)
+        # У каждого варианта сжатия свой ETag (сильные ETag не должны совпадать у разных байтов)
+        etag = f'"{asset.etag}-{encoding}"' if encoding else f'"{asset.etag}"'
+        headers = {"ETag": etag, "Cache-Control": asset.cache_control, "Vary": "Accept-Encoding"}
+
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in (t.strip() for t in if_none_match.split(",")) or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+            return Response(asset.variants[encoding], media_type=asset.media_type, headers=headers)
+        return Response(asset.body, media_type=asset.media_type, headers=headers)
+
+
+def fetch_html5_qrcode(folder: str = STATIC_DIR):
+    """Скачать зафиксированную версию html5-qrcode в static/"""
+    path = os.path.join(folder, HTML5_QRCODE_FILE)
+    with urllib.request.urlopen(HTML5_QRCODE_CDN, timeout=30) as r:
+        body = r.read()
+    # CDN может вернуть страницу ошибки с кодом 200 — такой файл страницу бы сломал
+    if b"Html5Qrcode" not in body:
+        raise SystemExit(f"{HTML5_QRCODE_CDN}: это не html5-qrcode ({len(body)} байт)")
+    with open(path, "wb") as f:
+        f.write(body)
+    print(f"html5-qrcode {HTML5_QRCODE_VERSION}: {len(body)} байт -> {path}")
+
+
+if __name__ == "__main__":
+    if "--fetch" in sys.argv[1:]:
+        fetch_html5_qrcode()
+    else:
+        print(__doc__)